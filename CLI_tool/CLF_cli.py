@@ -296,7 +296,8 @@ class CLF_app(cmd2.Cmd):
     @cmd2.with_category("RunControl commands")
     def do_check_rain(self, args: argparse.Namespace) -> None:
         print("check rain... ")
-        if dc.fpga.read_dio('rain') and (not dc.fpga.read_dio('norain')):
+        snap = dc.fpga.snapshot(['rain', 'norain'])
+        if snap['rain'] and (not snap['norain']):
             print("It's raining")   
         else:
             print("It's not raining")
@@ -370,7 +371,8 @@ class CLF_app(cmd2.Cmd):
     @cmd2.with_category("RunControl commands")
     def do_check_cover_raman(self, args: argparse.Namespace) -> None:
         print("check Raman cover... ")
-        if dc.fpga.read_dio('cover_raman_closed') and (not dc.fpga.read_dio('cover_raman_open')):
+        snap = dc.fpga.snapshot(['cover_raman_closed', 'cover_raman_open'])
+        if snap['cover_raman_closed'] and (not snap['cover_raman_open']):
             print("Raman cover is closed")   
         else:
             print("Raman cover is open")
@@ -378,7 +380,8 @@ class CLF_app(cmd2.Cmd):
     @cmd2.with_category("RunControl commands")
     def do_check_cover_steer(self, args: argparse.Namespace) -> None:
         print("check Steer cover... ")
-        if dc.fpga.read_dio('cover_steer_closed') and (not dc.fpga.read_dio('cover_steer_open')):
+        snap = dc.fpga.snapshot(['cover_steer_closed', 'cover_steer_open'])
+        if snap['cover_steer_closed'] and (not snap['cover_steer_open']):
             print("Steer cover is closed")   
         else:
             print("Steer cover is open")
@@ -397,7 +400,8 @@ class CLF_app(cmd2.Cmd):
     @cmd2.with_category("RunControl commands")
     def do_check_UnixTime(self, args: argparse.Namespace) -> None:
         print("check UnixTime... ")
-        print(f"UnixTime : {int(time.time())}, FPGA time: {dc.fpga.read_register('unixtime')}")
+        snap = dc.fpga.snapshot(['unixtime'])
+        print(f"UnixTime : {int(snap.host_time)}, FPGA time: {snap.fpga_time}")
     
     rc_parser = argparse.ArgumentParser()
     rc_parser.add_argument('value', type=int, help='Delay of shot from the PPS (ms)')
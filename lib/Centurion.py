@@ -1,9 +1,16 @@
+import os
+import sys
+import math
 import serial
 import time
+import multiprocessing
 import logging
 import datetime
 from functools import partial
 from logging.handlers import TimedRotatingFileHandler
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGATracer import LatencyHistogram
+from lib.DeviceState import DeviceState
 
 CENTURION_COMMAND =30  
 CENTURION_LINE =100    #Blank line (Centurion_set.txt) */
@@ -13,17 +20,38 @@ CENTURION_BAUD = 57600
 
 QFREQ = 1             #Rate at which Q-switch is fired relative to doide rate (Default) */
 BUFSIZE = 255         #input, output buffer size */
+CENTURION_POLL = 0.05   #serial read timeout, replies are awaited up to a deadline */
+TELEMETRY_MAX_AGE = 2.0 #telemetry samples older than this (s) are not used */
+
+# operating parameters set by set_mode
+PARAMETERS = ['$DFREQ', '$DIODE', '$QSON', '$QSWIT', '$DTRIG', '$QSTRI', '$DPW', '$QSDEL']
 
 class Centurion:
 
-    def __init__(self, port, baudrate=57600, parity=serial.PARITY_EVEN, timeout=2, string_return=255):
+    def __init__(self, port, baudrate=57600, parity=serial.PARITY_EVEN, timeout=2, string_return=255, outlet='laser'):
         self.port = port
         self.serial = None
         self.params = locals()
         self.params.pop('port')
         self.params.pop('self')
         self.params.pop('string_return')
+        self.params.pop('outlet')
         self.string_return = string_return
+        # RPC outlet of the laser: the parameter cache is valid within one
+        # power cycle (epoch) of it
+        self.outlet = outlet
+        self.store = DeviceState()
+        # one transaction at a time on the port, also between processes:
+        # created here, it is shared with the run children and with the
+        # telemetry poller (LaserTelemetry, set by DeviceCollection)
+        self.lock = multiprocessing.RLock()
+        self.telemetry = None
+        # time.time() at the end of the last warmup, shared with the run
+        # children: telemetry sampled before it does not authorize firing
+        self.warmed_up = multiprocessing.Value('d', 0.0)
+        # reply deadline; the port itself is polled (see read_response)
+        self.timeout = timeout
+        self.params['timeout'] = CENTURION_POLL
 
         #const
         self.pulse_wdth = -99
@@ -37,6 +65,10 @@ class Centurion:
         self.dump_temp = -99
         self.plate_temp = -99 
 
+        # per command keyword: reply latency and replies not received in time
+        self.latency = {}
+        self.timeouts = {}
+
         try:
             self.serial = serial.Serial(**self.params)
         except serial.SerialException as e:
@@ -67,34 +99,86 @@ class Centurion:
             return func(self, *args, **kwargs)
         return wrapper        
 
+    def locked(func):
+        def wrapper(self, *args, **kwargs):
+            with self.lock:
+                return func(self, *args, **kwargs)
+        return wrapper
+
     @check_open
-    def read_response(self):
+    def read_response(self, keyword=None, deadline=None):
+        # next reply line (up to the \r terminator) by the deadline
+        # (monotonic, default the serial timeout from now). Echoes of other
+        # commands left in the buffer ($-lines with another keyword) are
+        # skipped; '' if nothing matching arrives in time
+        if deadline is None:
+            deadline = time.monotonic() + self.timeout
+        line = bytearray()
         try:
-            response = ''.join(filter(str.isprintable, str(self.serial.read(255).decode())))
-            self.log(logging.INFO, response)
-            return response
+            while True:
+                line += self.serial.read_until(b"\r", BUFSIZE - len(line))
+                if not line.endswith(b"\r") and len(line) < BUFSIZE:
+                    if time.monotonic() >= deadline:
+                        return ''
+                    continue
+                response = ''.join(filter(str.isprintable, line.decode(errors='ignore'))).strip()
+                line.clear()
+                if response and (keyword is None or self.is_reply(keyword, response)):
+                    return response
+                if response:
+                    self.log(logging.INFO, f"CENT:READ_R:skipped stale reply {response}")
         except serial.SerialException: 
             self.log(logging.INFO, f"CENT:READ_R:ERROR:Unable to read response")
             return -1
 
+    @staticmethod
+    def is_reply(keyword, response):
+        # replies echo the command keyword, possibly shortened or completed
+        # ($STAND -> $STANDBY)
+        if not response.startswith('$'):
+            return True
+        echo = response.split()[0]
+        return echo.startswith(keyword) or keyword.startswith(echo)
+
     @check_open
-    def send_command(self, command):
+    @locked
+    def send_command(self, command, timeout=None, quiet=False):
+        # quiet: replies and timeouts logged at DEBUG (telemetry polling)
+        level = logging.DEBUG if quiet else logging.INFO
+        keyword = command.split()[0]
         try:
             self.serial.flush()
+            t0 = time.monotonic()
             self.serial.write(f"{command}\r".encode())
-            time.sleep(0.5)
-            response = self.read_response()
+            response = self.read_response(keyword, t0 + (self.timeout if timeout is None else timeout))
+            elapsed = time.monotonic() - t0
+            if response:
+                self.latency.setdefault(keyword, LatencyHistogram()).record(elapsed)
+                self.log(level, f"{response} ({elapsed * 1000:.0f} ms)")
+            elif response == '':
+                self.timeouts[keyword] = self.timeouts.get(keyword, 0) + 1
+                self.log(level, f"CENT:SEND_COMM:no reply to {command} in {elapsed:.1f} s")
             return response
         except serial.SerialException as e:
             self.log(logging.INFO, f"CENT:SEND_COMM:Unable to send {command} command: {e}")
             return -1
+
+    def latency_stats(self):
+        # {keyword: {'count', 'timeouts', quantile: seconds...}}
+        stats = {}
+        for keyword in set(self.latency) | set(self.timeouts):
+            h = self.latency.get(keyword, None)
+            stats[keyword] = {'count': h.count if h else 0, 'timeouts': self.timeouts.get(keyword, 0)}
+            if h:
+                stats[keyword].update(h.percentiles((0.5, 1.0)))
+        return stats
         
     @check_open
+    @locked
     def flush_buffers(self):
         try:
             self.serial.reset_input_buffer()
             self.serial.reset_output_buffer()
-            time.sleep(0.1)
             return 0
         except Exception as e:
             self.log(logging.INFO, f"CENT:FLUSH_BUFFERS:Unable to flush buffers")
@@ -102,8 +186,7 @@ class Centurion:
 
     def comm_test(self):
         self.flush_buffers()
-        time.sleep(0.1)
-        command = "$HVERS ?\r"
+        command = "$HVERS ?"
         response = self.send_command(command)
         #response = self.read_response()
         self.log(logging.INFO, f"CENT:COMM_TEST:received:{response}")
@@ -114,12 +197,60 @@ class Centurion:
             self.log(logging.INFO, "CENT:COMM_TEST:Failed")
             return -2
 
+    def load_parameters(self):
+        # cached image of the laser parameters, {} after a power cycle
+        cached = self.store.get(f"laser/{self.port}", {})
+        if cached.get('epoch', None) != self.store.epoch(self.outlet):
+            return {}
+        return dict(cached.get('values', {}))
+
+    def store_parameters(self, values):
+        self.store.set(f"laser/{self.port}", {'epoch': self.store.epoch(self.outlet), 'values': values})
+
+    def invalidate_parameters(self):
+        self.store.delete(f"laser/{self.port}")
+
+    @check_open
+    @locked
+    def read_parameters(self, names=PARAMETERS):
+        # bulk readback: all the queries in one write, replies matched by
+        # keyword; the ones missing by the deadline are asked one by one
+        values = {}
+        t0 = time.monotonic()
+        try:
+            self.serial.flush()
+            self.serial.write("".join(f"{name} ?\r" for name in names).encode())
+        except serial.SerialException as e:
+            self.log(logging.INFO, f"CENT:READ_PARAMETERS:Unable to send queries: {e}")
+            return values
+        deadline = t0 + self.timeout
+        while len(values) < len(names):
+            response = self.read_response(None, deadline)
+            if not response or response == -1:
+                break
+            parts = response.split()
+            if len(parts) == 2 and parts[0] in names:
+                values[parts[0]] = parts[1]
+        self.latency.setdefault('readback', LatencyHistogram()).record(time.monotonic() - t0)
+        for name in names:
+            if name not in values:
+                value = self.check_parameter(name)
+                if value is not None and value != -1:
+                    values[name] = value
+        self.log(logging.INFO, f"CENT:READ_PARAMETERS:{values}")
+        return values
+
     def set_parameter(self, parameter, value):
         parameter_set = self.send_command(f"{parameter} {value}")
         if parameter_set:
             preturn = parameter_set.split()
             if len(preturn) == 2 and preturn[0] == f"{parameter}" and preturn[1] == f'{value}':
                 self.log(logging.INFO, f"CENT:PARAMETER_SET:Parameter {preturn[0]}, value set: {preturn[1]}")
+                if parameter in PARAMETERS:
+                    values = self.load_parameters()
+                    if values:
+                        values[parameter] = preturn[1]
+                        self.store_parameters(values)
                 return 0
             else:
                 self.log(logging.INFO, f"CENT:PARAMETER_SET:ERROR:Unable to set parameter {preturn[0]}")
@@ -137,32 +268,43 @@ class Centurion:
                 return -1
 
     def set_mode(self, freq = 100, diode = 1, qson= 0, qswitch = 1, dtrig = 1, qstrig = 1, dpw = 100, qsdelay = 145):
+        wanted = {
+            '$DFREQ': freq,         #frequency (100 == 2Hz)
+            '$DIODE': diode,        #diodes (off = 0, enabled = 1)
+            '$QSON': qson,          #Q-switch (off = 0, enabled = 1)
+            '$QSWIT': qswitch,      #laser Q-switched (long pulse = 0, Q-switched = 1)
+            '$DTRIG': dtrig,        #diode trigger (internal = 0, external = 1)
+            '$QSTRI': qstrig,       #Q-switch trigger (internal = 0, external = 1)
+            '$DPW': dpw,            #diodes pulse (energy of the laser)
+            '$QSDEL': qsdelay,      #delay for Q-switch (relevant only for internal trigger)
+        }
         
         try:
             self.log(logging.INFO, "CENT:SET_MODE:Setting up Centurion Laser...")
             self.log(logging.INFO, "CENT:SET_MODE:Going Standby...")
             self.send_command("$STANDBY")
             
+            t0 = time.monotonic()
             for _ in range(3):
-                #setting frequency (100 == 2Hz)
-                self.set_parameter("$DFREQ", freq)
-                #setting diodes (off = 0, enabled = 1) 
-                self.set_parameter("$DIODE", diode)
-                #setting Q-switch (off = 0, enabled = 1)
-                self.set_parameter("$QSON", qson)
-                #setting laser to be Q-switched (long pulse = 0, Q-switched = 1)
-                self.set_parameter("$QSWIT", qswitch)
-                #setting diode trigger in external mode (internal = 0, external = 1)
-                self.set_parameter("$DTRIG", dtrig)
-                #setting Q-swicth trigger to external mode (internal = 0, external = 1)
-                self.set_parameter("$QSTRI", qstrig)
-                #setting diodes pulse (energy of the laser)
-                self.set_parameter("$DPW", dpw)
-                #setting delay for Q-switch (relevant only for internal trigger)
-                self.set_parameter("$QSDEL", qsdelay)
+                # only the parameters the laser does not hold already,
+                # confirmed by a single status query
+                values = self.load_parameters()
+                missing = [name for name in wanted if name not in values]
+                if missing:
+                    values.update(self.read_parameters(missing))
+                written = []
+                for name, value in wanted.items():
+                    if values.get(name, None) == str(value):
+                        continue
+                    written.append(name)
+                    values.pop(name, None)
+                    if self.set_parameter(name, value) == 0:
+                        values[name] = str(value)
                 if self.status() == 0x7E:
-                    self.log(logging.INFO, "set up complete")
+                    self.store_parameters(values)
+                    self.log(logging.INFO, f"set up complete in {time.monotonic() - t0:.2f} s (written {written})")
                     return 0
+                self.invalidate_parameters()
         except Exception as e:
             self.log(logging.INFO, f"CENT:SET_MODE:ERROR:Some problem occurred:{e}")
             return -1 
@@ -171,14 +313,11 @@ class Centurion:
         self.flush_buffers()
         try:
             self.log(logging.INFO, "CENT:CHECK_MODE:Checking values:")
-            self.check_parameter("$DFREQ")
-            self.check_parameter("$DIODE")
-            self.check_parameter("$QSON")
-            self.check_parameter("$QSWIT")
-            self.check_parameter("$DTRIG")
-            self.check_parameter("$QSTRI")
-            self.check_parameter("$DPW")
-            self.check_parameter("$QSDEL")
+            values = self.read_parameters()
+            cached = self.load_parameters()
+            if cached and cached != values:
+                self.log(logging.INFO, f"CENT:CHECK_MODE:cached values {cached} differ, cache updated")
+            self.store_parameters(values)
             return 0
         except Exception as e:
             self.log(logging.INFO, "CENT:CHECK_MODE:ERROR:Some problem occurred")
@@ -266,6 +405,7 @@ class Centurion:
             q_switch = self.send_command("$QSON 1")
             if q_switch:
                 self.log(logging.INFO, f"CENT:WARMUP:Q-Swithc:{q_switch}")
+            self.warmed_up.value = time.time()
 
             self.read_bytes()
             return 0 
@@ -309,7 +449,20 @@ class Centurion:
                 self.log(logging.INFO, f"CENT:CHECK_TEMPS:ERROR:Bytes received: {temps}")  
                 return -2        
 
-    def temperature(self):
+    def recent(self, max_age=TELEMETRY_MAX_AGE, since=None):
+        # latest telemetry sample if not older than max_age and taken after
+        # since (time.time()), else None
+        if self.telemetry is None:
+            return None
+        sample = self.telemetry.latest(max_age)
+        if sample is not None and since is not None and sample['time'] <= since:
+            return None
+        return sample
+
+    def temperature(self, max_age=TELEMETRY_MAX_AGE):
+        sample = self.recent(max_age)
+        if sample is not None and not math.isnan(sample['head_temp']):
+            return int(sample['head_temp']), int(sample['dump_temp']), int(sample['plate_temp'])
         self.flush_buffers()
         temps = self.send_command("$TEMPS ?")
         if temps:
@@ -317,7 +470,10 @@ class Centurion:
             if len(parts) == 4 and parts[0] == '$TEMPS':
                 return int(parts[1]), int(parts[2]), int(parts[3])
 
-    def fire_auth(self):
+    def fire_auth(self, max_age=TELEMETRY_MAX_AGE):
+        sample = self.recent(max_age, since=self.warmed_up.value)
+        if sample is not None and not math.isnan(sample['state']):
+            return int(sample['state']) == 0x7E
         return self.status() == 0x7E
         
     def check_qs_delay(self):
@@ -347,15 +503,21 @@ class Centurion:
         self.flush_buffers()
         self.set_parameter("$DPW", pwd)
 
-    def fire(self):
-        self.flush_buffers()
-        status = self.read_status()
+    def fire(self, max_age=TELEMETRY_MAX_AGE):
+        sample = self.recent(max_age, since=self.warmed_up.value)
+        if sample is not None and not math.isnan(sample['state']) and not math.isnan(sample['head_temp']):
+            self.state = int(sample['state'])
+            self.head_temp, self.dump_temp, self.plate_temp = \
+                int(sample['head_temp']), int(sample['dump_temp']), int(sample['plate_temp'])
+        else:
+            self.flush_buffers()
+            status = self.read_status()
 
-        #while self.state != "7e":
-        #    self.send_command("$STAND")
-        #    status = self.read_status()
+            #while self.state != "7e":
+            #    self.send_command("$STAND")
+            #    status = self.read_status()
 
-        self.check_temps()
+            self.check_temps()
         if self.head_temp <= 500 and self.dump_temp <= 450 and self.plate_temp <= 450:
             self.send_command("$FIRE")
            
@@ -0,0 +1,100 @@
+import os
+import sys
+import pty
+import tty
+import time
+import threading
+
+class CenturionSimulator:
+
+    # software model of the Centurion serial protocol on a pty: "$KEY ?"
+    # queries and "$KEY value" settings are answered with the echo
+    # "$KEY value\r\n" after delay seconds; $STATUS, $TEMPS, $SHOT... give
+    # fixed values that the test side can change. Every command received is
+    # kept in commands
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.params = {
+            '$DFREQ': '100', '$DIODE': '0', '$QSON': '0', '$QSWIT': '1',
+            '$DTRIG': '0', '$QSTRI': '0', '$DPW': '100', '$QSDEL': '145',
+        }
+        self.state = 0x7E
+        self.temps = (300, 300, 300)
+        self.shots = 0
+        self.commands = []
+        self.running = False
+        self.fds = []
+        self.port = None
+
+    def start(self):
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.fds = [master, slave]
+        self.port = os.ttyname(slave)
+        self.running = True
+        threading.Thread(target=self.loop, args=(master,), daemon=True).start()
+        return self.port
+
+    def stop(self):
+        self.running = False
+        for fd in self.fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = []
+
+    def reply(self, line):
+        parts = line.split()
+        key = parts[0]
+        query = len(parts) > 1 and parts[1] == '?'
+        if key == '$STATUS':
+            return f"$STATUS {self.state:02X} 00 00 00 00"
+        if key == '$TEMPS':
+            return "$TEMPS " + " ".join(str(t) for t in self.temps)
+        if key in ('$SHOT', '$USHOT'):
+            return f"{key} {self.shots}"
+        if key == '$HVERS':
+            return "$HVERS 1.0"
+        if key in ('$STAND', '$STANDBY'):
+            return "$STANDBY"
+        if key in ('$FIRE', '$STOP'):
+            return key
+        if key in self.params:
+            if not query and len(parts) > 1:
+                self.params[key] = parts[1]
+            return f"{key} {self.params[key]}"
+        return "?"
+
+    def loop(self, fd):
+        buf = b""
+        while self.running:
+            try:
+                data = os.read(fd, 1024)
+            except OSError:
+                return
+            if not data:
+                return
+            buf += data
+            while b"\r" in buf:
+                line, buf = buf.split(b"\r", 1)
+                line = line.decode('ascii', 'ignore').strip()
+                if not line:
+                    continue
+                self.commands.append(line)
+                time.sleep(self.delay)
+                try:
+                    os.write(fd, (self.reply(line) + "\r\n").encode())
+                except OSError:
+                    return
+
+
+if __name__ == "__main__":
+    sim = CenturionSimulator(float(sys.argv[1]) if len(sys.argv) > 1 else 0.02)
+    print(f"centurion: {sim.start()}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
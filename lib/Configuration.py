@@ -7,6 +7,7 @@ class Configuration:
         self.motors = {}
         self.outlets = {}
         self.radiometers = {}
+        self.fpga = {}
         self.parameters = {}
 
     def read(self):
@@ -42,6 +43,12 @@ class Configuration:
                 for k,v in doc.items():
                     self.radiometers[k] = v
 
+        with open(f'conf/{identity}/fpga.yml', 'r') as f:
+            docs = yaml.safe_load_all(f)
+            for doc in docs:
+                for k,v in doc.items():
+                    self.fpga[k] = v
+
     def get_port_params(self, port):
         return self.ports.get(port, None)
     
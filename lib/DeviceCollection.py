@@ -3,23 +3,33 @@ import sys
 import serial
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from lib.RPC import RPCDevice
-from lib.VXM import VXM
+from lib.VXM import VXM, VXM_ACCEL, VXM_DEADLINE
 from lib.Radiometer import Radiometer3700, RadiometerOphir
 from lib.Centurion import Centurion
 from lib.FPGADevice import FPGADevice
+from lib.FPGAMap import FPGAMap
 from lib.FPGAData import FPGAData
+from lib.LaserTelemetry import LaserTelemetry
 
 class DeviceCollection:
-    def __init__(self):
+    def __init__(self, fpga_broker=None):
         self.serials = {}
         self.outlets = {}
         self.motors = {}
         self.radiometers = {}
-        self.fpga = FPGADevice("/dev/runcontrol")
+        self.fpga = FPGADevice("/dev/runcontrol", broker=fpga_broker)
         self.laser = Centurion("/dev/ttyr01")
         self.data = FPGAData("/dev/data0")
 
     def init(self, cfg):
+        # fpga
+        self.fpga.load_map(FPGAMap(cfg.fpga))
+
+        # laser telemetry (started by the application)
+        identity = str.lower(cfg.parameters.get('identity', ''))
+        period = cfg.parameters.get(identity, {}).get('laser_telemetry_s', 1.0)
+        self.laser.telemetry = LaserTelemetry(self.laser, period)
+
         # outlets
         for oname, oparams in cfg.outlets.items():
             port_params = cfg.get_port_params(oparams['port'])
@@ -30,12 +40,14 @@ class DeviceCollection:
             port_params = cfg.get_port_params(mparams['port'])
             ecal_position = mparams.get('ecal_position', 0)
             pcal_position = mparams.get('pcal_position', 0)
-            self.add_motor(mparams['id'], mname, ecal_position, pcal_position, **port_params)
+            self.add_motor(mparams['id'], mname, ecal_position, pcal_position, outlet=mparams.get('outlet', 'VXM'),
+                speed=mparams.get('speed', None), accel=mparams.get('accel', VXM_ACCEL),
+                deadline_factor=mparams.get('deadline_factor', VXM_DEADLINE), **port_params)
 
         # radiometers 
         for rname, rparams in cfg.radiometers.items():
             port_params = cfg.get_port_params(rparams['port'])
-            self.add_radiometer(rname, rparams['model'], **port_params)
+            self.add_radiometer(rname, rparams['model'], outlet=rparams.get('outlet', 'radiometer'), **port_params)
 
     def add_outlet(self, id, name, port, baudrate=115200, bytesize=8, parity='N', stopbits=1, timeout=1):
         if(self.serials.get(port, None) == None):
@@ -51,7 +63,7 @@ class DeviceCollection:
     def get_outlet(self, name):
         return self.outlets[name]
 
-    def add_motor(self, id, name, ecal_position, pcal_position, port, baudrate=115200, bytesize=8, parity='N', stopbits=1, timeout=1):
+    def add_motor(self, id, name, ecal_position, pcal_position, port, baudrate=115200, bytesize=8, parity='N', stopbits=1, timeout=1, outlet='VXM', speed=None, accel=VXM_ACCEL, deadline_factor=VXM_DEADLINE):
         if(self.serials.get(port, None) == None):
             params = locals()
             params.pop('self')
@@ -59,15 +71,19 @@ class DeviceCollection:
             params.pop('name')
             params.pop('ecal_position')
             params.pop('pcal_position')
+            params.pop('outlet')
+            params.pop('speed')
+            params.pop('accel')
+            params.pop('deadline_factor')
             self.serials[port] = VXM(**params)
 
         vxm = self.serials[port]
-        self.motors[name] = vxm.add_motor(id, name, ecal_position, pcal_position)
+        self.motors[name] = vxm.add_motor(id, name, ecal_position, pcal_position, outlet, speed, accel, deadline_factor)
 
     def get_motor(self, name):
         return self.motors[name]
 
-    def add_radiometer(self, name, model, port, baudrate=115200, bytesize=8, parity='N', stopbits=1, timeout=1):
+    def add_radiometer(self, name, model, port, baudrate=115200, bytesize=8, parity='N', stopbits=1, timeout=1, outlet='radiometer'):
         if(self.serials.get(port, None) == None):
             params = locals()
             params.pop('self')
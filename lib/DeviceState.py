@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import fcntl
+from contextlib import contextmanager
+
+STATE_FILE = "logs/device_state.json"
+
+class DeviceState:
+
+    # small persistent store of what the devices were last configured with,
+    # shared by the main process, the run children and the CLI tools: a JSON
+    # file rewritten atomically under an flock. Power cycles are tracked as an
+    # epoch per RPC outlet, bumped when the outlet is seen off, so that cached
+    # settings of the devices behind it can be recognized as stale
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+
+    @contextmanager
+    def _locked(self):
+        with open(self.path + ".lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store(self, doc):
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(doc, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def get(self, key, default=None):
+        with self._locked():
+            return self._load().get(key, default)
+
+    def set(self, key, value):
+        with self._locked():
+            doc = self._load()
+            doc[key] = value
+            self._store(doc)
+
+    def update(self, key, func, default=None):
+        # read-modify-write of one key: value = func(old value)
+        with self._locked():
+            doc = self._load()
+            doc[key] = func(doc.get(key, default))
+            self._store(doc)
+            return doc[key]
+
+    def delete(self, key):
+        with self._locked():
+            doc = self._load()
+            if doc.pop(key, None) is not None:
+                self._store(doc)
+
+    def epoch(self, outlet):
+        # power-cycle count of an outlet (0 if never seen off)
+        return self.get(f"outlet/{outlet}", {}).get('epoch', 0)
+
+    def powered(self, outlet):
+        # last recorded state of an outlet (True if never seen)
+        return self.get(f"outlet/{outlet}", {}).get('on', True)
+
+    def outlet_state(self, outlet, on):
+        # record the state of an outlet; an on -> off transition (or an off
+        # outlet never seen before) starts a new epoch
+        def change(s):
+            s = dict(s)
+            if not on and s.get('on', True):
+                s['epoch'] = s.get('epoch', 0) + 1
+            s['on'] = bool(on)
+            return s
+        key = f"outlet/{outlet}"
+        s = self.get(key, {})
+        if s.get('on', None) == bool(on):
+            # nothing changed: no file write
+            return s.get('epoch', 0)
+        return self.update(key, change, {}).get('epoch', 0)
+
+
+if __name__ == "__main__":
+    state = DeviceState(sys.argv[1] if len(sys.argv) > 1 else STATE_FILE)
+    print(json.dumps(state._load(), indent=2, sort_keys=True))
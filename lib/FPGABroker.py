@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import queue
+import logging
+import datetime
+import threading
+import multiprocessing
+from functools import partial
+from logging.handlers import TimedRotatingFileHandler
+from multiprocessing.connection import Listener
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGADevice import FPGADevice
+from lib.FPGAMap import FPGA_MAPFILE
+
+BROKER_ADDRESS = "/tmp/clf_runcontrol.sock"
+
+logger = logging.getLogger("device")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    formatter = logging.Formatter('%(asctime)s - %(classname)s::%(funcName)s - %(levelname)s - %(message)s')
+    handler = TimedRotatingFileHandler('logs/device.log', when='midnight',
+        atTime=datetime.time(hour=18, minute=0))
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+class FPGABroker:
+
+    # single owner of the runcontrol port: register/DIO requests from other
+    # processes (FPGADevice in client mode) arrive on a Unix socket and all
+    # requests pending at the same time are sent to the FPGA in one transfer
+
+    def __init__(self, port, address=BROKER_ADDRESS, baudrate=115200, verify=False, mapfile=FPGA_MAPFILE,
+            write_mode='ack', ack_timeout=0.5):
+        self.port = port
+        self.address = address
+        self.baudrate = baudrate
+        self.verify = verify
+        self.write_mode = write_mode
+        self.ack_timeout = ack_timeout
+        self.mapfile = mapfile
+        self.process = None
+        self.fpga = None
+        self.requests = None
+
+        self.log = partial(logger.log, extra={'classname': self.__class__.__name__})
+
+    def start(self, timeout=5):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.process = multiprocessing.Process(target=self.serve, daemon=True)
+        self.process.start()
+        t = 0
+        while not os.path.exists(self.address):
+            if t >= timeout or not self.process.is_alive():
+                raise RuntimeError(f"FPGA broker not available on {self.address}")
+            time.sleep(0.05)
+            t += 0.05
+
+    def stop(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def serve(self):
+        self.fpga = FPGADevice(self.port, self.baudrate, verify=self.verify, mapfile=self.mapfile,
+            write_mode=self.write_mode, ack_timeout=self.ack_timeout)
+        self.requests = queue.Queue()
+        threading.Thread(target=self.bus_loop, daemon=True).start()
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        listener = Listener(self.address, family='AF_UNIX')
+        self.log(logging.INFO, f"serving {self.port} on {self.address}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=self.client_loop, args=(conn,), daemon=True).start()
+
+    def client_loop(self, conn):
+        reply = queue.Queue(1)
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            self.requests.put((msg, reply))
+            conn.send(reply.get())
+        conn.close()
+
+    def bus_loop(self):
+        while True:
+            pending = [self.requests.get()]
+            while True:
+                try:
+                    pending.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            group = []
+            for msg, reply in pending:
+                if msg[0] == 'transfer':
+                    group.append((msg, reply))
+                    continue
+                self.execute(group)
+                group = []
+                try:
+                    value = None
+                    if msg[0] == 'reconnect':
+                        self.fpga.reconnect()
+                    elif msg[0] == 'invalidate':
+                        self.fpga.invalidate()
+                    elif msg[0] == 'stats':
+                        value = self.fpga.stats()
+                    elif msg[0] == 'trace':
+                        self.fpga.trace(*msg[1:])
+                    elif msg[0] == 'trace_snapshot':
+                        value = self.fpga.trace_snapshot()
+                    else:
+                        raise ValueError(f"unknown broker request {msg[0]}")
+                    reply.put(('ok', value))
+                except Exception as e:
+                    reply.put(('error', str(e)))
+            self.execute(group)
+
+    def execute(self, group):
+        if len(group) == 0:
+            return
+        ops = []
+        for msg, _ in group:
+            ops.extend(msg[1])
+        try:
+            results = self.fpga.transfer(ops)
+        except Exception as e:
+            if len(group) > 1 and not self.fpga.writes_sent:
+                # nothing written yet: isolate the failing request
+                for item in group:
+                    self.execute([item])
+                return
+            # writes already went out (verify or port error mid-burst): a
+            # replay would repeat them, strobes included, so every client
+            # of the group gets the error
+            self.log(logging.ERROR, f"transfer failed: {e}")
+            for _, reply in group:
+                reply.put(('error', str(e)))
+            return
+        i = 0
+        for msg, reply in group:
+            reply.put(('ok', results[i:i+len(msg[1])]))
+            i += len(msg[1])
+
+
+if __name__ == "__main__":
+    port = sys.argv[1] if len(sys.argv) > 1 else "/dev/runcontrol"
+    address = sys.argv[2] if len(sys.argv) > 2 else BROKER_ADDRESS
+    FPGABroker(port, address).serve()
@@ -1,5 +1,116 @@
 import time
 import serial
+import threading
+import numpy as np
+from collections import deque, namedtuple
+
+# host_time: time.time() when the packet bytes were received
+FPGAEvent = namedtuple('FPGAEvent', ['seconds', 'counter', 'pps_delta', 'counter_pulses', 'host_time'])
+
+# batch decoder output, flags is 0 for a good packet
+EVENT_DTYPE = np.dtype([
+    ('seconds', np.uint32),
+    ('counter', np.uint32),
+    ('pps_delta', np.int32),
+    ('counter_pulses', np.uint32),
+    ('flags', np.uint8),
+])
+FLAG_TRUNCATED = 1      # no footer before the next header
+FLAG_FIELDS = 2         # wrong number of fields
+FLAG_HEX = 4            # not a hex digit / field too long
+DATA_POLL = 0.05        # serial read timeout, waits up to a deadline poll at this period
+
+_HEADER = np.frombuffer(b'BAAB', np.uint8)
+_FOOTER = np.frombuffer(b'FEEF', np.uint8)
+_NFIELDS = 6
+_NIBBLE = np.full(256, 255, np.uint8)
+for _i, _c in enumerate(b'0123456789abcdef'):
+    _NIBBLE[_c] = _i
+    _NIBBLE[bytes([_c]).upper()[0]] = _i
+
+def decode_packets(chunk):
+    # vectorized decoding of a raw chunk holding many packets. Returns the
+    # EVENT_DTYPE array, malformed packets flagged (values set to 0), and the
+    # bytes of a trailing incomplete packet to prepend to the next chunk.
+    # A packet runs from its header to the next one, so a field reading BAAB
+    # splits it (flagged)
+    b = np.frombuffer(chunk, np.uint8)
+    n = len(b)
+    cand = np.flatnonzero(b[:max(n - 3, 0)] == _HEADER[0])
+    for k in range(1, len(_HEADER)):
+        cand = cand[b[cand + k] == _HEADER[k]]
+    starts = cand
+    if len(starts) == 0:
+        return np.zeros(0, EVENT_DTYPE), bytes(chunk[max(n - len(_HEADER) + 1, 0):])
+    ends = np.append(starts[1:], n)
+
+    # complete packets end with the footer right before the next header
+    complete = ends - len(_FOOTER) >= starts + len(_HEADER)
+    for k in range(len(_FOOTER)):
+        complete &= b[np.clip(ends - len(_FOOTER) + k, 0, n - 1)] == _FOOTER[k]
+    rest = b''
+    if not complete[-1]:
+        rest = bytes(chunk[starts[-1]:])
+        starts, ends, complete = starts[:-1], ends[:-1], complete[:-1]
+    npkt = len(starts)
+    events = np.zeros(npkt, EVENT_DTYPE)
+    if npkt == 0:
+        return events, rest
+    flags = np.where(complete, 0, FLAG_TRUNCATED).astype(np.uint8)
+
+    # field separators of each packet body (between header and footer)
+    body_start = starts + len(_HEADER)
+    body_end = np.where(complete, ends - len(_FOOTER), ends)
+    seps = np.flatnonzero(b[:ends[-1]] == 13)
+    pkt = np.searchsorted(starts, seps, 'right') - 1
+    inside = (pkt >= 0) & (seps < body_end[np.maximum(pkt, 0)])
+    seps, pkt = seps[inside], pkt[inside]
+    nsep = np.bincount(pkt, minlength=npkt)
+    trailing = b[np.maximum(body_end - 1, 0)] == 13
+    flags[nsep + ~trailing != _NFIELDS] |= FLAG_FIELDS
+
+    # field boundaries of the well formed packets
+    good = np.flatnonzero(flags == 0)
+    first = np.concatenate(([0], np.cumsum(nsep)[:-1]))[good]
+    fend = np.empty((len(good), _NFIELDS), np.int64)
+    nlead = _NFIELDS - 1
+    fend[:, :nlead] = seps[first[:, None] + np.arange(nlead)]
+    fend[:, nlead] = np.where(trailing[good], seps[np.minimum(first + nlead, len(seps) - 1)], body_end[good])
+    fstart = np.empty_like(fend)
+    fstart[:, 0] = body_start[good]
+    fstart[:, 1:] = fend[:, :nlead] + 1
+
+    # the 8 bytes ending each field are loaded as one big-endian word, the
+    # bytes before the field are masked and the hex digits are converted and
+    # packed 8 at a time (SWAR); '0'-'9', 'A'-'F' and 'a'-'f' all map to
+    # (c & 0xF) + 9 * bit 6 of c
+    length = fend - fstart
+    padded = np.concatenate((np.zeros(8, np.uint8), b))
+    words = np.ndarray((n + 1,), '>u8', padded, 0, (1,))[fend].astype(np.uint64)
+    words &= np.uint64(0xFFFFFFFFFFFFFFFF) >> (np.uint64(64) - np.uint64(8) * np.clip(length, 1, 8).astype(np.uint64))
+    x = (words & np.uint64(0x0F0F0F0F0F0F0F0F)) + np.uint64(9) * ((words >> np.uint64(6)) & np.uint64(0x0101010101010101))
+    x = (x | (x >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    x = (x | (x >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    x = (x | (x >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    v = x.astype(np.int64)
+
+    # fields too short/long, or holding a byte that is not a hex digit
+    bad = ((length < 1) | (length > 8)).any(axis=1)
+    nothex = np.flatnonzero((_NIBBLE[b[:ends[-1]]] == 255) & (b[:ends[-1]] != 13))
+    where = np.searchsorted(starts, nothex, 'right') - 1
+    inbody = (where >= 0) & (nothex >= body_start[np.maximum(where, 0)]) & (nothex < body_end[np.maximum(where, 0)])
+    bad |= np.isin(good, where[inbody])
+    flags[good[bad]] |= FLAG_HEX
+    v[bad] = 0
+
+    # same conversion as _parse_packet
+    events['seconds'][good] = (v[:, 0] << 16) + v[:, 1]
+    events['counter'][good] = ((v[:, 2] << 16) + v[:, 3]) * 10
+    events['pps_delta'][good] = np.where(bad, 0, (v[:, 4] - 32767) * 10)
+    events['counter_pulses'][good] = v[:, 5]
+    events['flags'] = flags
+    return events, rest
+
 
 class FPGAData:
     _instance = None
@@ -9,68 +120,258 @@ class FPGAData:
             cls._instance = super(FPGAData, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, port, baudrate=115200):
+    def __init__(self, port, baudrate=115200, timeout=2.0):
         if hasattr(self, "_initialized") and self._initialized:
             return
         self._initialized = True
 
         self.port = port
         self.baudrate = baudrate
-        self.HEADER = 'BAAB'
-        self.FOOTER = 'FEEF'
+        self.HEADER = b'BAAB'
+        self.FOOTER = b'FEEF'
+        self.NFIELDS = 6
         self.PACKET_SIZE = 40  # Verifica questa lunghezza!
-        self.buffer = ""
-        self.start_idx =0
-        self.end_idx=0
+        # how long read_event waits for a packet
+        self.timeout = timeout
+        # bytes received but not framed yet, events framed but not returned yet
+        self.buffer = bytearray()
+        self.pending = deque()
+        # background reader: events go to the ring, the oldest are dropped
+        # when the consumer falls behind (counted in overflows)
+        self.reader = None
+        self.running = False
+        self.ring = None
+        self.arrived = threading.Event()
+        self.overflows = 0
+
+        # framer counters
+        self.events = 0
+        self.resyncs = 0
+        self.discarded = 0
+        self.parse_errors = 0
 
         try:
-            self.serial = serial.Serial(self.port, self.baudrate, timeout=0.5)
+            # the timeout is set once: changing it reconfigures the port
+            self.serial = serial.Serial(self.port, self.baudrate, timeout=DATA_POLL)
         except serial.SerialException as e:
             raise RuntimeError(f"Errore apertura porta seriale: {e}")
 
-    def read_event(self):
-        # Leggi tutto ci che  disponibile
-        #self.buffer += self.serial.read_all().decode('utf-8', 'ignore')
-        data=""
-        n_try=0
-        # Cerca pacchetto completo
-        while n_try < 10: 
-            self.buffer = self.serial.read_all().decode('utf-8', 'ignore')
-            data+= self.buffer
-            
-            #print(self.buffer)
-            #print(len(data),data)
-            self.start_idx = data.find(self.HEADER)
-            self.end_idx = data.find(self.FOOTER)
-            time.sleep(0.2)
-            n_try +=1
-            if self.start_idx != -1 and self.end_idx !=-1:
-                #print(self.start_idx, self.end_idx)
+    def _discard(self, n):
+        self.discarded += n
+        self.resyncs += 1
+        del self.buffer[:n]
+
+    def _frame(self):
+        # extract every complete packet from the buffer; the incomplete tail
+        # is kept for the next call
+        events = []
+        buf = self.buffer
+        while True:
+            start = buf.find(self.HEADER)
+            if start < 0:
+                # keep what could be the beginning of a split header
+                keep = len(self.HEADER) - 1
+                if len(buf) > keep:
+                    self._discard(len(buf) - keep)
+                break
+            if start > 0:
+                self._discard(start)
+
+            # the footer closes the packet once all the fields were seen (a field
+            # value can itself read FEEF)
+            view = memoryview(buf)
+            end = len(self.HEADER)
+            nfields = 0
+            while nfields < self.NFIELDS:
+                end = buf.find(self.FOOTER, end)
+                if end < 0:
+                    break
+                nfields = len(bytes(view[len(self.HEADER):end]).strip().split(b'\r'))
+                end += len(self.FOOTER)
+            view.release()
+            if end < 0:
+                if len(buf) > 2 * self.PACKET_SIZE:
+                    # footer lost: look for the next header
+                    self._discard(len(self.HEADER))
+                    continue
                 break
+            if nfields != self.NFIELDS:
+                # truncated packet followed by a good one: restart from its header
+                nxt = buf.find(self.HEADER, len(self.HEADER), end)
+                self._discard(nxt if nxt > 0 else end)
+                continue
+
+            events.append(self._parse_packet(bytes(buf[:end])))
+            del buf[:end]
+        self.events += len(events)
+        return events
 
-        #print(data,end="")
-        #for c in data:
-        #    print(c)
-        
-        packet = data[self.start_idx:self.end_idx + len(self.FOOTER)]
-        #print("ok"+packet)# Rimuovi il pacchetto dal buffer
-        self.buffer = ""   #self.buffer[end_idx + len(self.FOOTER):]
-        return self._parse_packet(packet)
+    def _read(self, timeout):
+        # bytes available, waiting up to timeout (polled) for the first one
+        deadline = time.monotonic() + timeout
+        while True:
+            data = self.serial.read(max(1, self.serial.in_waiting))
+            if len(data) or time.monotonic() >= deadline:
+                return data
+
+    def _receive(self, timeout):
+        # read what is available, blocking up to timeout for the first byte
+        data = self._read(timeout)
+        if len(data) == 0:
+            return []
+        host_time = time.time()
+        self.buffer += data
+        return [FPGAEvent(*event, host_time) for event in self._frame()]
+
+    def start(self, maxlen=10000):
+        # continuous acquisition in a background thread; the serial port is
+        # then read only by that thread and read_event(s) consume the ring
+        if self.running:
+            return
+        self.ring = deque(maxlen=maxlen)
+        self.ring.extend(self.pending)
+        self.pending.clear()
+        self.running = True
+        self.reader = threading.Thread(target=self.reader_loop, daemon=True)
+        self.reader.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.reader is not None and self.reader is not threading.current_thread():
+            self.reader.join()
+        self.reader = None
+        self.pending.extend(self.ring)
+        self.ring = None
+
+    def reader_loop(self):
+        while self.running:
+            try:
+                events = self._receive(0.2)
+            except (serial.SerialException, OSError):
+                time.sleep(0.2)
+                continue
+            for event in events:
+                if len(self.ring) == self.ring.maxlen:
+                    self.overflows += 1
+                self.ring.append(event)
+            if len(events):
+                self.arrived.set()
+
+    def get(self, timeout=None):
+        # next event from the ring, None if nothing arrives within timeout
+        if not self.running:
+            events = self.read_events(timeout)
+            if len(events) == 0:
+                return None
+            self.pending.extendleft(reversed(events[1:]))
+            return events[0]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self.ring.popleft()
+            except IndexError:
+                pass
+            self.arrived.clear()
+            if len(self.ring):
+                continue
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            if not self.arrived.wait(remaining):
+                return None
+
+    def drain(self):
+        # every event received so far, without waiting
+        events = []
+        queue = self.ring if self.running else self.pending
+        while True:
+            try:
+                events.append(queue.popleft())
+            except IndexError:
+                return events
+
+    def __iter__(self):
+        # events as they arrive, until none arrives within timeout
+        while True:
+            event = self.get(self.timeout)
+            if event is None:
+                return
+            yield event
+
+    def read_events(self, timeout=None):
+        # all the events received so far in arrival order; if there is none,
+        # block up to timeout (self.timeout if None) for the next ones
+        if timeout is None:
+            timeout = self.timeout
+        if self.running:
+            events = self.drain()
+            if len(events) == 0:
+                event = self.get(timeout)
+                if event is not None:
+                    events = [event] + self.drain()
+            return events
+
+        events = list(self.pending)
+        self.pending.clear()
+        if self.serial.in_waiting:
+            events.extend(self._receive(0))
+        deadline = time.monotonic() + timeout
+        while len(events) == 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            events.extend(self._receive(min(remaining, 0.5)))
+        return events
+
+    def read_array(self, timeout=None):
+        # raw bytes available (waiting up to timeout for the first ones)
+        # decoded in one go into an EVENT_DTYPE array; not with the reader running
+        if self.running:
+            raise RuntimeError("FPGAData: read_array with the background reader running")
+        self.buffer += self._read(self.timeout if timeout is None else timeout)
+        events, rest = decode_packets(bytes(self.buffer))
+        self.buffer = bytearray(rest)
+        self.events += len(events)
+        self.parse_errors += int(np.count_nonzero(events['flags']))
+        return events
+
+    def read_event(self):
+        # next event as (seconds, counter, pps_delta, counter_pulses),
+        # (0, 0, 0, 0) if nothing arrives within timeout
+        event = self.get(self.timeout)
+        if event is None:
+            return 0, 0, 0, 0
+        return tuple(event[:4])
 
+    def stats(self):
+        return {
+            'events': self.events,
+            'resyncs': self.resyncs,
+            'discarded': self.discarded,
+            'parse_errors': self.parse_errors,
+            'buffered': len(self.buffer),
+            'queued': len(self.ring) if self.running else len(self.pending),
+            'overflows': self.overflows,
+        }
 
     def _parse_packet(self, packet):
         data = packet[len(self.HEADER):-len(self.FOOTER)]
         try:
-            values = data.strip().split('\r')
+            values = data.strip().split(b'\r')
             if len(values) < 6:
                 raise ValueError("Dati incompleti")
 
             seconds = (int(values[0], 16) << 16) + int(values[1], 16)
-            counter = (int(values[2], 16) << 16) + int(values[3], 16) * 10
+            # 10 ns ticks since the PPS in two 16-bit words: the whole
+            # 32-bit count is scaled, not only the low word
+            counter = ((int(values[2], 16) << 16) + int(values[3], 16)) * 10
             pps_delta = (int(values[4], 16) - 32767) * 10
             counter_pulses = int(values[5], 16)
 
             return seconds, counter, pps_delta, counter_pulses
         except Exception as e:
             #print(f"Errore parsing: {e}")
+            self.parse_errors += 1
             return 0, 0, 0, 0
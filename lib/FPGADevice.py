@@ -1,7 +1,17 @@
 
+import os
 import serial
 import time
+import threading
+from types import MappingProxyType
+from dataclasses import dataclass
+from concurrent.futures import Future
 from multiprocessing import Lock
+from multiprocessing.connection import Client
+from lib.FPGAMap import FPGAMap, FPGARegister, FPGAIO, FPGA_MAPFILE
+from lib.FPGATracer import FPGATracer
+
+RESYNC_QUIET = 0.005    # s without incoming bytes for the line to count as quiet
 
 class FPGADevice:
 
@@ -13,7 +23,8 @@ class FPGADevice:
             raise Exception("Class FPGADevice - no instance")
         return FPGADevice.__instance
 
-    def __init__(self, port, baudrate = 115200):
+    def __init__(self, port, baudrate = 115200, verify = False, broker = None, mapfile = FPGA_MAPFILE,
+            write_mode = 'ack', ack_timeout = 0.5, retries = 2):
         if FPGADevice.__instance != None:
             raise Exception("Class FPGADevice - use existing instance")
         else:
@@ -23,102 +34,391 @@ class FPGADevice:
         self.baudrate = baudrate
         self.serial = None
         self.mutex = Lock() 
+        self.verify = verify
+        # last known value of the words written by this process
+        self.shadow = {}
+        # client mode: bus requests are served by FPGABroker at this address
+        self.broker = broker
+        self.local = threading.local()
+        # 'ack': a write completes when the firmware echoes the value back,
+        # 'sleep': fixed delay for firmware without echo
+        if write_mode not in ('ack', 'sleep'):
+            raise ValueError(f"unknown FPGA write mode {write_mode}")
+        self.write_mode = write_mode
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.write_stats = WriteStats()
+        # transaction tracer, see trace()
+        self.tracer = None
+        self.reply_error = None
+        # set by a transfer once its writes are on the wire: a failure after
+        # that point must not be retried (strobes would fire twice)
+        self.writes_sent = False
 
-        try:
-            self.serial = serial.Serial(self.port, self.baudrate, timeout = 2)
-        except serial.SerialException as e:
-            raise RuntimeError
-
-        self.regmap = {}
-        self.regmap["unixtime"] = FPGARegister(0x0, 2)
-        self.regmap["pps_delay"] = FPGARegister(0x5, 2)
-        self.regmap["pps_distance"] = FPGARegister(0xB)
-        self.regmap["pid_value"] = FPGARegister(0xC)
-        self.regmap["time_cnt"] = FPGARegister(0xD, 2)
-        self.regmap["vcxo_value"] = FPGARegister(0xF)
-        self.regmap["pid_dac"] = FPGARegister(0x10)
-        self.regmap["pid_dac_p"] = FPGARegister(0x11)
-        self.regmap["pid_dac_i"] = FPGARegister(0x12)
-        self.regmap["pulse_width"] = FPGARegister(0x13)
-        self.regmap["pulse_energy"] = FPGARegister(0x14, 2)
-        self.regmap["arm_unixtime"] = FPGARegister(0x19, 2)
-        self.regmap["pulse_period"] = FPGARegister(0x1B, 2)
-        self.regmap["mux_bnc_0"] = FPGARegister(0x1D)
-        self.regmap["mux_bnc_1"] = FPGARegister(0x1E)
-        self.regmap["mux_bnc_2"] = FPGARegister(0x1F)
-        self.regmap["mux_bnc_3"] = FPGARegister(0x20)
-        self.regmap["mux_bnc_4"] = FPGARegister(0x21)
-        self.regmap["shots_num"] = FPGARegister(0x22, 2)
-        self.regmap["shots_cnt"] = FPGARegister(0x24, 2)
-
-        self.iomap = {}
-        self.iomap["laser_start"] = FPGAIO(0x3, 0)
-        self.iomap["laser_en"] = FPGAIO(0x3, 1)
-        self.iomap["timestamp_en"] = FPGAIO(0x3, 2)
-        self.iomap["cover_raman_closed"] = FPGAIO(0x16, 0)
-        self.iomap["cover_raman_open"] = FPGAIO(0x16, 1)
-        self.iomap["cover_steer_closed"] = FPGAIO(0x16, 2, inverted=True)
-        self.iomap["cover_steer_open"] = FPGAIO(0x16, 3, inverted=True)
-        self.iomap["rain"] = FPGAIO(0x16, 4)
-        self.iomap["norain"] = FPGAIO(0x16, 5)
-        self.iomap["inverter"] = FPGAIO(0x17, 0)
-        self.iomap["flipper_steer"] = FPGAIO(0x17, 1)
-        self.iomap["flipper_raman"] = FPGAIO(0x17, 2)
-        self.iomap["flipper_atten"] = FPGAIO(0x17, 3)
-
-        self.iomap["pps_ok"] = FPGAIO(0x7, 2)
-        self.iomap["jc_lock"] = FPGAIO(0x8, 2)
-        self.iomap["vcxo_lock"] = FPGAIO(0x8, 3)
-        self.iomap["force_align"] = FPGAIO(0x9, 4)
+        if self.broker is None:
+            try:
+                self.serial = serial.Serial(self.port, self.baudrate,
+                    timeout = self.ack_timeout if self.write_mode == 'ack' else 2)
+            except serial.SerialException as e:
+                raise RuntimeError
+
+        self.load_map(mapfile)
+
+        # another process may write the registers after a fork
+        if self.broker is None:
+            os.register_at_fork(after_in_parent=self.drop_shadow, after_in_child=self.drop_shadow)
 
     def close(self):
-        self.serial.close()
+        if self.broker is None:
+            self.serial.close()
+        elif getattr(self.local, 'conn', None) is not None:
+            self.local.conn.close()
+            self.local.conn = None
+
+    def load_map(self, mapfile):
+        # mapfile is a path to the YAML map or an already compiled FPGAMap
+        if isinstance(mapfile, FPGAMap):
+            self.map = mapfile
+        else:
+            self.map = FPGAMap.load(mapfile)
+        self.regmap = self.map.regmap
+        self.iomap = self.map.iomap
+        self.volatile = self.map.volatile
+        if self.tracer is not None:
+            self.tracer.set_map(self.map)
+
+    def drop_shadow(self):
+        self.shadow = {}
+
+    def invalidate(self):
+        if self.broker is not None:
+            return self._request('invalidate')
+        self.drop_shadow()
+
+    def _request(self, *msg):
+        # each process and thread gets its own connection to the broker
+        if getattr(self.local, 'conn', None) is None or self.local.pid != os.getpid():
+            self.local.conn = Client(self.broker, family='AF_UNIX')
+            self.local.pid = os.getpid()
+        self.local.conn.send(msg)
+        status, value = self.local.conn.recv()
+        if status == 'error':
+            raise RuntimeError(value)
+        return value
 
     def critical_section(func):
         def wrapper(self, *args, **kwargs):
-            self.mutex.acquire()
-            ret = func(self, *args, **kwargs)
-            self.mutex.release()
-            return ret
+            if self.tracer is not None:
+                t0 = time.perf_counter()
+                self.mutex.acquire()
+                self.tracer.record_transfer(time.perf_counter() - t0)
+            else:
+                self.mutex.acquire()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self.mutex.release()
         return wrapper
 
+    def stats(self):
+        if self.broker is not None:
+            return self._request('stats')
+        return self.write_stats.summary()
+
+    def trace(self, enable=True, window=60.0):
+        # start (or stop) recording every bus transaction
+        if self.broker is not None:
+            return self._request('trace', enable, window)
+        self.tracer = FPGATracer(self.map, window) if enable else None
+
+    def trace_snapshot(self):
+        # tracer data as a dict (see FPGATracer.to_json/prometheus), None if disabled
+        if self.broker is not None:
+            return self._request('trace_snapshot')
+        if self.tracer is None:
+            return None
+        return self.tracer.snapshot()
+
+    def reconnect(self):
+        if self.broker is not None:
+            return self._request('reconnect')
+        self._reconnect()
+
     @critical_section
-    def read_address(self, addr):
-        value = 0
+    def _reconnect(self):
+        self.serial.close()
+        self.serial.open()
+        self.drop_shadow()
+
+    def _trusted(self, addr):
+        return addr in self.shadow and addr not in self.volatile
+
+    def transfer(self, ops):
+        if self.broker is not None:
+            return self._request('transfer', ops)
+        return self._transfer(ops)
+
+    @critical_section
+    def _transfer(self, ops):
+        # ops is a list of ('r', addr), ('w', addr, value) and ('m', addr, mask, bits)
+        # items. 'm' updates the masked bits of a word starting from the shadow
+        # copy or, when it can't be trusted, from a read-back done in a single
+        # burst ahead of the other items; the write is skipped if the word
+        # already holds the new value. Returns one result per item: read value
+        # (None on garbled reply), True/False (acknowledged or not) for writes,
+        # True/False (written/skipped) for updates
+        self.writes_sent = False
+        known = {}
+        preread = []
+        for op in ops:
+            if op[0] == 'm' and not self._trusted(op[1]) and op[1] not in preread:
+                if op[1] not in self.volatile or op[2] != 0xFFFF:
+                    preread.append(op[1])
+        if len(preread):
+            for addr, value in zip(preread, self._execute([('r', addr) for addr in preread])):
+                if value is None:
+                    raise RuntimeError(f"FPGA read failed at address {hex(addr)}")
+                known[addr] = value
+                self.shadow[addr] = value
+
+        wire = []
+        index = []
+        for op in ops:
+            if op[0] == 'r':
+                index.append(len(wire))
+                wire.append(op)
+            elif op[0] == 'w':
+                known[op[1]] = op[2]
+                index.append(len(wire))
+                wire.append(op)
+            elif op[0] == 'm':
+                addr, mask, bits = op[1:]
+                base = known.get(addr, self.shadow.get(addr) if self._trusted(addr) else None)
+                value = bits if base is None else (base & ~mask) | (bits & mask)
+                if value == base and addr not in self.volatile:
+                    index.append(None)
+                else:
+                    known[addr] = value
+                    index.append(len(wire))
+                    wire.append(('w', addr, value))
+            else:
+                raise ValueError(f"unknown FPGA operation {op[0]}")
+
+        self.writes_sent = any(op[0] == 'w' for op in wire)
+        results = self._execute(wire)
+        for op, value in zip(wire, results):
+            if op[0] == 'w':
+                if value:
+                    self.shadow[op[1]] = op[2]
+                else:
+                    self.shadow.pop(op[1], None)
+            elif value is not None and op[1] in self.shadow:
+                self.shadow[op[1]] = value
+        if self.verify:
+            self._verify(wire)
+
+        return [False if i is None else results[i] for i in index]
+
+    def _execute(self, wire):
+        # with write acknowledges every command gets a reply, so the whole list
+        # goes out in a single burst and replies are matched back in order;
+        # otherwise consecutive items of the same kind are grouped in bursts
+        results = [None] * len(wire)
+        if self.write_mode == 'ack':
+            self._ack_burst(wire, results)
+            return results
+        i = 0
+        while i < len(wire):
+            j = i
+            while j < len(wire) and wire[j][0] == wire[i][0]:
+                j = j + 1
+            if wire[i][0] == 'r':
+                self._read_burst(wire, i, j, results)
+            else:
+                self._write_burst(wire, i, j, results)
+            i = j
+        return results
+
+    def _verify(self, wire):
+        addrs = [op[1] for op in wire if op[0] == 'w' and op[1] not in self.volatile]
+        if len(addrs) == 0:
+            return
+        failed = []
+        for addr, value in zip(addrs, self._execute([('r', addr) for addr in addrs])):
+            if value != self.shadow.get(addr):
+                self.shadow.pop(addr, None)
+                failed.append(hex(addr))
+        if len(failed):
+            raise RuntimeError(f"FPGA verify failed at addresses {failed}")
+
+    @staticmethod
+    def _command(op):
+        if op[0] == 'r':
+            return f"{str(hex(op[1]))[2:]}\n"
+        return f"{str(hex(op[1]))[2:]} {str(hex(op[2]))[2:]}\n"
+
+    def _reply(self):
+        # one reply terminated by CR within ack_timeout; None when garbled or
+        # missing, the reason is left in reply_error
+        line = self.serial.read_until('\r'.encode())
+        if not line.endswith('\r'.encode()):
+            self.reply_error = 'timeout'
+            return None
+        try:
+            value = int(line.decode()[:-1], 16)
+        except ValueError:
+            self.reply_error = 'parse'
+            return None
+        self.reply_error = None
+        return value
+
+    def _resync(self):
+        # drop everything still arriving (late replies of a burst) until the
+        # line stays quiet, at most ack_timeout
+        deadline = time.monotonic() + self.ack_timeout
         while True:
-            self.serial.write(f"{str(hex(addr))[2:]}\n".encode())
-            try:
-                value = int(self.serial.read_until('\r'.encode()).decode()[:-1], 16)
-            except:
-                continue
-            finally:
+            self.serial.reset_input_buffer()
+            time.sleep(RESYNC_QUIET)
+            if self.serial.in_waiting == 0 or time.monotonic() >= deadline:
+                return
+
+    def _trace(self, op, t0, retries=0, error=None):
+        self.tracer.record(op[0], op[1], len(self._command(op)), time.perf_counter() - t0, retries, error)
+
+    def _read_burst(self, ops, start, end, results):
+        t0 = time.perf_counter()
+        self.serial.write("".join(self._command(op) for op in ops[start:end]).encode())
+        for i in range(start, end):
+            results[i] = self._reply()
+            if self.tracer is not None:
+                self._trace(ops[i], t0, error=self.reply_error)
+
+    def _write_burst(self, ops, start, end, results):
+        t0 = time.perf_counter()
+        self.serial.write("".join(self._command(op) for op in ops[start:end]).encode())
+        time.sleep(0.1)
+        self.serial.read_all()
+        for i in range(start, end):
+            results[i] = True
+            if self.tracer is not None:
+                self._trace(ops[i], t0)
+
+    def _ack_burst(self, ops, results):
+        # writes are acknowledged by the echo of the written value; a write with
+        # a missing or garbled echo is sent again on its own, except for
+        # volatile words where a repeated write would strobe twice
+        t0 = time.perf_counter()
+        self.serial.write("".join(self._command(op) for op in ops).encode())
+        failed = []
+        for i, op in enumerate(ops):
+            value = self._reply()
+            if op[0] == 'r':
+                results[i] = value
+            else:
+                results[i] = value == op[2]
+                if results[i]:
+                    self.write_stats.record(time.perf_counter() - t0)
+                else:
+                    failed.append(i)
+            if self.tracer is not None:
+                error = self.reply_error or (None if op[0] == 'r' or results[i] else 'mismatch')
+                self._trace(op, t0, error=error)
+            if value is None:
+                # lost terminator: later replies can't be matched anymore
+                failed.extend(j for j in range(i + 1, len(ops)))
                 break
+
+        for i in failed:
+            op = ops[i]
+            if op[0] == 'r':
+                self._resync()
+                t0 = time.perf_counter()
+                self.serial.write(self._command(op).encode())
+                results[i] = self._reply()
+                if self.tracer is not None:
+                    self._trace(op, t0, retries=1, error=self.reply_error)
+                continue
+            if op[1] in self.volatile:
+                self.write_stats.failures += 1
+                continue
+            for _ in range(self.retries):
+                self.write_stats.retries += 1
+                self._resync()
+                t0 = time.perf_counter()
+                self.serial.write(self._command(op).encode())
+                value = self._reply()
+                results[i] = value == op[2]
+                if self.tracer is not None:
+                    self._trace(op, t0, retries=1, error=self.reply_error or (None if results[i] else 'mismatch'))
+                if results[i]:
+                    self.write_stats.record(time.perf_counter() - t0)
+                    break
+            else:
+                self.write_stats.failures += 1
+
+    def batch(self):
+        return FPGABatch(self)
+
+    def read_address(self, addr):
+        value = self.transfer([('r', addr)])[0]
+        if value is None:
+            return 0
         return value
 
-    @critical_section
     def write_address(self, addr, value):
-        self.serial.write(f"{str(hex(addr))[2:]} {str(hex(value))[2:]}\n".encode())
-        time.sleep(0.1)
-        self.serial.read_all()
+        self.transfer([('w', addr, value)])
 
     def read_register(self, name):
-        if self.regmap.get(name, None) is None:
-            raise NameError
-        addr = self.regmap[name].get_addr()
-        width = self.regmap[name].get_width()
-        i = value = 0
-        while i < width:
-            value = value | (self.read_address(addr+i) << (i * 16))
-            i = i + 1
+        batch = self.batch()
+        batch.read_register(name)
+        value = batch.execute()[0]
+        if value is None:
+            return 0
         return value
 
     def write_register(self, name, value):
-        addr = self.regmap[name].get_addr()
-        width = self.regmap[name].get_width()
-        i = 0
-        while i < width:
-            self.write_address(addr+i, (value & (0xFFFF << (i*16))) >> (i*16))
-            i = i + 1
+        batch = self.batch()
+        batch.write_register(name, value)
+        batch.execute()
+
+    def write_registers(self, values):
+        # write a set of registers {name: value} in a single burst
+        batch = self.batch()
+        for name, value in values.items():
+            batch.write_register(name, value)
+        batch.execute()
+
+    def apply_profile(self, profile):
+        # profile is a {name: value} dict of registers and DIO bits; only the
+        # words that differ from the FPGA content are written. Returns the
+        # names that required a write. Unknown names raise NameError before
+        # anything is written
+        for name in profile:
+            if name not in self.regmap and name not in self.iomap:
+                raise NameError(name)
+        batch = self.batch()
+        names = []
+        bits = {}
+        for name, value in profile.items():
+            desc = self.map.get(name)
+            if name in self.regmap:
+                batch.update_register(name, value)
+                names.append([name])
+            else:
+                bits.setdefault(desc.addr, []).append((desc, value))
+        for addr, items in bits.items():
+            mask = value = 0
+            for io, b in items:
+                mask = mask | io.mask
+                if b:
+                    value = value | io.mask
+            batch.update_address(addr, mask, value)
+            names.append([io.name for io, _ in items])
+        written = []
+        for items, result in zip(names, batch.execute()):
+            if result:
+                written.extend(items)
+        return written
 
     def read_bit(self, name):
         return self.read_dio(name) 
@@ -127,54 +427,219 @@ class FPGADevice:
         self.write_dio(name, b)
 
     def read_dio(self, name):
-        if self.iomap.get(name, None) is None:
+        io = self.iomap.get(name, None)
+        if io is None:
             raise NameError
-        addr = self.iomap[name].get_addr()
-        bit = self.iomap[name].get_bit()
-        inverted = self.iomap[name].get_inverted()
-        value = bool(self.read_address(addr) & (1 << bit))
-        if inverted:
-            return not value
-        return value
+        return io.decode(self.read_address(io.addr))
+
+    def snapshot(self, names=None, words=None):
+        # read the words holding the given registers/IO bits (or the given word
+        # addresses, or the whole map space) in one pipelined transfer, plus
+        # the FPGA unixtime; returns an immutable decoded view
+        if names is None and words is None:
+            addrs = list(self.map.space)
+        else:
+            addrs = list(words or [])
+            addrs.extend(addr for addr in self.map.addresses(names or []) if addr not in addrs)
+        if 'unixtime' in self.regmap:
+            addrs.extend(addr for addr in self.regmap['unixtime'].words if addr not in addrs)
+        host_time = time.time()
+        words = dict(zip(addrs, self.transfer([('r', addr) for addr in addrs])))
+        values = self.map.decode(words)
+        return FPGASnapshot(host_time, values.get('unixtime', None), MappingProxyType(words), MappingProxyType(values))
+
+    def read_values(self, names):
+        # values of registers and DIO bits read in a single transfer (None when
+        # the word could not be read)
+        snap = self.snapshot(names)
+        return {name: snap[name] for name in names}
+
+    def wait_for(self, names, predicate, timeout=None, policy=None, abort=None):
+        # poll registers/DIO bits in one bus sweep until predicate(snapshot) is
+        # true; returns the snapshot, or None on timeout or abort (threading.Event)
+        if policy is None:
+            policy = PollPolicy()
+        start = time.monotonic()
+        while True:
+            snap = self.snapshot(names)
+            if None not in (snap[name] for name in names) and predicate(snap):
+                return snap
+            now = time.monotonic()
+            if timeout is not None and now - start >= timeout:
+                return None
+            interval = policy.next_interval(now)
+            if timeout is not None:
+                interval = min(interval, start + timeout - now)
+            if abort is not None:
+                if abort.wait(interval):
+                    return None
+            else:
+                time.sleep(interval)
+
+    def wait_for_dio(self, name, value, timeout=None, policy=None, abort=None):
+        values = self.wait_for([name], lambda v: v[name] == bool(value), timeout, policy, abort)
+        return values is not None
+
+    def wait_for_register(self, name, predicate, timeout=None, policy=None, abort=None):
+        values = self.wait_for([name], lambda v: predicate(v[name]), timeout, policy, abort)
+        if values is None:
+            return None
+        return values[name]
+
+    def wait_async(self, names, predicate, timeout=None, policy=None, abort=None, callback=None):
+        # same as wait_for in a background thread: returns a Future holding the
+        # snapshot (None on timeout); callback(future) is called on completion
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        def waiter():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(self.wait_for(names, predicate, timeout, policy, abort))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=waiter, daemon=True).start()
+        return future
+
+    def write_dio(self, name, b):
+        batch = self.batch()
+        batch.write_dio(name, b)
+        batch.execute()
+
+
+class FPGABatch:
+
+    def __init__(self, fpga):
+        self.fpga = fpga
+        self.ops = []
+        self.items = []
+
+    def _queue(self, kind, ops):
+        self.items.append((kind, len(self.ops), len(ops)))
+        self.ops.extend(ops)
+
+    def read_address(self, addr):
+        self._queue('r', [('r', addr)])
+
+    def write_address(self, addr, value):
+        self._queue('w', [('w', addr, value)])
+
+    def read_register(self, name):
+        reg = self.fpga.regmap.get(name, None)
+        if reg is None:
+            raise NameError
+        self._queue('r', [('r', addr) for addr in reg.words])
+
+    def write_register(self, name, value):
+        reg = self.fpga.regmap.get(name, None)
+        if reg is None:
+            raise NameError
+        self._queue('w', [('w', addr, word) for addr, word in zip(reg.words, reg.split(value))])
+
+    def update_address(self, addr, mask, value):
+        self._queue('m', [('m', addr, mask, value)])
+
+    def update_register(self, name, value):
+        reg = self.fpga.regmap.get(name, None)
+        if reg is None:
+            raise NameError
+        self._queue('m', [('m', addr, 0xFFFF, word) for addr, word in zip(reg.words, reg.split(value))])
 
     def write_dio(self, name, b):
-        if self.iomap.get(name, None) is None:
+        io = self.fpga.iomap.get(name, None)
+        if io is None:
             raise NameError
-        addr = self.iomap[name].get_addr()
-        bit = self.iomap[name].get_bit()
-        value = self.read_address(addr)
-        if b:
-            value = value | (1 << bit)
-        else:
-            value = value & ~(1 << bit)
-        self.write_address(addr, value)
+        self.update_address(io.addr, io.mask, io.mask if b else 0)
+
+    def execute(self):
+        # returns one result per queued item: register value (None if any word
+        # could not be read) for reads, True if all words were acknowledged for
+        # writes, True if any word was written for updates
+        results = self.fpga.transfer(self.ops)
+        values = []
+        for kind, start, nops in self.items:
+            words = results[start:start+nops]
+            if kind == 'w':
+                values.append(all(words))
+            elif kind == 'm':
+                values.append(any(words))
+            elif None in words:
+                values.append(None)
+            else:
+                values.append(sum(word << (i * 16) for i, word in enumerate(words)))
+        self.ops = []
+        self.items = []
+        return values
+
+
+class WriteStats:
+
+    # write completion latency (s, from burst start to echo) and error counters
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.retries = 0
+        self.failures = 0
+
+    def record(self, latency):
+        self.count += 1
+        self.total += latency
+        self.min = latency if self.min is None else min(self.min, latency)
+        self.max = latency if self.max is None else max(self.max, latency)
 
-    
-class FPGAIO(FPGADevice):
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'retries': self.retries,
+            'failures': self.failures,
+        }
 
-    def __init__(self, regaddr, bit, inverted=False):
-        self.regaddr = regaddr
-        self.bit = bit
-        self.inverted = inverted
 
-    def get_addr(self):
-        return self.regaddr
+@dataclass(frozen=True)
+class FPGASnapshot:
+    host_time: float        # time.time() when the transfer started
+    fpga_time: int          # FPGA unixtime register
+    words: MappingProxyType
+    values: MappingProxyType
 
-    def get_bit(self):
-        return self.bit
+    def __getitem__(self, name):
+        return self.values[name]
 
-    def get_inverted(self):
-        return self.inverted
+    def get(self, name, default=None):
+        return self.values.get(name, default)
 
 
-class FPGARegister(FPGADevice):
+class PollPolicy:
 
-    def __init__(self, regaddr, width = 1):
-        self.regaddr = regaddr
-        self.width = width
+    # adaptive polling: intervals grow from fast to slow by the backoff factor;
+    # around the expected time of the change (time.monotonic() value) polling
+    # stays fast, and the wait before it never oversleeps the window start
 
-    def get_addr(self):
-        return self.regaddr
+    def __init__(self, fast=0.02, slow=1.0, backoff=1.5, expected=None, window=2.0):
+        self.fast = fast
+        self.slow = slow
+        self.backoff = backoff
+        self.expected = expected
+        self.window = window
+        self.interval = fast
 
-    def get_width(self):
-        return self.width
+    def next_interval(self, now):
+        if self.expected is not None and abs(now - self.expected) <= self.window:
+            self.interval = self.fast
+            return self.fast
+        interval = self.interval
+        self.interval = min(self.interval * self.backoff, self.slow)
+        if self.expected is not None and now < self.expected - self.window:
+            interval = min(interval, self.expected - self.window - now)
+        return max(interval, self.fast)
@@ -0,0 +1,139 @@
+import yaml
+
+FPGA_MAPFILE = "conf/clf/fpga.yml"
+WORD_BITS = 16
+MAX_WIDTH = 4
+
+class FPGARegister:
+
+    __slots__ = ('name', 'addr', 'width', 'words')
+
+    def __init__(self, name, addr, width=1):
+        self.name = name
+        self.addr = addr
+        self.width = width
+        self.words = tuple(range(addr, addr + width))
+
+    def split(self, value):
+        return [(value >> (i * WORD_BITS)) & 0xFFFF for i in range(self.width)]
+
+    def join(self, words):
+        value = 0
+        for i, word in enumerate(words):
+            value = value | (word << (i * WORD_BITS))
+        return value
+
+
+class FPGAIO:
+
+    __slots__ = ('name', 'addr', 'bit', 'mask', 'inverted', 'volatile')
+
+    def __init__(self, name, addr, bit, inverted=False, volatile=False):
+        self.name = name
+        self.addr = addr
+        self.bit = bit
+        self.mask = 1 << bit
+        self.inverted = inverted
+        self.volatile = volatile
+
+    def decode(self, word):
+        return bool(word & self.mask) != self.inverted
+
+
+class FPGAMap:
+
+    # register/IO map compiled from conf/<identity>/fpga.yml: descriptors
+    # keep precomputed word addresses and masks, words groups the IO bits by
+    # word address so that a word is read once for all of its bits
+
+    def __init__(self, doc):
+        self.regmap = {}
+        self.iomap = {}
+
+        owner = {}
+        for name, d in (doc.get('registers', None) or {}).items():
+            width = d.get('width', 1)
+            if not isinstance(width, int) or isinstance(width, bool) or width < 1 or width > MAX_WIDTH:
+                raise ValueError(f"FPGA register {name}: bad width {width}")
+            reg = FPGARegister(name, self._addr(name, d), width)
+            for addr in reg.words:
+                if addr in owner:
+                    raise ValueError(f"FPGA register {name}: word {hex(addr)} overlaps {owner[addr]}")
+                owner[addr] = name
+            self.regmap[name] = reg
+
+        self.words = {}
+        for name, d in (doc.get('io', None) or {}).items():
+            if name in self.regmap:
+                raise ValueError(f"FPGA IO {name}: name already used by a register")
+            bit = d.get('bit', None)
+            if not isinstance(bit, int) or isinstance(bit, bool) or bit < 0 or bit >= WORD_BITS:
+                raise ValueError(f"FPGA IO {name}: bad bit {bit}")
+            io = FPGAIO(name, self._addr(name, d), bit,
+                inverted=bool(d.get('inverted', False)), volatile=bool(d.get('volatile', False)))
+            if io.addr in owner:
+                raise ValueError(f"FPGA IO {name}: word {hex(io.addr)} is used by register {owner[io.addr]}")
+            for other in self.words.get(io.addr, ()):
+                if self.iomap[other].bit == io.bit:
+                    raise ValueError(f"FPGA IO {name}: bit {io.bit} of word {hex(io.addr)} overlaps {other}")
+            self.words[io.addr] = self.words.get(io.addr, ()) + (name,)
+            self.iomap[name] = io
+
+        # words holding bits changed by the firmware itself
+        self.volatile = frozenset(io.addr for io in self.iomap.values() if io.volatile)
+        # whole address space covered by the map
+        self.space = tuple(range(0, max(list(owner) + list(self.words), default=-1) + 1))
+
+    @staticmethod
+    def _addr(name, d):
+        addr = d.get('addr', None)
+        if not isinstance(addr, int) or isinstance(addr, bool) or addr < 0 or addr > 0xFFFF:
+            raise ValueError(f"FPGA map {name}: bad address {addr}")
+        return addr
+
+    @staticmethod
+    def load(path=FPGA_MAPFILE):
+        with open(path, 'r') as f:
+            return FPGAMap(yaml.safe_load(f))
+
+    def get(self, name):
+        desc = self.regmap.get(name, None)
+        if desc is None:
+            desc = self.iomap.get(name, None)
+        if desc is None:
+            raise NameError(name)
+        return desc
+
+    def addresses(self, names):
+        # word addresses holding the given registers/IO bits, each once
+        addrs = []
+        for name in names:
+            desc = self.get(name)
+            words = desc.words if isinstance(desc, FPGARegister) else (desc.addr,)
+            addrs.extend(addr for addr in words if addr not in addrs)
+        return addrs
+
+    def decode(self, words):
+        # {addr: word} to the value of every register/IO bit held by the read
+        # words (None when a word could not be read)
+        values = {}
+        for name, reg in self.regmap.items():
+            if all(addr in words for addr in reg.words):
+                parts = [words[addr] for addr in reg.words]
+                values[name] = None if None in parts else reg.join(parts)
+        for name, io in self.iomap.items():
+            if io.addr in words:
+                values[name] = None if words[io.addr] is None else io.decode(words[io.addr])
+        return values
+
+    def decode_word(self, addr, word):
+        # all the IO bits of a word
+        return {name: self.iomap[name].decode(word) for name in self.words.get(addr, ())}
+
+
+if __name__ == "__main__":
+    fmap = FPGAMap.load()
+    for name, reg in fmap.regmap.items():
+        print(f"{name}: {[hex(a) for a in reg.words]}")
+    for addr, names in fmap.words.items():
+        print(f"{hex(addr)}: {names}")
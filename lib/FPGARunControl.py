@@ -1,12 +1,22 @@
 import serial
 import time
+from lib.FPGAMap import FPGAMap, FPGA_MAPFILE
+from lib.FPGADevice import WriteStats
 
 class FPGARunControl:
 
-   def __init__(self, port, baudrate = 115200):
+   def __init__(self, port, baudrate = 115200, write_mode = 'ack', ack_timeout = 0.5, retries = 2, mapfile = FPGA_MAPFILE):
       self.port = port
       self.baudrate = baudrate
       self.serial = None
+      # 'ack': write completes on the echo of the written value, 'sleep': fixed delay
+      self.write_mode = write_mode
+      self.ack_timeout = ack_timeout
+      self.retries = retries
+      self.write_stats = WriteStats()
+      # volatile words (strobes) are never written twice
+      fpga_map = mapfile if isinstance(mapfile, FPGAMap) else FPGAMap.load(mapfile)
+      self.volatile = fpga_map.volatile
 
    def connect(self):
       try:
@@ -23,9 +33,32 @@ class FPGARunControl:
       return int(self.serial.read_until('\r'.encode()).decode()[:-1], 16)
          
    def write_register(self, addr, value):
-      self.serial.write(f"{str(hex(addr))[2:]} {str(hex(value))[2:]}\r".encode())
-      time.sleep(0.1)
-      self.serial.read_all()
+      if self.write_mode == 'sleep':
+         self.serial.write(f"{str(hex(addr))[2:]} {str(hex(value))[2:]}\r".encode())
+         time.sleep(0.1)
+         self.serial.read_all()
+         return True
+      timeout = self.serial.timeout
+      self.serial.timeout = self.ack_timeout
+      try:
+         attempts = 1 if addr in self.volatile else 1 + self.retries
+         for attempt in range(attempts):
+            if attempt > 0:
+               self.write_stats.retries += 1
+            self.serial.reset_input_buffer()
+            t0 = time.perf_counter()
+            self.serial.write(f"{str(hex(addr))[2:]} {str(hex(value))[2:]}\r".encode())
+            reply = self.serial.read_until('\r'.encode())
+            try:
+               if reply.endswith('\r'.encode()) and int(reply.decode()[:-1], 16) == value:
+                  self.write_stats.record(time.perf_counter() - t0)
+                  return True
+            except ValueError:
+               pass
+         self.write_stats.failures += 1
+         return False
+      finally:
+         self.serial.timeout = timeout
 
    
 
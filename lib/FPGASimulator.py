@@ -0,0 +1,196 @@
+import os
+import sys
+import pty
+import tty
+import time
+import random
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGAMap import FPGAMap, FPGA_MAPFILE
+
+TICK_S = 1e-8       # FPGA clock tick (10 ns)
+
+class FPGASimulator:
+
+    # software model of the runcontrol board: the hex register protocol on a
+    # control pty and BAAB...FEEF event packets on a data pty. A laser_start
+    # strobe with laser_en set fires shots_num shots (0: until laser_en is
+    # cleared), the first one pps_delay after the next PPS and then every
+    # pulse_period; shots_cnt counts them. Simulated time runs time_scale
+    # times faster than the host clock
+
+    def __init__(self, mapfile=FPGA_MAPFILE, time_scale=1.0, echo=True):
+        self.map = mapfile if isinstance(mapfile, FPGAMap) else FPGAMap.load(mapfile)
+        self.time_scale = time_scale
+        # echo the written value back (firmware with write acknowledge)
+        self.echo = echo
+        self.words = {addr: 0 for addr in self.map.space}
+        self.lock = threading.Lock()
+        self.fire = threading.Event()
+        self.running = False
+        self.control_port = None
+        self.data_port = None
+        self.fds = []
+
+        self.t0 = time.monotonic()
+        self.t0_sim = time.time()
+
+        # idle board: clocks locked, no rain, covers closed
+        for name in ('pps_ok', 'jc_lock', 'vcxo_lock', 'norain', 'cover_raman_closed', 'cover_steer_closed'):
+            self.set_dio(name, True)
+        for name in ('cover_steer_open',):
+            self.set_dio(name, False)
+
+    def now(self):
+        return self.t0_sim + (time.monotonic() - self.t0) * self.time_scale
+
+    def sleep_until(self, t):
+        # wait for the simulated time t; returns False when stopped
+        while self.running:
+            dt = (t - self.now()) / self.time_scale
+            if dt <= 0:
+                return True
+            time.sleep(min(dt, 0.1))
+        return False
+
+    def _open(self):
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.fds.extend([master, slave])
+        return master, os.ttyname(slave)
+
+    def start(self):
+        control, self.control_port = self._open()
+        data, self.data_port = self._open()
+        self.running = True
+        threading.Thread(target=self.control_loop, args=(control,), daemon=True).start()
+        threading.Thread(target=self.fire_loop, args=(data,), daemon=True).start()
+        return self.control_port, self.data_port
+
+    def stop(self):
+        self.running = False
+        self.fire.set()
+        for fd in self.fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = []
+
+    def get_register(self, name):
+        reg = self.map.regmap[name]
+        with self.lock:
+            return reg.join([self.words[addr] for addr in reg.words])
+
+    def set_register(self, name, value):
+        reg = self.map.regmap[name]
+        with self.lock:
+            for addr, word in zip(reg.words, reg.split(value)):
+                self.words[addr] = word
+
+    def get_dio(self, name):
+        io = self.map.iomap[name]
+        with self.lock:
+            return io.decode(self.words[io.addr])
+
+    def set_dio(self, name, value):
+        # drive an input (limit switch, rain sensor...) from the test side
+        io = self.map.iomap[name]
+        with self.lock:
+            if bool(value) != io.inverted:
+                self.words[io.addr] = self.words[io.addr] | io.mask
+            else:
+                self.words[io.addr] = self.words[io.addr] & ~io.mask
+
+    def read_word(self, addr):
+        if 'unixtime' in self.map.regmap and addr in self.map.regmap['unixtime'].words:
+            self.set_register('unixtime', int(self.now()))
+        with self.lock:
+            return self.words.get(addr, 0)
+
+    def write_word(self, addr, value):
+        with self.lock:
+            self.words[addr] = value & 0xFFFF
+        if addr == self.map.iomap['laser_start'].addr:
+            if self.get_dio('laser_start'):
+                # strobe: cleared by the firmware once the shot sequence is armed
+                self.set_dio('laser_start', False)
+                if self.get_dio('laser_en'):
+                    self.set_register('shots_cnt', 0)
+                    self.fire.set()
+        if 'force_align' in self.map.iomap and addr == self.map.iomap['force_align'].addr:
+            self.set_dio('force_align', False)
+
+    def command(self, line):
+        parts = line.split()
+        try:
+            if len(parts) == 1:
+                return f"{self.read_word(int(parts[0], 16)):x}\r"
+            if len(parts) == 2:
+                value = int(parts[1], 16)
+                self.write_word(int(parts[0], 16), value)
+                return f"{value:x}\r" if self.echo else ""
+        except ValueError:
+            pass
+        return "?\r"
+
+    def control_loop(self, fd):
+        buf = b""
+        while self.running:
+            try:
+                data = os.read(fd, 1024)
+            except OSError:
+                return
+            if not data:
+                return
+            buf += data.replace(b"\r", b"\n")
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                if len(line.strip()) == 0:
+                    continue
+                reply = self.command(line.decode('ascii', 'ignore'))
+                if reply:
+                    os.write(fd, reply.encode())
+
+    def packet(self, t, count):
+        seconds = int(t)
+        counter = int((t - seconds) / TICK_S)
+        pps = 32767 + random.randint(-5, 5)
+        values = [seconds >> 16, seconds & 0xFFFF, counter >> 16, counter & 0xFFFF, pps, count & 0xFFFF]
+        return "BAAB" + "".join(f"{v:x}\r" for v in values) + "FEEF"
+
+    def fire_loop(self, fd):
+        while self.running:
+            self.fire.wait()
+            self.fire.clear()
+            if not self.running:
+                return
+            period = self.get_register('pulse_period') * TICK_S
+            nshots = self.get_register('shots_num')
+            t = int(self.now()) + 1 + self.get_register('pps_delay') * TICK_S
+            count = 0
+            while nshots == 0 or count < nshots:
+                if not self.sleep_until(t) or self.fire.is_set():
+                    break
+                if not self.get_dio('laser_en'):
+                    break
+                count += 1
+                self.set_register('shots_cnt', count)
+                try:
+                    os.write(fd, self.packet(t, count).encode())
+                except OSError:
+                    return
+                t += period if period > 0 else 1
+
+
+if __name__ == "__main__":
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    sim = FPGASimulator(time_scale=scale)
+    control, data = sim.start()
+    print(f"runcontrol: {control}")
+    print(f"data: {data}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
@@ -0,0 +1,172 @@
+import json
+import time
+import threading
+
+SUB_BITS = 4                # 16 sub-buckets per power of two (~6% resolution)
+SUB = 1 << SUB_BITS
+
+class LatencyHistogram:
+
+    # HDR-style histogram of integer microsecond values: log2 buckets split in
+    # linear sub-buckets. It rolls over two windows, so the snapshot covers
+    # between one and two windows of recent history; count and sum are totals
+
+    def __init__(self, window=60.0):
+        self.window = window
+        self.current = {}
+        self.previous = {}
+        self.rotated = time.monotonic()
+        self.count = 0
+        self.sum = 0.0
+
+    @staticmethod
+    def _index(v):
+        if v < SUB:
+            return v
+        shift = v.bit_length() - SUB_BITS - 1
+        return (shift + 1) * SUB + ((v >> shift) - SUB)
+
+    @staticmethod
+    def _value(idx):
+        # middle of the bucket
+        if idx < SUB:
+            return idx
+        shift = idx // SUB - 1
+        return (((idx % SUB) + SUB) << shift) + (1 << shift) // 2
+
+    def record(self, seconds):
+        now = time.monotonic()
+        if now - self.rotated >= self.window:
+            self.previous = self.current if now - self.rotated < 2 * self.window else {}
+            self.current = {}
+            self.rotated = now
+        idx = self._index(int(seconds * 1e6))
+        self.current[idx] = self.current.get(idx, 0) + 1
+        self.count += 1
+        self.sum += seconds
+
+    def percentiles(self, quantiles=(0.5, 0.9, 0.99, 1.0)):
+        # {quantile: seconds} over the rolling windows
+        buckets = dict(self.previous)
+        for idx, n in self.current.items():
+            buckets[idx] = buckets.get(idx, 0) + n
+        total = sum(buckets.values())
+        result = {}
+        if total == 0:
+            return result
+        for q in quantiles:
+            rank = max(1, int(q * total + 0.5))
+            seen = 0
+            for idx in sorted(buckets):
+                seen += buckets[idx]
+                if seen >= rank:
+                    result[q] = self._value(idx) * 1e-6
+                    break
+        return result
+
+
+class FPGATracer:
+
+    # opt-in record of every FPGA bus transaction: per register name (IO words
+    # as dio_<addr>) and direction it keeps counters of transactions, bytes,
+    # retries and errors and a rolling histogram of the wire time (command sent
+    # to reply received); transfers keep the time spent waiting for the mutex
+
+    def __init__(self, fmap=None, window=60.0):
+        self.window = window
+        self.lock = threading.Lock()
+        self.names = {}
+        if fmap is not None:
+            self.set_map(fmap)
+        self.stats = {}
+        self.mutex_wait = LatencyHistogram(window)
+        self.transfers = 0
+        self.started = time.time()
+
+    def set_map(self, fmap):
+        self.names = {}
+        for name, reg in fmap.regmap.items():
+            for addr in reg.words:
+                self.names[addr] = name
+        for addr in fmap.words:
+            self.names[addr] = f"dio_{addr:02x}"
+
+    def record(self, kind, addr, nbytes, wire, retries=0, error=None):
+        key = (self.names.get(addr, f"addr_{addr:02x}"), kind)
+        with self.lock:
+            s = self.stats.get(key, None)
+            if s is None:
+                s = {'count': 0, 'bytes': 0, 'retries': 0, 'errors': {}, 'latency': LatencyHistogram(self.window)}
+                self.stats[key] = s
+            s['count'] += 1
+            s['bytes'] += nbytes
+            s['retries'] += retries
+            if error is not None:
+                s['errors'][error] = s['errors'].get(error, 0) + 1
+            else:
+                s['latency'].record(wire)
+
+    def record_transfer(self, mutex_wait):
+        with self.lock:
+            self.transfers += 1
+            self.mutex_wait.record(mutex_wait)
+
+    def snapshot(self):
+        with self.lock:
+            items = []
+            for (name, kind), s in sorted(self.stats.items()):
+                items.append({
+                    'name': name,
+                    'dir': kind,
+                    'count': s['count'],
+                    'bytes': s['bytes'],
+                    'retries': s['retries'],
+                    'errors': dict(s['errors']),
+                    'latency_sum': s['latency'].sum,
+                    'latency': {str(q): v for q, v in s['latency'].percentiles().items()},
+                })
+            return {
+                'time': time.time(),
+                'since': self.started,
+                'transfers': self.transfers,
+                'mutex_wait_sum': self.mutex_wait.sum,
+                'mutex_wait': {str(q): v for q, v in self.mutex_wait.percentiles().items()},
+                'registers': items,
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        return FPGATracer.prometheus(self.snapshot())
+
+    @staticmethod
+    def prometheus(snap):
+        # Prometheus text exposition format of a snapshot
+        lines = [
+            "# TYPE fpga_transfers_total counter",
+            f"fpga_transfers_total {snap['transfers']}",
+            "# TYPE fpga_mutex_wait_seconds summary",
+        ]
+        for q, v in snap['mutex_wait'].items():
+            lines.append(f'fpga_mutex_wait_seconds{{quantile="{q}"}} {v:.6f}')
+        lines.append(f"fpga_mutex_wait_seconds_sum {snap['mutex_wait_sum']:.6f}")
+        lines.append(f"fpga_mutex_wait_seconds_count {snap['transfers']}")
+
+        counters = [('fpga_transactions_total', 'count'), ('fpga_bytes_total', 'bytes'), ('fpga_retries_total', 'retries')]
+        for metric, field in counters:
+            lines.append(f"# TYPE {metric} counter")
+            for item in snap['registers']:
+                lines.append(f'{metric}{{name="{item["name"]}",dir="{item["dir"]}"}} {item[field]}')
+        lines.append("# TYPE fpga_errors_total counter")
+        for item in snap['registers']:
+            for error, n in item['errors'].items():
+                lines.append(f'fpga_errors_total{{name="{item["name"]}",dir="{item["dir"]}",kind="{error}"}} {n}')
+        lines.append("# TYPE fpga_wire_seconds summary")
+        for item in snap['registers']:
+            labels = f'name="{item["name"]}",dir="{item["dir"]}"'
+            for q, v in item['latency'].items():
+                lines.append(f'fpga_wire_seconds{{{labels},quantile="{q}"}} {v:.6f}')
+            lines.append(f"fpga_wire_seconds_sum{{{labels}}} {item['latency_sum']:.6f}")
+            lines.append(f"fpga_wire_seconds_count{{{labels}}} {item['count'] - sum(item['errors'].values())}")
+        return "\n".join(lines) + "\n"
@@ -20,7 +20,7 @@ class HouseKeeping:
 
     __subscribers = []
 
-    def __init__(self, params):
+    def __init__(self, params, laser=None):
         self.spi1 = SpiController()
         self.spi1.configure('ftdi://ftdi:4232h/1')
         self.slave1 = self.spi1.get_port(cs=0, freq=2E6, mode=0)
@@ -37,6 +37,8 @@ class HouseKeeping:
         self.gps_thr = None
 
         self.params = params
+        # LaserTelemetry: 'laser' sensors are its latest sample
+        self.laser = laser
         self.identity = str.lower(self.params['identity'])
 
         self.log = logging.getLogger("housekeeping")
@@ -89,6 +91,12 @@ class HouseKeeping:
             self.gpsd.next()
 
     def collect_data(self):
+        # all the DIO bits in a single bus sweep
+        names = [d['name'] for d in self.data if d['dev'] == 'dio']
+        if 'rain' in names:
+            names.append('norain')
+        snap = self.fpga.snapshot(names) if len(names) else None
+        laser = self.laser.latest(60) if self.laser is not None else None
         for d in self.data:
             if d['dev'] == 'tla':
                 if d['name'] == 'rain':
@@ -100,10 +108,12 @@ class HouseKeeping:
                 d['value'] = round(self.tcont.read_temperature(d['channel']), 2)
             elif d['dev'] == 'dio':
                 if d['name'] == 'rain':
-                    d['error'] = self.fpga.read_dio('rain') == self.fpga.read_dio('norain')
-                    d['value'] = self.fpga.read_dio('rain')
+                    d['error'] = snap['rain'] == snap['norain']
+                    d['value'] = snap['rain']
                 else:
-                    d['value'] = self.fpga.read_dio(d['name'])
+                    d['value'] = snap[d['name']]
+            elif d['dev'] == 'laser':
+                d['value'] = laser[d['field']] if laser is not None else None
             elif d['dev'] == 'gps':
                 if d['name'] == 'gps_fix':
                     d['value'] = self.gpsd.fix.mode > 1
@@ -0,0 +1,128 @@
+import math
+import time
+import threading
+import multiprocessing
+import numpy as np
+
+# one sample: host time, $STATUS bytes, $TEMPS, $SHOT and $USHOT counters;
+# NaN where the reply was missing
+FIELDS = ['time', 'state', 'sbyte', 'hbyte1', 'hbyte2', 'hbyte3',
+    'head_temp', 'dump_temp', 'plate_temp', 'shots', 'ushots']
+NFIELDS = len(FIELDS)
+
+class LaserTelemetry:
+
+    # low-priority poller of the Centurion state. Samples go into a ring in
+    # shared memory, created with the device collection in the main process
+    # so that run children (fire_auth, fire) and housekeeping read the same
+    # data. Each query takes the laser port lock on its own, without
+    # waiting: a query is skipped when command traffic holds the port, so
+    # commands never wait for more than one telemetry query. Polling pauses
+    # while the laser outlet is recorded off, and the queries are logged at
+    # DEBUG only
+
+    def __init__(self, laser, period=1.0, size=3600):
+        self.laser = laser
+        self.period = period
+        self.size = size
+        self.ring = multiprocessing.Array('d', size * NFIELDS)
+        self.count = multiprocessing.Value('q', 0)
+        self.running = False
+        self.thread = None
+        self.skipped = 0
+        self.paused = 0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.poll_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def query(self, command):
+        # reply split in fields, None if the port is busy or no reply
+        if not self.laser.lock.acquire(block=False):
+            return None
+        try:
+            response = self.laser.send_command(command, timeout=self.period, quiet=True)
+        finally:
+            self.laser.lock.release()
+        if not response or response == -1:
+            return None
+        return response.split()
+
+    def sample(self):
+        values = dict.fromkeys(FIELDS, math.nan)
+        values['time'] = time.time()
+        parts = self.query("$STATUS ?")
+        if parts and len(parts) == 6 and parts[0] == '$STATUS':
+            for name, part in zip(['state', 'sbyte', 'hbyte1', 'hbyte2', 'hbyte3'], parts[1:]):
+                try:
+                    values[name] = int(part, 16)
+                except ValueError:
+                    pass
+        parts = self.query("$TEMPS ?")
+        if parts and len(parts) == 4 and parts[0] == '$TEMPS':
+            for name, part in zip(['head_temp', 'dump_temp', 'plate_temp'], parts[1:]):
+                try:
+                    values[name] = int(part)
+                except ValueError:
+                    pass
+        for name, command in (('shots', "$SHOT ?"), ('ushots', "$USHOT ?")):
+            parts = self.query(command)
+            if parts and len(parts) >= 2 and parts[0] == command.split()[0]:
+                try:
+                    values[name] = int(parts[1])
+                except ValueError:
+                    pass
+        return values
+
+    def append(self, values):
+        with self.ring.get_lock():
+            i = self.count.value % self.size
+            self.ring.get_obj()[i * NFIELDS:(i + 1) * NFIELDS] = [values[name] for name in FIELDS]
+            self.count.value += 1
+
+    def poll_loop(self):
+        while self.running:
+            t0 = time.monotonic()
+            if not self.laser.store.powered(self.laser.outlet):
+                self.paused += 1
+                time.sleep(self.period)
+                continue
+            values = self.sample()
+            if all(math.isnan(values[name]) for name in FIELDS[1:]):
+                self.skipped += 1
+            else:
+                self.append(values)
+            time.sleep(max(0, self.period - (time.monotonic() - t0)))
+
+    def latest(self, max_age=None):
+        # last sample as a dict, None if there is none or it is older than
+        # max_age seconds
+        with self.ring.get_lock():
+            n = self.count.value
+            if n == 0:
+                return None
+            i = (n - 1) % self.size
+            values = dict(zip(FIELDS, self.ring.get_obj()[i * NFIELDS:(i + 1) * NFIELDS]))
+        if max_age is not None and time.time() - values['time'] > max_age:
+            return None
+        return values
+
+    def history(self, n=None):
+        # the last n samples (all those kept if None), oldest first, as an
+        # (n, NFIELDS) array
+        with self.ring.get_lock():
+            count = self.count.value
+            data = np.frombuffer(self.ring.get_obj(), np.float64).reshape(self.size, NFIELDS).copy()
+        kept = min(count, self.size)
+        n = kept if n is None else min(n, kept)
+        idx = (np.arange(count - n, count)) % self.size
+        return data[idx]
@@ -1,6 +1,10 @@
+import os
+import sys
 import serial
 import re
 import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.DeviceState import DeviceState
 
 class RPCDevice:
 
@@ -33,7 +37,7 @@ class RPCDevice:
         return wrapper
 
     def add_outlet(self, id, name):
-        self.outlets[name] = RPCOutlet(self.serial, id)
+        self.outlets[name] = RPCOutlet(self.serial, id, name)
         return self.outlets[name]
 
     def get_outlet(self, name):
@@ -64,7 +68,10 @@ class RPCDevice:
             if match:
                 map[match.group(1)] = {"device": str.rstrip(match.group(2)), "state": match.group(3)}
 
-        return str.lower(map[str(self.id)]['state']) == 'on'        
+        on = str.lower(map[str(self.id)]['state']) == 'on'
+        # power-cycle epoch of the devices behind the outlet
+        self.store.outlet_state(self.name, on)
+        return on
 
     def set(self, id, state):
         cmd = ["off", "on"]
@@ -106,7 +113,12 @@ class RPCDevice:
 
 class RPCOutlet(RPCDevice):
 
-    def __init__(self, serial, id):
+    def __init__(self, serial, id, name=None):
         self.serial = serial
         self.id = id
+        self.name = name if name is not None else str(id)
+        self.store = DeviceState()
+
+    def epoch(self):
+        return self.store.epoch(self.name)
 
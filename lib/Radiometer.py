@@ -1,22 +1,41 @@
+import os
+import sys
+import time
 import serial
 import logging
 import datetime
+import threading
+from collections import deque, namedtuple
 from functools import partial
 from logging.handlers import TimedRotatingFileHandler
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.DeviceState import DeviceState
 
 RADIOMETER_WAIT = 2
 
+# host_time: time.time() when the line was received; status 'ok' or 'parse'
+# (line not understood, value is None)
+RadiometerSample = namedtuple('RadiometerSample', ['host_time', 'value', 'status'])
+
 class Radiometer:
 
     model: str = "unknown"
+    # settings applied by setup and the query that checks the instrument
+    # still answers when they are taken from the cache
+    settings: dict = {}
+    verify: str = None
 
-    def __init__(self, port, baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=1):
+    def __init__(self, port, baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=1, outlet='radiometer'):
         self.port = None
         self.serial = None
         self.ready = False
         self.params = locals()
         self.params.pop('port')
         self.params.pop('self')
+        self.params.pop('outlet')
+        # RPC outlet powering the instrument: its epoch tells a power cycle
+        self.outlet = outlet
+        self.store = DeviceState()
 
         try:
             self.serial = serial.Serial(**self.params)
@@ -26,6 +45,15 @@ class Radiometer:
 
         self.serial.port = port
 
+        # streaming mode: a reader thread parses every energy line into the
+        # queue, the oldest samples are dropped when it is full
+        self.reader = None
+        self.running = False
+        self.queue = None
+        self.arrived = threading.Event()
+        self.overflows = 0
+        self.line = bytearray()
+
         self.logger = logging.getLogger("device")
         self.logger.setLevel(logging.INFO)
         if not self.logger.handlers:
@@ -46,6 +74,128 @@ class Radiometer:
     def is_ready(self):
         return self.ready
 
+    def configure(self, settings):
+        # send the settings ({label: value}) the instrument does not have
+        # yet. Those applied since the last power cycle of the outlet are
+        # cached in DeviceState with the reply to the verify query taken
+        # after them; when the cache is valid a single verify query, whose
+        # reply must match the cached one, replaces the round trips.
+        # Returns the labels sent
+        key = f"radiometer/{self.serial.port}"
+        epoch = self.store.epoch(self.outlet)
+        cached = self.store.get(key, {})
+        applied = cached.get('settings', {}) if cached.get('epoch', None) == epoch else {}
+        reply = None
+        if applied and self.verify is not None:
+            reply = self.get(self.verify)
+            if reply is None:
+                self.log(logging.WARNING, f"RADM_MON_{self.model}:CONFIGURE: no reply to {self.verify}, cached settings dropped")
+                applied = {}
+            elif self.parse_verify(reply) != cached.get('verify', None):
+                self.log(logging.WARNING, f"RADM_MON_{self.model}:CONFIGURE: {self.verify} reply {reply} differs from the cached one, cached settings dropped")
+                applied = {}
+        sent = []
+        for label, value in settings.items():
+            if applied.get(label, None) == value:
+                continue
+            sent.append(label)
+            applied.pop(label, None)
+            if self.set(label, value) is not None:
+                applied[label] = value
+        state = {'epoch': epoch, 'settings': applied}
+        if self.verify is not None:
+            if sent or reply is None:
+                reply = self.get(self.verify)
+            if reply is not None:
+                state['verify'] = self.parse_verify(reply)
+            else:
+                state['settings'] = {}
+        self.store.set(key, state)
+        return sent
+
+    @staticmethod
+    def parse_verify(reply):
+        # the part of the verify reply compared with the cache
+        return ' '.join(reply.split())
+
+    @staticmethod
+    def parse_power(line):
+        # energy of a streamed line, None if not a reading
+        return None
+
+    def start(self, maxlen=10000):
+        # continuous acquisition (after setup: commands can not be sent
+        # while streaming, the reader would take their replies)
+        if self.running:
+            return
+        if self.serial.is_open is False:
+            self.serial.open()
+        self.queue = deque(maxlen=maxlen)
+        self.line.clear()
+        self.running = True
+        self.reader = threading.Thread(target=self.reader_loop, daemon=True)
+        self.reader.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.reader is not None and self.reader is not threading.current_thread():
+            self.reader.join()
+        self.reader = None
+
+    def reader_loop(self):
+        self.serial.timeout = 0.2
+        while self.running:
+            try:
+                self.line += self.serial.read_until("\r".encode())
+            except (serial.SerialException, OSError):
+                time.sleep(0.2)
+                continue
+            if not self.line.endswith(b"\r"):
+                continue
+            text = self.line[:-1].decode(errors='ignore').strip()
+            self.line.clear()
+            if not text:
+                continue
+            value = self.parse_power(text)
+            if len(self.queue) == self.queue.maxlen:
+                self.overflows += 1
+            self.queue.append(RadiometerSample(time.time(), value, 'ok' if value is not None else 'parse'))
+            self.arrived.set()
+        self.serial.timeout = self.params['timeout']
+
+    def get_sample(self, timeout=None):
+        # next sample, None if nothing arrives within timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self.queue.popleft()
+            except IndexError:
+                pass
+            self.arrived.clear()
+            if len(self.queue):
+                continue
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            if not self.arrived.wait(remaining):
+                return None
+
+    def drain(self):
+        # every sample received so far, without waiting
+        samples = []
+        while self.queue:
+            samples.append(self.queue.popleft())
+        return samples
+
+    def pop_power(self, timeout=None):
+        # streaming read_power: -1 on timeout or on a line not understood
+        sample = self.get_sample(self.params['timeout'] if timeout is None else timeout)
+        if sample is None or sample.status != 'ok':
+            return -1
+        return sample.value
+
     @staticmethod
     def check_open(func):
         def wrapper(self, *args, **kwargs):
@@ -87,6 +237,8 @@ class Radiometer:
 class Radiometer3700(Radiometer):
 
     model = "3700"
+    settings = {"TG": 3, "SS": 0, "FA": 1.00, "EV": 1, "BS": 0, "RA": 2}
+    verify = "AD"
 
     def info(self):
         #self.flush_buffers()
@@ -126,27 +278,31 @@ class Radiometer3700(Radiometer):
         return None
 
     def setup(self):
+        sent = []
         try:
             #self.flush_buffers()
-            self.set("TG", 3)
-            self.set("SS", 0)
-            self.set("FA", 1.00)
-            self.set("EV", 1)
-            self.set("BS", 0)
-            self.set("RA", 2)
-            self.get("AD")
+            sent = self.configure(self.settings)
         except Exception as e:
             #print(f"RADM_MON_{self.model}:SET_UP:ERROR:Some problem occurred: {e}")
             self.log(logging.ERROR, f"RADM_MON_{self.model}:SET_UP:ERROR:Some problem occurred: {e}")
             
-        self.log(logging.INFO, f"RADM_MON_{self.model}:SET_UP: Radiometer setup completed")
+        self.log(logging.INFO, f"RADM_MON_{self.model}:SET_UP: Radiometer setup completed (sent {sent})")
         self.ready = True
 
     def set_range(self, range):
         self.flush_buffers()
-        self.set("RA", range)
+        self.configure({"RA": range})
+
+    @staticmethod
+    def parse_power(line):
+        try:
+            return float(line)
+        except ValueError:
+            return None
 
-    def read_power(self):
+    def read_power(self, timeout=None):
+        if self.running:
+            return self.pop_power(timeout)
         value = 0
         if (self.ready == True):
             # 10-3 Joule unit
@@ -165,6 +321,8 @@ class Radiometer3700(Radiometer):
 class RadiometerOphir(Radiometer):
 
     model = "OPHIR"
+    settings = {"$DU": 1, "$CS": "1 0 1"}
+    verify = "$II"
 
     @Radiometer.check_open
     def get(self, label):
@@ -214,19 +372,30 @@ class RadiometerOphir(Radiometer):
             return -1
 
     def setup(self):
+        sent = []
         try:
             self.flush_buffers()
-            self.set("$DU", 1)
-            self.set("$CS", "1 0 1")
+            sent = self.configure(self.settings)
         except Exception as e:
             #print(f"RADM_MON_{self.model}:SET_UP:ERROR:Some problem occurred: {e}")
             self.log(logging.ERROR, f"RADM_MON_{self.model}:SET_UP:ERROR:Some problem occurred: {e}")
 
         #print(f"RADM_MON_{self.model}:SET_UP done")
-        self.log(logging.INFO, f"RADM_MON_{self.model}:SET_UP: Radiometer setup completed")
+        self.log(logging.INFO, f"RADM_MON_{self.model}:SET_UP: Radiometer setup completed (sent {sent})")
         self.ready = True
 
-    def read_power(self):
+    @staticmethod
+    def parse_power(line):
+        if "*" not in line:
+            return None
+        try:
+            return float(line.replace("*", ""))
+        except ValueError:
+            return None
+
+    def read_power(self, timeout=None):
+        if self.running:
+            return self.pop_power(timeout)
         if (self.ready == True):
             # 10-3 Joule unit
             result = self.serial.read_until("\r".encode())[:-1].decode(errors='ignore')
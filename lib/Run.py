@@ -1,12 +1,20 @@
 
 import time
+import signal
 import datetime
 import logging
+import threading
 import paramiko
 from functools import partial
 from enum import Enum
 from logging.handlers import TimedRotatingFileHandler
 from lib.DeviceCollection import DeviceCollection
+from lib.FPGADevice import PollPolicy
+from lib.RunData import RunData, RunDataWriter, rundata_path, FLAG_NO_EVENT, FLAG_NO_POWER
+from lib.ShotAlign import align_rundata, report
+from lib.SerialRecorder import SerialRecorder, serial_path
+from lib.ShotStats import ShotStats
+from lib.VXM import Program
 from lib.Helpers import *
 
 class RunType(Enum):
@@ -16,8 +24,13 @@ class RunType(Enum):
     CALIB = 4,
     MOCK = 5,
 
+STATS_LOG_S = 60        # period of the shot statistics in run.log
+
 class RunBase:
 
+    # shot sections: one statistics stream each
+    sections = ['energy']
+
     def __init__(self, dc : DeviceCollection, params):
         self.dc = dc
         self.params = params
@@ -33,7 +46,93 @@ class RunBase:
             self.logger.addHandler(handler)
         self.log = partial(self.logger.log, extra={'classname': self.__class__.__name__})
 
+        # calendar entry (set by RunManager), FPGA profile and shot data file
+        self.entry = None
+        self.profile = {}
+        self.shots = None
+        self.recorder = None
+        # shared with the parent process (status command, housekeeping)
+        self.stats = ShotStats(self.sections)
+        self.stats_logged = 0
+
+    def open_shots(self, capacity):
+        runtype = self.__class__.__name__[len('Run'):]
+        entry = None
+        if self.entry is not None:
+            entry = {'start_time': str(self.entry.start_time), 'runtype': self.entry.runtype.name,
+                'first': self.entry.first, 'last': self.entry.last}
+        header = {'run_type': runtype, 'identity': self.identity, 'profile': self.profile,
+            'entry': entry, 'sections': self.sections}
+        self.shots = RunDataWriter(rundata_path(runtype, self.identity), capacity, header)
+        self.log(logging.INFO, f"shot data in {self.shots.path}")
+        self.stats.reset(capacity)
+        self.stats_logged = time.monotonic()
+
+    def record_shot(self, sample, event, section=0):
+        # sample from Radiometer.get_sample, event from FPGAData.get (None on
+        # timeout); the two are paired again by time in close_shots, not by
+        # loop order
+        flags = 0
+        power_time = time.time() if sample is None else sample.host_time
+        if sample is None or sample.status != 'ok':
+            power = float('nan')
+            flags |= FLAG_NO_POWER
+        else:
+            power = sample.value
+        if event is None:
+            self.shots.append(host_time=time.time(), power_time=power_time, power=power,
+                section=section, flags=flags | FLAG_NO_EVENT)
+        else:
+            self.shots.append(host_time=event.host_time, power_time=power_time, power=power, seconds=event.seconds,
+                counter=event.counter, pps_delta=event.pps_delta, counter_pulses=event.counter_pulses,
+                section=section, flags=flags)
+        self.stats.add(power, section, power_time)
+        if time.monotonic() - self.stats_logged >= STATS_LOG_S:
+            self.stats_logged = time.monotonic()
+            self.log(logging.INFO, f"shot statistics: {self.stats.summary()}")
+
+    def close_shots(self):
+        if self.shots is None:
+            return
+        self.shots.close()
+        self.log(logging.INFO, f"shot statistics: {self.stats.summary()}")
+        self.log(logging.INFO, f"{self.shots.count} shots written to {self.shots.path} ({self.shots.dropped} dropped)")
+        try:
+            self.log(logging.INFO, f"shot alignment: {report(align_rundata(RunData(self.shots.path)))}")
+        except Exception as e:
+            self.log(logging.ERROR, f"shot alignment failed: {e}")
+        self.shots = None
+
+    def start_recording(self):
+        # raw byte streams of the event port, laser and radiometers for
+        # replay (SerialRecorder); on unless serial_record is false
+        if not self.params[self.identity].get('serial_record', True):
+            return
+        try:
+            self.recorder = SerialRecorder(serial_path(self.__class__.__name__[len('Run'):], self.identity))
+            self.recorder.attach(self.dc.data, 'data')
+            self.recorder.attach(self.dc.laser, 'laser')
+            for name, radiometer in self.dc.radiometers.items():
+                self.recorder.attach(radiometer, f"radiometer_{name}")
+        except Exception as e:
+            self.log(logging.ERROR, f"serial recording not started: {e}")
+            self.stop_recording()
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+        self.recorder.close()
+        self.log(logging.INFO, f"{self.recorder.bytes} serial bytes recorded in {self.recorder.path}")
+        self.recorder = None
+
+    def terminate(self, signum, frame):
+        raise SystemExit(f"run terminated by signal {signum}")
+
     def execute(self, do_prepare=True, do_finish=True):
+        # RunManager stop/kill end the run process with SIGTERM: it unwinds
+        # through the finally below so that the shots taken are kept
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.terminate)
         ret = None
         if do_prepare:
             try:
@@ -41,10 +140,14 @@ class RunBase:
             except Exception as e:
                 self.log(logging.ERROR, f"exception occurred during prepare: {e}")
         if ret == 0:        # check if run preparation is completed
+            self.start_recording()
             try:
                 self.run()
             except Exception as e:
                 self.log(logging.ERROR, f"exception occurred during run: {e}") 
+            finally:
+                self.stop_recording()
+                self.close_shots()
         if do_finish:
             try:
                 self.finish()
@@ -78,23 +181,27 @@ class RunRaman(RunBase):
         super().__init__(dc, params)
 
         self.nshots = 75000
+        self.pulse_period = 1_000_000   # 10 ms
+        self.cover_timeout_s = 120
 
     def prepare(self):
         self.log(logging.INFO, "configure FPGA registers for RAMAN run")
-        self.dc.fpga.write_register('pps_delay', 0)
-        self.dc.fpga.write_bit('laser_en', 1)
-        self.dc.fpga.write_bit('timestamp_en', 0)
-        self.dc.fpga.write_register('pulse_width', 10_000)  # 100 us
-        self.dc.fpga.write_register('pulse_energy', 17_400) # 140 us = 174 us, maximum
-        self.dc.fpga.write_register('pulse_period', 1_000_000) # 10 ms
-        self.dc.fpga.write_register('shots_num', self.nshots)
-
-        self.dc.fpga.write_register('mux_bnc_0', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_1', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_2', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_3', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_4', 0b0010)
-        self.log(logging.INFO, "done")
+        self.profile = {
+            'pps_delay': 0,
+            'pulse_width': 10_000,      # 100 us
+            'pulse_energy': 17_400,     # 140 us = 174 us, maximum
+            'pulse_period': self.pulse_period,
+            'shots_num': self.nshots,
+            'mux_bnc_0': 0b0010,
+            'mux_bnc_1': 0b0010,
+            'mux_bnc_2': 0b0010,
+            'mux_bnc_3': 0b0010,
+            'mux_bnc_4': 0b0010,
+            'laser_en': 1,
+            'timestamp_en': 0,
+        }
+        written = self.dc.fpga.apply_profile(self.profile)
+        self.log(logging.INFO, f"done - written {written}")
         
         self.log(logging.INFO, "turn on inverter")
         if self.dc.fpga.read_dio('inverter') == True:
@@ -155,14 +262,9 @@ class RunRaman(RunBase):
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "wait for cover opening...")
-        cover_timeout_s = 120
-        t = 0
-        while self.dc.fpga.read_dio('cover_raman_open') == self.dc.fpga.read_dio('cover_raman_closed'):
-            if t >= cover_timeout_s:
-                self.log(logging.ERROR, f"cover open timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.wait_cover_moved():
+            self.log(logging.ERROR, f"cover open timeout ({self.cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "laser warmup and wait for laser fire auth")
@@ -204,13 +306,11 @@ class RunRaman(RunBase):
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "wait for laser shots end")
-        while True:
-            ns = self.dc.fpga.read_register('shots_cnt')
-            if ns == self.nshots:
-                break
-            self.log(logging.INFO, f'shots: {ns}')
-            time.sleep(20)
-        self.log(logging.INFO, "done")
+        # poll slowly during the run and fast around its expected end
+        expected = time.monotonic() + self.nshots * self.pulse_period * 1e-8
+        policy = PollPolicy(slow=20, expected=expected)
+        ns = self.dc.fpga.wait_for_register('shots_cnt', lambda ns: ns >= self.nshots, policy=policy)
+        self.log(logging.INFO, f"done - shots: {ns}")
 
         self.log(logging.INFO, "waiting for RAMAN DAQ process to finish...")
         while True:
@@ -235,26 +335,16 @@ class RunRaman(RunBase):
         WAIT_UNTIL_TRUE(self.dc.get_outlet("RAMAN_cover").off)
         self.log(logging.INFO, "done")
 
-        cover_timeout_s = 120
-        t = 0
         self.log(logging.INFO, "wait for open limit switch release")
-        while self.dc.fpga.read_dio('cover_raman_open') == True:
-            if t >= cover_timeout_s:
-                self.log(logging.ERROR, f"limit switch release timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.dc.fpga.wait_for_dio('cover_raman_open', False, self.cover_timeout_s, PollPolicy(slow=0.2)):
+            self.log(logging.ERROR, f"limit switch release timeout ({self.cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
 
-        cover_timeout_s = 120
-        t = 0
         self.log(logging.INFO, "wait cover closing")
-        while self.dc.fpga.read_dio('cover_raman_open') == self.dc.fpga.read_dio('cover_raman_closed'):
-            if t >= laser_timeout_s:
-                self.log(logging.ERROR, f"cover close timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.wait_cover_moved():
+            self.log(logging.ERROR, f"cover close timeout ({self.cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
         
         time.sleep(2)
@@ -294,26 +384,16 @@ class RunRaman(RunBase):
         WAIT_UNTIL_TRUE(self.dc.get_outlet("RAMAN_cover").off)
         self.log(logging.INFO, "done")
 
-        cover_timeout_s = 120
-        t = 0
         self.log(logging.INFO, "wait for open limit switch release")
-        while self.dc.fpga.read_dio('cover_raman_open') == True:
-            if t >= cover_timeout_s:
-                self.log(logging.ERROR, f"limit switch release timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.dc.fpga.wait_for_dio('cover_raman_open', False, self.cover_timeout_s, PollPolicy(slow=0.2)):
+            self.log(logging.ERROR, f"limit switch release timeout ({self.cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
 
-        cover_timeout_s = 120
-        t = 0
         self.log(logging.INFO, "wait cover closing")
-        while self.dc.fpga.read_dio('cover_raman_open') == self.dc.fpga.read_dio('cover_raman_closed'):
-            if t >= laser_timeout_s:
-                self.log(logging.ERROR, f"cover close timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.wait_cover_moved():
+            self.log(logging.ERROR, f"cover close timeout ({self.cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "unselect RAMAN beam")
@@ -321,6 +401,13 @@ class RunRaman(RunBase):
         self.log(logging.INFO, "done")
         
         self.finish()
+
+    def wait_cover_moved(self):
+        # cover is at one of its end positions when exactly one limit switch is set
+        values = self.dc.fpga.wait_for(['cover_raman_open', 'cover_raman_closed'],
+            lambda v: v['cover_raman_open'] != v['cover_raman_closed'],
+            self.cover_timeout_s, PollPolicy(slow=0.2))
+        return values is not None
         
 
 class RunFD(RunBase):
@@ -333,21 +420,22 @@ class RunFD(RunBase):
         self.log(logging.INFO, "prepare")
         self.log(logging.INFO, "configure FPGA registers for FD run")
         value = self.params[self.identity]['fd_pps_delay']
-        self.dc.fpga.write_register('pps_delay', value) 
-        self.dc.fpga.write_bit('laser_en', 1)
-        self.dc.fpga.write_bit('timestamp_en', 0)
-
-        self.dc.fpga.write_register('pulse_width', 10_000)  # 100 us
-        self.dc.fpga.write_register('pulse_energy', 17_400) # 140 us = 174 us, maximum
-        self.dc.fpga.write_register('pulse_period', 100_000_000)  # 1000 ms 1 hz
-        self.dc.fpga.write_register('shots_num', self.nshots)
-
-        self.dc.fpga.write_register('mux_bnc_0', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_1', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_2', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_3', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_4', 0b0010)
-        self.log(logging.INFO, "done")
+        self.profile = {
+            'pps_delay': value,
+            'pulse_width': 10_000,          # 100 us
+            'pulse_energy': 17_400,         # 140 us = 174 us, maximum
+            'pulse_period': 100_000_000,    # 1000 ms 1 hz
+            'shots_num': self.nshots,
+            'mux_bnc_0': 0b0010,
+            'mux_bnc_1': 0b0010,
+            'mux_bnc_2': 0b0010,
+            'mux_bnc_3': 0b0010,
+            'mux_bnc_4': 0b0010,
+            'laser_en': 1,
+            'timestamp_en': 0,
+        }
+        written = self.dc.fpga.apply_profile(self.profile)
+        self.log(logging.INFO, f"done - written {written}")
         
         self.log(logging.INFO, "turn on inverter")
         if self.dc.fpga.read_dio('inverter') == True:
@@ -432,14 +520,24 @@ class RunFD(RunBase):
 
     def run(self):
         self.log(logging.INFO, "start FD Run")
-        self.dc.fpga.write_dio('laser_en', 1)
-        self.dc.fpga.write_dio('laser_start', 1)
+        self.open_shots(self.nshots)
+        radiometer = self.dc.get_radiometer('Rad1')
+        radiometer.start()
+        try:
+            self.dc.data.start()
+            self.dc.data.drain()
+            radiometer.drain()
+            self.dc.fpga.write_dio('laser_en', 1)
+            self.dc.fpga.write_dio('laser_start', 1)
+
+            for _ in range(self.nshots):
+                event = self.dc.data.get(self.dc.data.timeout)
+                self.record_shot(radiometer.get_sample(self.dc.data.timeout), event)
+        finally:
+            self.dc.data.stop()
+            radiometer.stop()
+        self.close_shots()
 
-        for i in range(self.nshots):
-            power=self.dc.get_radiometer('Rad1').read_power()
-            seconds, counter, pps, counter_cycles = self.dc.data.read_event()
-            self.log(logging.INFO, f'power {i} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
-        
         self.log(logging.INFO, "set laser standby")
         self.dc.laser.standby()
         self.log(logging.INFO, "done")
@@ -504,20 +602,22 @@ class RunTank(RunBase):
         self.log(logging.INFO, "prepare")
         #print("configure FPGA registers for TANK run ({self.tankname})...")
         value = self.params[self.identity]['tank_pps_delay']
-        self.dc.fpga.write_register('pps_delay', value) 
-        self.dc.fpga.write_bit('laser_en', 1)
-        self.dc.fpga.write_register('pulse_width', 10_000)  # 100 us
-        self.dc.fpga.write_register('pulse_energy', 17_400) # 140 us = 174 us, maximum
-        #self.dc.fpga.write_register('pulse_period', 3_000_000_000) # 30_000 ms 
-        self.dc.fpga.write_register('pulse_period', 100_000_000)  # 1000 ms 1 hz
-        self.dc.fpga.write_register('shots_num', self.nshots)
-
-        self.dc.fpga.write_register('mux_bnc_0', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_1', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_2', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_3', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_4', 0b0010)
-        self.log(logging.INFO, "done")
+        self.profile = {
+            'pps_delay': value,
+            'pulse_width': 10_000,          # 100 us
+            'pulse_energy': 17_400,         # 140 us = 174 us, maximum
+            #'pulse_period': 3_000_000_000, # 30_000 ms
+            'pulse_period': 100_000_000,    # 1000 ms 1 hz
+            'shots_num': self.nshots,
+            'mux_bnc_0': 0b0010,
+            'mux_bnc_1': 0b0010,
+            'mux_bnc_2': 0b0010,
+            'mux_bnc_3': 0b0010,
+            'mux_bnc_4': 0b0010,
+            'laser_en': 1,
+        }
+        written = self.dc.fpga.apply_profile(self.profile)
+        self.log(logging.INFO, f"done - written {written}")
 
         self.log(logging.INFO, "turn on inverter")
         if self.dc.fpga.read_dio('inverter') == True: 
@@ -602,13 +702,23 @@ class RunTank(RunBase):
 
     def run(self):
         self.log(logging.INFO, f"start TANK Run ({self.tankname})")
-        self.dc.fpga.write_dio('laser_en', 1)
-        self.dc.fpga.write_dio('laser_start', 1)
-
-        for i in range(self.nshots):
-            power=self.dc.get_radiometer('Rad1').read_power()
-            seconds, counter, pps, counter_cycles = self.dc.data.read_event()
-            self.log(logging.INFO, f'power {i} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
+        self.open_shots(self.nshots)
+        radiometer = self.dc.get_radiometer('Rad1')
+        radiometer.start()
+        try:
+            self.dc.data.start()
+            self.dc.data.drain()
+            radiometer.drain()
+            self.dc.fpga.write_dio('laser_en', 1)
+            self.dc.fpga.write_dio('laser_start', 1)
+
+            for _ in range(self.nshots):
+                event = self.dc.data.get(self.dc.data.timeout)
+                self.record_shot(radiometer.get_sample(self.dc.data.timeout), event)
+        finally:
+            self.dc.data.stop()
+            radiometer.stop()
+        self.close_shots()
 
         self.log(logging.INFO, "set laser standby")
         self.dc.laser.standby()
@@ -664,6 +774,8 @@ class RunTank(RunBase):
 
 class RunCalib(RunBase):
 
+    sections = ['energy', 'pol_0', 'pol_90', 'pol_180']
+
     def __init__(self, dc : DeviceCollection, params):
         super().__init__(dc, params) 
         self.nshots = 15 
@@ -672,20 +784,22 @@ class RunCalib(RunBase):
         self.log(logging.INFO, "Prepare run for energy calibration")
         self.log(logging.INFO, "configure FPGA registers for Calibration run...")
         
-        self.dc.fpga.write_register('pps_delay', 0) 
-        self.dc.fpga.write_bit('laser_en', 1)
-        self.dc.fpga.write_register('pulse_width', 10_000)  # 100 us
-        self.dc.fpga.write_register('pulse_energy', 17_400) # 140 us = 174 us, maximum
-        #self.dc.fpga.write_register('pulse_period', 3_000_000_000) # 30_000 ms 
-        self.dc.fpga.write_register('pulse_period', 100_000_000)  # 1000 ms 1 hz
-        self.dc.fpga.write_register('shots_num', self.nshots)
-
-        self.dc.fpga.write_register('mux_bnc_0', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_1', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_2', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_3', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_4', 0b0010)
-        self.log(logging.INFO, "done")
+        self.profile = {
+            'pps_delay': 0,
+            'pulse_width': 10_000,          # 100 us
+            'pulse_energy': 17_400,         # 140 us = 174 us, maximum
+            #'pulse_period': 3_000_000_000, # 30_000 ms
+            'pulse_period': 100_000_000,    # 1000 ms 1 hz
+            'shots_num': self.nshots,
+            'mux_bnc_0': 0b0010,
+            'mux_bnc_1': 0b0010,
+            'mux_bnc_2': 0b0010,
+            'mux_bnc_3': 0b0010,
+            'mux_bnc_4': 0b0010,
+            'laser_en': 1,
+        }
+        written = self.dc.fpga.apply_profile(self.profile)
+        self.log(logging.INFO, f"done - written {written}")
 
         self.log(logging.INFO, "turn on inverter")
         if self.dc.fpga.read_dio('inverter') == True: 
@@ -725,63 +839,59 @@ class RunCalib(RunBase):
             time.sleep(1)
         self.log(logging.INFO, "done")
 
-        self.log(logging.INFO, "radiometer Ophir setup")
-        self.dc.get_radiometer('Rad3').setup()
-        self.log(logging.INFO, "done")
-
-        self.log(logging.INFO, "laser setup")
-        self.dc.laser.set_mode(qson = 1, dpw = 140)
-        self.log(logging.INFO, "done")
-
-        self.log(logging.INFO, "laser warmup and wait for laser fire auth")
-        self.dc.laser.warmup()
-        laser_timeout_s = 120
-        t = 0
-        while not self.dc.laser.fire_auth():
-            if t >= laser_timeout_s:
-                self.log(logging.ERROR, f"laser fire authorization timeout ({laser_timeout_s}s) - run interrupted")
-                return -1
-            self.log(logging.INFO, self.dc.laser.temperature())
-            #self.dc.laser.standby()
-            time.sleep(1)
-            t += 1
-        self.log(logging.INFO, "done")
-
-        self.dc.fpga.write_bit('timestamp_en', 1)
+        self.log(logging.INFO, "Init motors and move them to energy calibration position...")
+        # all four on the Motor_calib VXM: one program. Homing is skipped for
+        # the motors still homed in this VXM power cycle unless force_home.
+        # The motors travel during the radiometer and laser setup
+        force = self.params[self.identity].get('force_home', False)
+        self.dc.get_motor("UpEastWest").init()
+        program = Program()
+        for name in ["UpEastWest", "UpNorthSouth", "LwNorthSouth", "LwPolarizer"]:
+            program.home(self.dc.get_motor(name), force=force)
+        program.move_ABS(self.dc.get_motor("UpNorthSouth"), self.dc.get_motor("UpNorthSouth").ecal_position)
+        program.move_ABS(self.dc.get_motor("UpEastWest"), self.dc.get_motor("UpEastWest").ecal_position)
+        program.start()
+        self.log(logging.INFO, "started")
+
+        try:
+            self.log(logging.INFO, "radiometer Ophir setup")
+            self.dc.get_radiometer('Rad3').setup()
+            self.log(logging.INFO, "done")
 
-        self.log(logging.INFO, "select vertical beam")
-        self.dc.fpga.write_dio('flipper_raman', False)
-        self.log(logging.INFO, "done")
+            self.log(logging.INFO, "laser setup")
+            self.dc.laser.set_mode(qson = 1, dpw = 140)
+            self.log(logging.INFO, "done")
 
-        self.log(logging.INFO, "Init motors")
-        self.dc.get_motor("UpEastWest").init()  
-        self.dc.get_motor("UpEastWest").move_Neg0()  
-        self.dc.get_motor("UpEastWest").move_Neg0()  
-        self.dc.get_motor("UpEastWest").set_ABSzero()
+            self.log(logging.INFO, "laser warmup and wait for laser fire auth")
+            self.dc.laser.warmup()
+            laser_timeout_s = 120
+            t = 0
+            while not self.dc.laser.fire_auth():
+                if t >= laser_timeout_s:
+                    self.log(logging.ERROR, f"laser fire authorization timeout ({laser_timeout_s}s) - run interrupted")
+                    program.wait()
+                    return -1
+                self.log(logging.INFO, self.dc.laser.temperature())
+                #self.dc.laser.standby()
+                time.sleep(1)
+                t += 1
+            self.log(logging.INFO, "done")
 
-        self.dc.get_motor("UpNorthSouth").init()  
-        self.dc.get_motor("UpNorthSouth").move_Neg0()  
-        self.dc.get_motor("UpNorthSouth").move_Neg0()  
-        self.dc.get_motor("UpNorthSouth").set_ABSzero()
+            self.dc.fpga.write_bit('timestamp_en', 1)
 
-        self.dc.get_motor("LwNorthSouth").init() 
-        self.dc.get_motor("LwNorthSouth").move_Neg0()
-        self.dc.get_motor("LwNorthSouth").move_Neg0()
-        self.dc.get_motor("LwNorthSouth").set_ABSzero()
+            self.log(logging.INFO, "select vertical beam")
+            self.dc.fpga.write_dio('flipper_raman', False)
+            self.log(logging.INFO, "done")
+        except Exception:
+            # a failed setup still waits for the motors, so that their
+            # positions are tracked before finish looks at them
+            program.wait()
+            raise
 
-        self.dc.get_motor("LwPolarizer").init() 
-        self.dc.get_motor("LwPolarizer").move_Neg0()
-        self.dc.get_motor("LwPolarizer").move_Neg0()
-        self.dc.get_motor("LwPolarizer").set_ABSzero()
+        self.log(logging.INFO, "wait motors")
+        program.wait()
         self.log(logging.INFO, "done")
 
-
-        self.log(logging.INFO, "move motors to energy calibration position...")    
-        self.dc.get_motor("UpNorthSouth").move_ABS(self.dc.get_motor("UpNorthSouth").ecal_position)
-        time.sleep(1)
-        self.dc.get_motor("UpEastWest").move_ABS(self.dc.get_motor("UpEastWest").ecal_position)
-        
-
         self.log(logging.INFO, "set laser in fire mode...")
         self.dc.laser.fire()
         self.log(logging.INFO, "done")
@@ -791,67 +901,79 @@ class RunCalib(RunBase):
     def run(self):
         self.log(logging.INFO, "run")
         self.log(logging.INFO, f"start Calib Run")
-        self.dc.fpga.write_dio('laser_en', 1)
-        self.dc.fpga.write_dio('laser_start', 1)
-
-        self.log(logging.INFO, "Starting energy calibration measurements...")
-        for i in range(self.nshots):
-            power=self.dc.get_radiometer('Rad3').read_power()
-            seconds, counter, pps, counter_cycles = self.dc.data.read_event()
-            self.log(logging.INFO, f'power {i} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
-
-        self.log(logging.INFO, "move motors to polarization calibration position...")    
-        self.dc.get_motor("LwNorthSouth").move_ABS(self.dc.get_motor("LwNorthSouth").pcal_position)  
-        time.sleep(1)
-        self.dc.get_motor("LwPolarizer").move_ABS(0)        #0 deg
-        self.dc.fpga.write_dio('laser_en', 1)
-        self.dc.fpga.write_dio('laser_start', 1)
-        
-        self.log(logging.INFO, "Starting polarization calibration measurements at 0 deg...")
-        for i in range(self.nshots):
-            power=self.dc.get_radiometer('Rad3').read_power()
-            seconds, counter, pps, counter_cycles = self.dc.data.read_event()
-            self.log(logging.INFO, f'power {i} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
-
-        self.log(logging.INFO, "move motors to polarization calibration position...")    
-        self.dc.get_motor("LwPolarizer").move_ABS(90*80)    #90 deg
-        self.dc.fpga.write_dio('laser_en', 1)
-        self.dc.fpga.write_dio('laser_start', 1)
-
-        self.log(logging.INFO, "Starting polarization calibration measurements at 90 deg...")
-        for i in range(self.nshots):
-            power=self.dc.get_radiometer('Rad3').read_power()
-            seconds, counter, pps, counter_cycles = self.dc.data.read_event()
-            self.log(logging.INFO, f'power {i} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
-
-        self.log(logging.INFO, "move motors to polarization calibration position...")    
-        self.dc.get_motor("LwPolarizer").move_ABS(180*80)    #180 deg
-        self.dc.fpga.write_dio('laser_en', 1)
-        self.dc.fpga.write_dio('laser_start', 1)
-
-        self.log(logging.INFO, "Starting polarization calibration measurements at 180 deg...")
-        for i in range(self.nshots):
-            power=self.dc.get_radiometer('Rad3').read_power()
-            seconds, counter, pps, counter_cycles = self.dc.data.read_event()
-            self.log(logging.INFO, f'power {i} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
-
+        self.open_shots(4 * self.nshots)
+        radiometer = self.dc.get_radiometer('Rad3')
+        radiometer.start()
+        try:
+            self.dc.data.start()
+            self.dc.data.drain()
+            radiometer.drain()
+            self.dc.fpga.write_dio('laser_en', 1)
+            self.dc.fpga.write_dio('laser_start', 1)
+
+            self.log(logging.INFO, "Starting energy calibration measurements...")
+            for _ in range(self.nshots):
+                event = self.dc.data.get(self.dc.data.timeout)
+                self.record_shot(radiometer.get_sample(self.dc.data.timeout), event)
+
+            self.log(logging.INFO, "move motors to polarization calibration position...")    
+            program = Program()
+            program.move_ABS(self.dc.get_motor("LwNorthSouth"), self.dc.get_motor("LwNorthSouth").pcal_position)
+            program.move_ABS(self.dc.get_motor("LwPolarizer"), 0)        #0 deg
+            program.run()
+            self.dc.data.drain()
+            radiometer.drain()
+            self.dc.fpga.write_dio('laser_en', 1)
+            self.dc.fpga.write_dio('laser_start', 1)
+
+            self.log(logging.INFO, "Starting polarization calibration measurements at 0 deg...")
+            for _ in range(self.nshots):
+                event = self.dc.data.get(self.dc.data.timeout)
+                self.record_shot(radiometer.get_sample(self.dc.data.timeout), event, section=1)
+
+            self.log(logging.INFO, "move motors to polarization calibration position...")    
+            self.dc.get_motor("LwPolarizer").move_ABS(90*80)    #90 deg
+            self.dc.data.drain()
+            radiometer.drain()
+            self.dc.fpga.write_dio('laser_en', 1)
+            self.dc.fpga.write_dio('laser_start', 1)
+
+            self.log(logging.INFO, "Starting polarization calibration measurements at 90 deg...")
+            for _ in range(self.nshots):
+                event = self.dc.data.get(self.dc.data.timeout)
+                self.record_shot(radiometer.get_sample(self.dc.data.timeout), event, section=2)
+
+            self.log(logging.INFO, "move motors to polarization calibration position...")    
+            self.dc.get_motor("LwPolarizer").move_ABS(180*80)    #180 deg
+            self.dc.data.drain()
+            radiometer.drain()
+            self.dc.fpga.write_dio('laser_en', 1)
+            self.dc.fpga.write_dio('laser_start', 1)
+
+            self.log(logging.INFO, "Starting polarization calibration measurements at 180 deg...")
+            for _ in range(self.nshots):
+                event = self.dc.data.get(self.dc.data.timeout)
+                self.record_shot(radiometer.get_sample(self.dc.data.timeout), event, section=3)
+        finally:
+            self.dc.data.stop()
+            radiometer.stop()
+        self.close_shots()
 
         self.log(logging.INFO, "set laser standby")
         self.dc.laser.standby()
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "set motors to home position")
-        self.dc.get_motor("LwPolarizer").move_ABS(0) 
-        time.sleep(1)
-        self.dc.get_motor("LwNorthSouth").move_ABS(0)
-        time.sleep(1)
-        self.dc.get_motor("UpNorthSouth").move_ABS(0)
-        time.sleep(1)
-        self.dc.get_motor("UpEastWest").move_ABS(0)
-        self.log(logging.INFO, "done")
+        program = Program()
+        for name in ["LwPolarizer", "LwNorthSouth", "UpNorthSouth", "UpEastWest"]:
+            program.move_ABS(self.dc.get_motor(name), 0)
+        program.run()
+        self.log(logging.INFO, "motors home")
 
  
-    def finish(self):
+    def finish(self, program=None):
+        # program: motors still moving home (abort), awaited before the VXM
+        # outlet goes off
         self.log(logging.INFO, "finish")
         
         self.log(logging.INFO, "turn off Radiometer outlet")
@@ -862,9 +984,21 @@ class RunCalib(RunBase):
         WAIT_UNTIL_TRUE(self.dc.get_outlet('laser').off)
         self.log(logging.INFO, "done")
 
-        self.log(logging.INFO, "turn off VXM outlet")
-        WAIT_UNTIL_TRUE(self.dc.get_outlet('VXM').off)
-        self.log(logging.INFO, "done")
+        if program is not None:
+            program.wait()
+            self.log(logging.INFO, "motors home")
+
+        # switching the VXM off starts a new power cycle, in which every
+        # motor has to be homed again: it stays on while the positions of
+        # all the motors are known, so that the next CALIB skips the homing
+        states = [self.dc.get_motor(name).load_position() or {}
+            for name in ["LwPolarizer", "LwNorthSouth", "UpNorthSouth", "UpEastWest"]]
+        if all(state.get('homed') is not None and state.get('position') is not None for state in states):
+            self.log(logging.INFO, "motor positions known - VXM outlet left on")
+        else:
+            self.log(logging.INFO, "turn off VXM outlet")
+            WAIT_UNTIL_TRUE(self.dc.get_outlet('VXM').off)
+            self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "turn off inverter")
         self.dc.fpga.write_dio('inverter', False)
@@ -879,14 +1013,10 @@ class RunCalib(RunBase):
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "set motors to home position")
-        self.dc.get_motor("LwPolarizer").move_ABS(0) 
-        time.sleep(1)
-        self.dc.get_motor("LwNorthSouth").move_ABS(0)
-        time.sleep(1)
-        self.dc.get_motor("UpNorthSouth").move_ABS(0)
-        time.sleep(1)
-        self.dc.get_motor("UpEastWest").move_ABS(0)
-        self.log(logging.INFO, "done")
+        program = Program()
+        for name in ["LwPolarizer", "LwNorthSouth", "UpNorthSouth", "UpEastWest"]:
+            program.move_ABS(self.dc.get_motor(name), 0)
+        program.start()
 
-        self.finish()
+        self.finish(program)
 
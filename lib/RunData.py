@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import struct
+import numpy as np
+
+RUNDATA_DIR = "logs"
+MAGIC = b"CLFRUN1\n"
+HEADER_SIZE = 4096      # magic, row count (uint64), JSON length (uint32), JSON
+COUNT_OFFSET = len(MAGIC)
+
+# one row per shot: host_time/power_time are the host receive times of the
+# FPGA event and of the radiometer reading; flags: 1 = no FPGA event, 2 = no
+# radiometer reading
+SHOT_COLUMNS = [
+    ('host_time', 'f8'),
+    ('power_time', 'f8'),
+    ('power', 'f8'),
+    ('seconds', 'u4'),
+    ('counter', 'u4'),
+    ('pps_delta', 'i4'),
+    ('counter_pulses', 'u4'),
+    ('section', 'u1'),
+    ('flags', 'u1'),
+]
+FLAG_NO_EVENT = 1
+FLAG_NO_POWER = 2
+
+class RunDataWriter:
+
+    # per-run shot file: a header block then one preallocated column per
+    # field. Rows are written straight into the memory-mapped columns (a
+    # shared mapping: what is written is in the file even if the process is
+    # killed); the row count in the header, which is what RunData reads, is
+    # updated every interval seconds or block rows, whichever comes first
+
+    def __init__(self, path, capacity, header, columns=SHOT_COLUMNS, block=1000, interval=1.0):
+        self.path = path
+        self.capacity = capacity
+        self.dtype = np.dtype(columns)
+        self.count = 0
+        self.dropped = 0
+
+        offsets = []
+        offset = HEADER_SIZE
+        for name, dt in columns:
+            offset = (offset + 7) // 8 * 8
+            offsets.append((name, dt, offset))
+            offset += capacity * np.dtype(dt).itemsize
+        doc = dict(header, capacity=capacity, columns=offsets, created=time.time())
+        text = json.dumps(doc, default=str).encode()
+        if COUNT_OFFSET + 12 + len(text) > HEADER_SIZE:
+            raise ValueError(f"run data header too large ({len(text)} bytes)")
+
+        with open(path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<QI', 0, len(text)) + text)
+            f.truncate(offset)
+        self.mm = np.memmap(path, np.uint8, 'r+')
+        self.columns = {name: self.mm[off:off + capacity * np.dtype(dt).itemsize].view(dt)
+            for name, dt, off in offsets}
+        self.block = max(1, min(block, capacity))
+        self.interval = interval
+        self.published = 0
+        self.published_time = time.monotonic()
+
+    def append(self, **values):
+        if self.count >= self.capacity:
+            self.dropped += 1
+            return
+        for name, value in values.items():
+            self.columns[name][self.count] = value
+        self.count += 1
+        if self.count - self.published >= self.block or time.monotonic() - self.published_time >= self.interval:
+            self.publish()
+
+    def publish(self):
+        # make the rows written so far visible to readers
+        self.mm[COUNT_OFFSET:COUNT_OFFSET + 8] = np.frombuffer(struct.pack('<Q', self.count), np.uint8)
+        self.published = self.count
+        self.published_time = time.monotonic()
+
+    def flush(self):
+        if self.mm is None:
+            return
+        self.publish()
+        self.mm.flush()
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.flush()
+        del self.columns
+        self.mm = None
+
+
+class RunData:
+
+    # read-only zero-copy view of a run data file, also while it is written:
+    # columns are memmaps of the rows published so far (refresh() to follow)
+
+    def __init__(self, path):
+        self.path = path
+        self.refresh()
+
+    def refresh(self):
+        with open(self.path, 'rb') as f:
+            head = f.read(HEADER_SIZE)
+        if head[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path}: not a run data file")
+        self.count, length = struct.unpack_from('<QI', head, COUNT_OFFSET)
+        self.header = json.loads(head[COUNT_OFFSET + 12:COUNT_OFFSET + 12 + length])
+        mm = np.memmap(self.path, np.uint8, 'r')
+        self.columns = {}
+        for name, dt, off in self.header['columns']:
+            self.columns[name] = mm[off:off + self.header['capacity'] * np.dtype(dt).itemsize].view(dt)[:self.count]
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return self.count
+
+
+def rundata_path(runtype, identity, t=None):
+    stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(t))
+    return os.path.join(RUNDATA_DIR, f"{identity}_{runtype.lower()}_{stamp}.clfrun")
+
+
+if __name__ == "__main__":
+    data = RunData(sys.argv[1])
+    print(json.dumps(data.header, indent=2))
+    print(f"{len(data)} shots")
+    for name, column in data.columns.items():
+        if len(column):
+            print(f"{name}: min {column.min()}, max {column.max()}, mean {column.mean():.3f}")
@@ -114,6 +114,7 @@ class RunManager:
                     self.run = RunCalib(self.dc, self.params)
                 elif self.runentry.runtype == RunType.MOCK:
                     self.run = RunMock(self.dc, self.params)
+                self.run.entry = self.runentry
 
             if source == 'cli':     # run started from command line interface
                 self.job = multiprocessing.Process(target=self.run.execute)
@@ -145,6 +146,7 @@ class RunManager:
     def alarm_handler(self, msg):
         if self.job_is_running():
             self.log(logging.INFO, f"alarm received during run: {msg}")
+            self.log(logging.INFO, f"shot statistics: {self.shot_stats()}")
             if not self.abort_in_progress:
                 self.log(logging.INFO, f"start alarm handling")
                 self.abort_in_progress = True
@@ -157,9 +159,15 @@ class RunManager:
             else:
                 self.log(logging.INFO, f"alarm handling in progress")
 
+    def shot_stats(self):
+        # live statistics of the current (or last) run, from shared memory
+        if self.run is None:
+            return None
+        return self.run.stats.summary()
+
     def print_status(self):
         if self.job_is_running():
-            return f"run {self.runentry.runtype.name} in progress"
+            return f"run {self.runentry.runtype.name} in progress ({self.shot_stats()})"
         else:
             return "idle"
 
@@ -0,0 +1,264 @@
+import os
+import sys
+import pty
+import tty
+import json
+import time
+import struct
+import threading
+
+SERIAL_DIR = "logs"
+MAGIC = b"CLFSER1\n"
+# record: host time, channel, direction, payload length, then the payload
+RECORD = struct.Struct('<dBBI')
+RX = 0
+TX = 1
+CHANNEL = 2         # channel declaration, the payload is JSON (name, port...)
+FLUSH_S = 1.0
+
+class SerialRecorder:
+
+    # append-only record of the raw byte streams of several serial ports in
+    # one file: every chunk returned by read() or passed to write() is stored
+    # with its host time, channel and direction. Writes are buffered and
+    # flushed at most every FLUSH_S, so recording costs one struct pack and a
+    # memory copy per chunk; a crash loses at most the last second
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab', buffering=1 << 16)
+        if new:
+            self.file.write(MAGIC)
+        self.channels = {}
+        self.attached = []
+        self.flushed = time.monotonic()
+        self.bytes = 0
+
+    def channel(self, name, **info):
+        # id of the channel name, declared in the file on first use
+        with self.lock:
+            if name not in self.channels:
+                self.channels[name] = len(self.channels)
+                self._record(self.channels[name], CHANNEL, json.dumps(dict(info, name=name), default=str).encode())
+            return self.channels[name]
+
+    def _record(self, ch, direction, data):
+        self.file.write(RECORD.pack(time.time(), ch, direction, len(data)))
+        self.file.write(data)
+        self.bytes += len(data)
+        now = time.monotonic()
+        if now - self.flushed >= FLUSH_S:
+            self.file.flush()
+            self.flushed = now
+
+    def record(self, ch, direction, data):
+        if not data or self.file is None:
+            return
+        with self.lock:
+            self._record(ch, direction, bytes(data))
+
+    def attach(self, device, name):
+        # record the serial port of a device (anything with a .serial
+        # attribute: FPGAData, Centurion, radiometers...) until detach()
+        if device is None or getattr(device, 'serial', None) is None or isinstance(device.serial, RecordedSerial):
+            return
+        port = device.serial
+        ch = self.channel(name, port=getattr(port, 'port', None), baudrate=getattr(port, 'baudrate', None))
+        device.serial = RecordedSerial(port, self, ch)
+        self.attached.append(device)
+
+    def detach(self):
+        for device in self.attached:
+            if isinstance(device.serial, RecordedSerial):
+                device.serial = device.serial.wrapped
+        self.attached = []
+
+    def close(self):
+        self.detach()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class RecordedSerial:
+
+    # stands in for a pyserial object: reads and writes go to the port and
+    # to the recorder, everything else (timeout, in_waiting, reset_*...) is
+    # passed through
+
+    def __init__(self, port, recorder, channel):
+        object.__setattr__(self, 'wrapped', port)
+        object.__setattr__(self, 'recorder', recorder)
+        object.__setattr__(self, 'channel', channel)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.wrapped, name, value)
+
+    def _rx(self, data):
+        self.recorder.record(self.channel, RX, data)
+        return data
+
+    def read(self, size=1):
+        return self._rx(self.wrapped.read(size))
+
+    def read_until(self, *args, **kwargs):
+        return self._rx(self.wrapped.read_until(*args, **kwargs))
+
+    def readline(self, *args, **kwargs):
+        return self._rx(self.wrapped.readline(*args, **kwargs))
+
+    def read_all(self):
+        return self._rx(self.wrapped.read_all())
+
+    def write(self, data):
+        n = self.wrapped.write(data)
+        self.recorder.record(self.channel, TX, data)
+        return n
+
+
+def read_records(path):
+    # (time, channel name, direction, bytes) of a recording; a record cut
+    # short by a crash ends the iteration
+    names = {}
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a serial recording")
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            t, ch, direction, length = RECORD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            if direction == CHANNEL:
+                names[ch] = json.loads(data)['name']
+                continue
+            yield t, names.get(ch, str(ch)), direction, data
+
+def channels(path):
+    # {name: declaration} of the channels in a recording
+    result = {}
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a serial recording")
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                break
+            t, ch, direction, length = RECORD.unpack(head)
+            data = f.read(length)
+            if direction == CHANNEL and len(data) == length:
+                info = json.loads(data)
+                result[info['name']] = dict(info, id=ch, time=t)
+    return result
+
+
+class SerialReplayer:
+
+    # plays back the received stream of one channel of a recording on a pty,
+    # so that the device classes can be pointed at it instead of the real
+    # port. speed scales the recorded timing (1.0: real time, 10: ten times
+    # faster), None sends as fast as the reader takes it. Whatever the
+    # reader writes is drained and dropped. Playback begins with play(), as
+    # opening the port with pyserial discards what is already pending
+
+    def __init__(self, path, channel, speed=1.0):
+        self.path = path
+        self.channel = channel
+        self.speed = speed
+        self.running = False
+        self.done = threading.Event()
+        self.fds = []
+        self.sent = 0
+
+    def start(self):
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.fds = [master, slave]
+        self.running = True
+        threading.Thread(target=self.drain_loop, args=(master,), daemon=True).start()
+        return os.ttyname(slave)
+
+    def play(self):
+        self.done.clear()
+        threading.Thread(target=self.play_loop, args=(self.fds[0],), daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        for fd in self.fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = []
+
+    def wait(self, timeout=None):
+        # until the whole recording has been sent
+        return self.done.wait(timeout)
+
+    def play_loop(self, fd):
+        t0 = None
+        start = time.monotonic()
+        for t, name, direction, data in read_records(self.path):
+            if not self.running:
+                break
+            if name != self.channel or direction != RX:
+                continue
+            if t0 is None:
+                t0 = t
+            if self.speed:
+                delay = start + (t - t0) / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            try:
+                os.write(fd, data)
+            except OSError:
+                break
+            self.sent += len(data)
+        self.done.set()
+
+    def drain_loop(self, fd):
+        while self.running:
+            try:
+                if not os.read(fd, 1024):
+                    return
+            except OSError:
+                return
+
+
+def serial_path(runtype, identity, t=None):
+    stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(t))
+    return os.path.join(SERIAL_DIR, f"{identity}_{runtype.lower()}_{stamp}.clfser")
+
+
+if __name__ == "__main__":
+    # serial recording summary, or replay of one channel:
+    #   SerialRecorder.py <file> [<channel> [<speed>|max]]
+    path = sys.argv[1]
+    if len(sys.argv) < 3:
+        sizes = {}
+        for t, name, direction, data in read_records(path):
+            sizes.setdefault(name, [0, 0])[direction] += len(data)
+        for name, info in channels(path).items():
+            rx, tx = sizes.get(name, [0, 0])
+            print(f"{name}: port {info.get('port')}, baudrate {info.get('baudrate')}, {rx} bytes received, {tx} bytes sent")
+    else:
+        speed = None if len(sys.argv) > 3 and sys.argv[3] == 'max' else float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+        replayer = SerialReplayer(path, sys.argv[2], speed)
+        print(f"{sys.argv[2]}: {replayer.start()}")
+        try:
+            input("open the port, then press enter to play")
+            replayer.play()
+            replayer.wait()
+            print(f"{replayer.sent} bytes sent")
+            time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        replayer.stop()
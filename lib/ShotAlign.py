@@ -0,0 +1,91 @@
+import os
+import sys
+import numpy as np
+from collections import namedtuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.RunData import RunData, FLAG_NO_EVENT, FLAG_NO_POWER
+
+# pairs: (n, 2) array of (event index, reading index); offset: host - FPGA
+# clock (s); lag: reading delay after its shot (s); residual: per pair
+# distance from the expected reading time (s)
+Alignment = namedtuple('Alignment', ['pairs', 'unmatched_events', 'unmatched_readings', 'offset', 'lag', 'residual'])
+
+def fpga_time(seconds, counter):
+    # shot time on the FPGA clock: GPS second plus counter (ns from the PPS)
+    return np.asarray(seconds, np.float64) + np.asarray(counter, np.float64) * 1e-9
+
+def align_shots(event_host, event_fpga, reading_host, window=None, lag=None):
+    # join radiometer readings to FPGA events by nearest time. Event times are
+    # taken from the FPGA clock (seconds/counter) moved to the host clock by
+    # the median offset, so serial latency jitter does not matter; the
+    # reading delay after the shot (lag) is estimated as the median distance
+    # from the nearest event if not given. Each event gets at most one
+    # reading (the closest one) and only within window (default: a quarter
+    # of the median shot spacing). Sorting and searchsorted: O(n log n)
+    event_host = np.asarray(event_host, np.float64)
+    event_fpga = np.asarray(event_fpga, np.float64)
+    reading_host = np.asarray(reading_host, np.float64)
+    ne, nr = len(event_fpga), len(reading_host)
+    empty = np.zeros((0, 2), np.int64)
+    if ne == 0 or nr == 0:
+        return Alignment(empty, np.arange(ne), np.arange(nr), None, lag, np.zeros(0))
+
+    offset = float(np.median(event_host - event_fpga))
+    order = np.argsort(event_fpga, kind='stable')
+    t = event_fpga[order] + offset
+    if window is None:
+        window = 0.25 * float(np.median(np.diff(t))) if ne > 1 else 1.0
+
+    def nearest(target):
+        i = np.clip(np.searchsorted(t, target), 1, ne - 1) if ne > 1 else np.zeros(len(target), np.int64)
+        if ne > 1:
+            i = np.where(np.abs(target - t[i - 1]) <= np.abs(target - t[i]), i - 1, i)
+        return i, target - t[i]
+
+    if lag is None:
+        _, d = nearest(reading_host)
+        lag = float(np.median(d))
+
+    i, d = nearest(reading_host - lag)
+    ok = np.abs(d) <= window
+    cand_r = np.flatnonzero(ok)
+    cand_e = i[ok]
+    # one reading per event: the closest wins
+    by = np.lexsort((np.abs(d[ok]), cand_e))
+    cand_r, cand_e = cand_r[by], cand_e[by]
+    first = np.ones(len(cand_e), bool)
+    first[1:] = cand_e[1:] != cand_e[:-1]
+    match_r, match_e = cand_r[first], order[cand_e[first]]
+
+    pairs = np.stack((match_e, match_r), axis=1)
+    pairs = pairs[np.argsort(match_e, kind='stable')]
+    unmatched_events = np.setdiff1d(np.arange(ne), match_e)
+    unmatched_readings = np.setdiff1d(np.arange(nr), match_r)
+    residual = d[pairs[:, 1]]
+    return Alignment(pairs, unmatched_events, unmatched_readings, offset, lag, residual)
+
+def align_rundata(data, window=None, lag=None):
+    # align the events and readings stored in a run data file (RunData),
+    # each with its own host receive time; returns the Alignment with row
+    # indices of the file
+    flags = data['flags']
+    erows = np.flatnonzero((flags & FLAG_NO_EVENT) == 0)
+    rrows = np.flatnonzero((flags & FLAG_NO_POWER) == 0)
+    a = align_shots(data['host_time'][erows], fpga_time(data['seconds'][erows], data['counter'][erows]),
+        data['power_time'][rrows], window, lag)
+    pairs = np.stack((erows[a.pairs[:, 0]], rrows[a.pairs[:, 1]]), axis=1)
+    return a._replace(pairs=pairs, unmatched_events=erows[a.unmatched_events],
+        unmatched_readings=rrows[a.unmatched_readings])
+
+def report(a):
+    text = f"{len(a.pairs)} matched, {len(a.unmatched_events)} events and {len(a.unmatched_readings)} readings unmatched"
+    if a.offset is not None:
+        text += f", clock offset {a.offset:.6f} s, reading lag {a.lag * 1000:.1f} ms"
+    if len(a.residual):
+        text += f", residual max {np.abs(a.residual).max() * 1000:.2f} ms"
+    return text
+
+
+if __name__ == "__main__":
+    data = RunData(sys.argv[1])
+    print(report(align_rundata(data)))
@@ -0,0 +1,92 @@
+import math
+import time
+import multiprocessing
+
+# per stream: shots, dropouts, mean, sum of squared deviations (Welford),
+# min, max, host time of the first and of the last shot
+FIELDS = ['count', 'dropouts', 'mean', 'm2', 'min', 'max', 'first', 'last']
+NFIELDS = len(FIELDS)
+# run: shots expected, start time
+HEAD = 2
+
+class ShotStats:
+
+    # running shot energy statistics of a run, one stream per section (e.g.
+    # the polarization angles of a CALIB run), in O(1) memory. The values
+    # live in a shared array: create it in the parent process before the run
+    # is started so that the run child updates the copy that the CLI and
+    # housekeeping read while the run is going on
+
+    def __init__(self, streams=('energy',)):
+        self.streams = list(streams)
+        self.array = multiprocessing.Array('d', HEAD + NFIELDS * len(self.streams))
+        self.reset()
+
+    def reset(self, expected=0):
+        with self.array.get_lock():
+            self.array[:] = [0.0] * len(self.array)
+            self.array[0] = expected
+            self.array[1] = time.time()
+            for i in range(len(self.streams)):
+                self.array[HEAD + i * NFIELDS + 4] = math.inf
+                self.array[HEAD + i * NFIELDS + 5] = -math.inf
+
+    def add(self, value, stream=0, t=None):
+        # one shot: value is the energy, None/NaN/negative (radiometer
+        # failure) counts as a dropout
+        t = time.time() if t is None else t
+        base = HEAD + stream * NFIELDS
+        with self.array.get_lock():
+            a = self.array.get_obj()
+            if a[base] == 0 and a[base + 1] == 0:
+                a[base + 6] = t
+            a[base + 7] = t
+            if value is None or not math.isfinite(value) or value < 0:
+                a[base + 1] += 1
+                return
+            n = a[base] + 1
+            delta = value - a[base + 2]
+            a[base] = n
+            a[base + 2] += delta / n
+            a[base + 3] += delta * (value - a[base + 2])
+            a[base + 4] = min(a[base + 4], value)
+            a[base + 5] = max(a[base + 5], value)
+
+    def stream(self, i):
+        with self.array.get_lock():
+            v = dict(zip(FIELDS, self.array[HEAD + i * NFIELDS:HEAD + (i + 1) * NFIELDS]))
+        n = v['count']
+        shots = n + v['dropouts']
+        elapsed = v['last'] - v['first']
+        return {
+            'count': int(n),
+            'dropouts': int(v['dropouts']),
+            'mean': v['mean'] if n else None,
+            'std': math.sqrt(v['m2'] / (n - 1)) if n > 1 else None,
+            'min': v['min'] if n else None,
+            'max': v['max'] if n else None,
+            'rate': (shots - 1) / elapsed if shots > 1 and elapsed > 0 else None,
+        }
+
+    def snapshot(self):
+        with self.array.get_lock():
+            expected, started = self.array[0], self.array[1]
+        streams = {name: self.stream(i) for i, name in enumerate(self.streams)}
+        shots = sum(s['count'] + s['dropouts'] for s in streams.values())
+        return {'expected': int(expected), 'shots': shots, 'started': started, 'streams': streams}
+
+    def summary(self):
+        snap = self.snapshot()
+        text = f"{snap['shots']}/{snap['expected']} shots"
+        for name, s in snap['streams'].items():
+            if s['count'] + s['dropouts'] == 0:
+                continue
+            text += f", {name}: {s['count']} shots, {s['dropouts']} dropouts"
+            if s['mean'] is not None:
+                text += f", mean {s['mean']:.4g}"
+                if s['std'] is not None:
+                    text += f" std {s['std']:.3g}"
+                text += f" min {s['min']:.4g} max {s['max']:.4g}"
+            if s['rate'] is not None:
+                text += f", {s['rate']:.1f} Hz"
+        return text
@@ -1,13 +1,25 @@
+import os
+import re
+import sys
+import math
 import serial
 import time
 import logging
 import datetime
 from functools import partial
 from logging.handlers import TimedRotatingFileHandler
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.DeviceState import DeviceState
 
 VXM_COMMAND = 255
 VXM_RETURN = 50
 VMX_WAIT = 800000
+VXM_SPEED = 1000      # steps/s assumed for a motor whose speed was not set
+VXM_ACCEL = 2000      # steps/s^2 of the motion model, per motor in motors.yml
+VXM_TRAVEL = 40000    # steps, bound of a move to a limit or to an absolute position
+VXM_MARGIN = 2.0      # s allowed on top of the motion time before giving up on '^'
+VXM_DEADLINE = 1.5    # factor on the predicted motion time, per motor in motors.yml
+HOME_MAX_AGE = 86400  # s, a homing older than this is not trusted
 
 logger = logging.getLogger("device")
 logger.setLevel(logging.INFO)
@@ -60,8 +72,11 @@ class VXM:
         except serial.SerialException as e:
             self.log(logging.INFO, f"VXM:CONN: Unable to open device {self.port}: {e}")
             
-    def add_motor(self, id, name, ecal_position, pcal_position):
-        self.motors[name] = self.Motor(self.serial, id, ecal_position, pcal_position)
+    def add_motor(self, id, name, ecal_position, pcal_position, outlet='VXM', speed=None, accel=VXM_ACCEL, deadline_factor=VXM_DEADLINE):
+        # the axis speeds above for the motors that have no speed of their own
+        if speed is None:
+            speed = {1: self.spdx, 2: self.spdy}.get(id, self.spdx)
+        self.motors[name] = self.Motor(self.serial, id, ecal_position, pcal_position, outlet, speed, accel, deadline_factor)
         return self.motors[name]
 
     def get_motor(self, name):
@@ -70,12 +85,24 @@ class VXM:
 
     class Motor:
 
-        def __init__(self, serial, id, ecal_position, pcal_position):
+        def __init__(self, serial, id, ecal_position, pcal_position, outlet='VXM', speed=VXM_SPEED, accel=VXM_ACCEL, deadline_factor=VXM_DEADLINE):
             self.serial = serial
             self.id = id
             self.ecal_position = ecal_position
             self.pcal_position = pcal_position
             self.string_return = 255
+            # motion model: trapezoidal profile at accel up to speed
+            self.speed = speed
+            self.accel = accel
+            # completion deadline: this factor on the time predicted from
+            # speed and accel, plus VXM_MARGIN
+            self.deadline_factor = deadline_factor
+            # (command, predicted, measured time) of the last move
+            self.last_motion = None
+            # absolute position and homing time are kept in the device state,
+            # valid for one power cycle (epoch) of the controller outlet
+            self.outlet = outlet
+            self.store = DeviceState()
 
             self.log = partial(logger.log, extra={'classname': self.__class__.__name__})
         
@@ -127,38 +154,186 @@ class VXM:
                 self.log(logging.ERROR, f"VXM:READ_R:ERROR:Unable to read response")
                 return -1
 
-        def run(self):
+        def travel_time(self, steps):
+            # ramp up at accel to speed, cruise, ramp down; moves too short to
+            # reach speed are a triangle
+            if steps <= 0:
+                return 0
+            if steps >= self.speed ** 2 / self.accel:
+                return steps / self.speed + self.speed / self.accel
+            return 2 * math.sqrt(steps / self.accel)
+
+        def plan(self, command, position=None, at_limit=False):
+            # (predicted time, steps, position, at_limit) of command starting
+            # at position (from the absolute zero, None if unknown) and
+            # possibly at the negative limit. Unknown distances are taken as
+            # the full travel, so the prediction stays an upper bound
+            m = re.match(r"I(A?)\d+M(-?\d+)$", command)
+            if m:
+                absolute, value = m.group(1), m.group(2)
+                if absolute and value == "-0":
+                    # sets the absolute zero, no motion
+                    return 0, 0, 0, at_limit
+                if absolute:
+                    target = int(value)
+                    steps = abs(target - position) if position is not None else VXM_TRAVEL
+                    return self.travel_time(steps), steps, target, False
+                if value == "-0":
+                    steps = 0 if at_limit else VXM_TRAVEL
+                    return self.travel_time(steps), steps, None, True
+                if value == "0":
+                    return self.travel_time(VXM_TRAVEL), VXM_TRAVEL, None, False
+                steps = abs(int(value))
+                return self.travel_time(steps), steps, position + int(value) if position is not None else None, False
+            m = re.match(r"P(\d+)$", command)
+            if m:
+                return int(m.group(1)) / 10, 0, position, at_limit
+            return 0, 0, position, at_limit
+
+        def motion_time(self, command):
+            # predicted time (s) of command from the tracked position
+            position = (self.load_position() or {}).get('position')
+            return self.plan(command, position)[0]
+
+        def load_position(self):
+            # {position, homed} of the current power cycle, None if unknown
+            state = self.store.get(f"motor/{self.serial.port}/{self.id}")
+            if state is None or state.get('epoch') != self.store.epoch(self.outlet):
+                return None
+            return state
+
+        def invalidate_position(self):
+            self.store.delete(f"motor/{self.serial.port}/{self.id}")
+
+        def track(self, commands, ok=True):
+            # follow the position (from the absolute zero) through the moves
+            # of this motor in an executed program. The motor is homed when
+            # the zero was set at the negative limit, which is then position 0
+            if not ok:
+                self.invalidate_position()
+                return None
+            state = self.load_position() or {}
+            position, homed, at_limit = state.get('position'), state.get('homed'), state.get('at_limit', False)
+            for command in commands:
+                m = re.match(rf"I(A?){self.id}M(-?\d+)$", command)
+                if not m:
+                    continue
+                if m.group(1) and m.group(2) == "-0":
+                    homed = time.time() if at_limit else None
+                _, _, position, at_limit = self.plan(command, position, at_limit)
+                if at_limit and homed is not None:
+                    position = 0
+            self.store.set(f"motor/{self.serial.port}/{self.id}", {'epoch': self.store.epoch(self.outlet),
+                'position': position, 'homed': homed, 'at_limit': at_limit})
+            return position
+
+        @check_open
+        def query_position(self, timeout=1.0):
+            # absolute position reported by the controller (X, Y, Z, T for
+            # motors 1 to 4), None if there is no valid reply
+            self.flush_buffers()
+            self.serial.write("XYZT"[self.id - 1].encode())
+            deadline = time.monotonic() + timeout
+            reply = b""
+            while time.monotonic() < deadline and not reply.endswith(b"\r"):
+                reply += self.serial.read(1)
+            m = re.search(r"([+-]\d+)", reply.decode(errors='ignore'))
+            return int(m.group(1)) if m else None
+
+        def homed(self, max_age=HOME_MAX_AGE):
+            # True if homing can be skipped: homed in this power cycle of the
+            # controller less than max_age ago, and the controller reports the
+            # position last commanded
+            state = self.load_position()
+            if state is None or state['homed'] is None:
+                self.log(logging.INFO, f"VXM:HOMED: motor {self.id} not homed since the last power cycle")
+                return False
+            if time.time() - state['homed'] > max_age or state['position'] is None:
+                self.log(logging.INFO, f"VXM:HOMED: motor {self.id} homing too old or position lost")
+                return False
+            position = self.query_position()
+            if position != state['position']:
+                self.log(logging.INFO, f"VXM:HOMED: motor {self.id} at {position}, expected {state['position']}")
+                return False
+            self.log(logging.INFO, f"VXM:HOMED: motor {self.id} at {position}, homing skipped")
+            return True
+
+        def launch(self, expected=0, factor=None):
+            # start the program; completion is awaited by wait_done(), up to
+            # the expected motion time times factor (default the motor's
+            # deadline_factor) plus a margin
+            if factor is None:
+                factor = self.deadline_factor
             self.flush_buffers()
+            self.t0 = time.monotonic()
+            self.deadline = self.t0 + expected * factor + VXM_MARGIN
             self.serial.write("R\r".encode())
 
-            ready = ""
+        def wait_done(self):
+            # wait for the '^' completion byte of the program launched. If it
+            # is already there (other work overlapped the motion) the time
+            # measured is only an upper bound: finished_early is set
             try:
-                while ready != "^":
-                    time.sleep(0.5)
-                    response = self.serial.read(self.string_return).decode(errors='ignore').strip()
-                    ready = str(response)
-
-                self.log(logging.INFO, f"VXM:RUN:Executed")
-                return 0
+                self.finished_early = self.serial.in_waiting > 0
+                while True:
+                    byte = self.serial.read(1)
+                    if byte == b"^":
+                        self.elapsed = time.monotonic() - self.t0
+                        self.log(logging.INFO, f"VXM:RUN:Executed in {self.elapsed:.2f} s")
+                        return 0
+                    if not byte and time.monotonic() >= self.deadline:
+                        break
+                self.elapsed = time.monotonic() - self.t0
+                self.log(logging.ERROR, f"VXM:RUN:ERROR:VXM at {self.serial.port}:No completion after {self.elapsed:.2f} s")
+                self.stop_motion()
+                return -1
             except Exception as e:
+                self.elapsed = time.monotonic() - self.t0
                 self.log(logging.ERROR, f"VXM:RUN:ERROR:VXM at {self.serial}:Unable to execute:{e}")
                 return -1
 
+        def stop_motion(self):
+            # after a missed deadline: kill the program still running, forget
+            # the position (the next homing is not skipped) and drop the '^'
+            # that may still come, so that it is not taken for the completion
+            # of the next program
+            self.serial.write("K".encode())
+            self.invalidate_position()
+            deadline = time.monotonic() + VXM_MARGIN
+            while time.monotonic() < deadline:
+                if self.serial.read(1) == b"^":
+                    self.log(logging.INFO, f"VXM:RUN: late completion after {time.monotonic() - self.t0:.2f} s dropped")
+                    break
+            self.flush_buffers()
+
+        def run(self, expected=0):
+            # run the program and wait for its completion
+            self.launch(expected)
+            return self.wait_done()
+
         @check_open
         def send_command(self, command):
             try:
                 self.flush_buffers()
                 self.serial.write(f"{command}\r".encode())
-                time.sleep(0.5)
 
                 self.log(logging.INFO, f"VXM: send command {command} to motor {self.id}")
 
+                position = (self.load_position() or {}).get('position')
+                expected, steps = self.plan(command, position)[:2]
                 try:
-                    response = self.run()
+                    response = self.run(expected)
                 except serial.SerialException: 
                     self.log(logging.ERROR, f"VXM:READ_R:ERROR: unable to execute command")
                     return -1
 
+                if command.startswith("I"):
+                    self.track([command], response == 0)
+
+                if response == 0 and expected > 0:
+                    self.last_motion = (command, expected, self.elapsed)
+                    self.log(logging.INFO, f"VXM:MOTION: motor {self.id} {command} {steps} steps: predicted {expected:.2f} s, took {self.elapsed:.2f} s")
+
                 self.serial.write("C".encode())
                 return response
 
@@ -169,9 +344,9 @@ class VXM:
         @check_open
         def flush_buffers(self):
             try:
+                # pending commands go out, stale replies are dropped
+                self.serial.flush()
                 self.serial.reset_input_buffer()
-                self.serial.reset_output_buffer()
-                time.sleep(0.1)
                 return 0
             except Exception as e:
                 self.log(logging.ERROR, f"VXM:FLUSH_BUFFERS:Unable to flush buffers: {e}")
@@ -242,6 +417,7 @@ class VXM:
             
             try:
                 self.send_command(command_str)
+                self.speed = int(value)
                 self.log(logging.INFO, f"VXM:SET_SPEED:VXM: motor {self.id} speed set to {value}")
                 return 0 
             except Exception as e:
@@ -359,3 +535,95 @@ class VXM:
             except Exception as e:
                 self.log(logging.ERROR, f"VXM:MOVE_ABS:ERROR:VXM: unable to move motor {self.id} in absolute position 0:{e}")
                 return -1
+
+
+class Program:
+
+    # several commands, for any of the motors on one VXM, uploaded as a
+    # single program: one R and one wait for '^' instead of a round trip per
+    # command. The VXM executes the commands one after the other, so the
+    # predicted time is the sum of the moves planned from the tracked
+    # positions; it sets the completion deadline. start() and wait() let
+    # other work, on other devices, overlap the motion
+
+    def __init__(self):
+        self.motors = []
+        self.commands = []
+        self.bound = 0
+        self.elapsed = None
+        self.result = 0
+        # (position, at_limit) of each motor as the program goes
+        self.state = {}
+
+        self.log = partial(logger.log, extra={'classname': self.__class__.__name__})
+
+    def add(self, motor, command):
+        if self.motors and motor.serial is not self.motors[0].serial:
+            raise ValueError(f"motor {motor.id} is not on {self.motors[0].serial.port}")
+        if motor not in self.motors:
+            self.motors.append(motor)
+            self.state[motor] = ((motor.load_position() or {}).get('position'), False)
+        predicted, _, position, at_limit = motor.plan(command, *self.state[motor])
+        self.state[motor] = (position, at_limit)
+        self.commands.append(command)
+        self.bound += predicted
+        return self
+
+    def home(self, motor, force=False, max_age=HOME_MAX_AGE):
+        # negative limit switch (twice, as the single motor homing does),
+        # absolute zero there; skipped when the motor is known to be homed
+        # unless forced
+        if not force and motor.homed(max_age):
+            return self
+        self.add(motor, f"I{motor.id}M-0")
+        self.add(motor, f"I{motor.id}M-0")
+        return self.add(motor, f"IA{motor.id}M-0")
+
+    def move_ABS(self, motor, abs_pos):
+        return self.add(motor, f"IA{motor.id}M{int(abs_pos)}")
+
+    def start(self):
+        # upload the program and start it; nothing else may be sent to this
+        # VXM until wait()
+        self.result = None
+        if not self.commands:
+            self.result = 0
+            return 0
+        motor = self.motors[0]
+        try:
+            motor.flush_buffers()
+            motor.serial.write("C".encode())
+            motor.serial.write((",".join(self.commands) + "\r").encode())
+            self.log(logging.INFO, f"VXM:PROGRAM: {','.join(self.commands)}, predicted {self.bound:.2f} s")
+            motor.launch(self.bound, max(m.deadline_factor for m in self.motors))
+        except serial.SerialException as e:
+            self.log(logging.ERROR, f"VXM:PROGRAM:ERROR:Unable to run program: {e}")
+            for m in self.motors:
+                m.invalidate_position()
+            self.result = -1
+        return self.result
+
+    def wait(self):
+        if self.result is not None:
+            return self.result
+        motor = self.motors[0]
+        try:
+            self.result = motor.wait_done()
+            self.elapsed = motor.elapsed
+            motor.serial.write("C".encode())
+            for m in self.motors:
+                m.track(self.commands, self.result == 0)
+        except serial.SerialException as e:
+            self.log(logging.ERROR, f"VXM:PROGRAM:ERROR:Unable to run program: {e}")
+            for m in self.motors:
+                m.invalidate_position()
+            self.result = -1
+        if self.result == 0 and motor.finished_early:
+            self.log(logging.INFO, f"VXM:PROGRAM: {len(self.commands)} commands: predicted {self.bound:.2f} s, done before wait ({self.elapsed:.2f} s)")
+        elif self.result == 0:
+            self.log(logging.INFO, f"VXM:PROGRAM: {len(self.commands)} commands: predicted {self.bound:.2f} s, took {self.elapsed:.2f} s")
+        return self.result
+
+    def run(self):
+        self.start()
+        return self.wait()
@@ -0,0 +1,174 @@
+import os
+import re
+import sys
+import math
+import pty
+import tty
+import time
+import threading
+
+# program commands with an argument; single letters are handled on their own
+COMMAND = re.compile(r"(setM(\d)M(\d+)|IA?(\d)M-?\d+|[SA](\d)M\d+|P\d+|B\d+)(?=[^\d])")
+
+class VXMSimulator:
+
+    # software model of a Velmex VXM controller on a pty. Program commands
+    # (moves, speed, pauses) are stored until R, which executes them taking
+    # the motion time (trapezoidal speed profile, scaled by scale) and
+    # answers '^'. A running program (V answers B meanwhile) is stopped by K,
+    # the motor where it was and no '^'. Each motor has limit
+    # switches at 0 and travel steps; positions are reported by X, Y, Z, T
+    # relative to the absolute zero set with IAnM-0. Every command received is
+    # kept in commands, every executed move in moves
+
+    def __init__(self, motors=4, speed=2000, accel=2000, travel=40000, scale=0.01):
+        self.scale = scale
+        self.accel = accel
+        self.travel = travel
+        self.speed = {m: speed for m in range(1, motors + 1)}
+        self.raw = {m: travel // 2 for m in range(1, motors + 1)}
+        self.zero = {m: 0 for m in range(1, motors + 1)}
+        self.program = []
+        self.commands = []
+        self.moves = []
+        self.runs = 0
+        self.running = False
+        self.busy = False
+        self.killed = threading.Event()
+        self.fds = []
+        self.port = None
+
+    def start(self):
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.fds = [master, slave]
+        self.port = os.ttyname(slave)
+        self.running = True
+        threading.Thread(target=self.loop, args=(master,), daemon=True).start()
+        return self.port
+
+    def stop(self):
+        self.running = False
+        for fd in self.fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = []
+
+    def position(self, motor):
+        return self.raw[motor] - self.zero[motor]
+
+    def move(self, command):
+        # execute one move, return its duration (s, unscaled)
+        absolute = command.startswith("IA")
+        motor, value = command[2 if absolute else 1], command.split("M", 1)[1]
+        motor = int(motor)
+        start = self.raw[motor]
+        if absolute and value == "-0":
+            self.zero[motor] = start
+            return 0
+        if absolute:
+            target = self.zero[motor] + int(value)
+        elif value == "0":
+            target = self.travel
+        elif value == "-0":
+            target = 0
+        else:
+            target = start + int(value)
+        target = min(max(target, 0), self.travel)
+        self.raw[motor] = target
+        steps, speed = abs(target - start), self.speed[motor]
+        if steps >= speed ** 2 / self.accel:
+            duration = steps / speed + speed / self.accel
+        else:
+            duration = 2 * math.sqrt(steps / self.accel)
+        self.moves.append((command, steps, duration))
+        return duration
+
+    def execute(self, fd):
+        # run the program, '^' at the end unless killed
+        for command in list(self.program):
+            if command.startswith("I"):
+                motor = int(command[2 if command.startswith("IA") else 1])
+                start = self.raw[motor]
+                duration = self.move(command) * self.scale
+                t0 = time.monotonic()
+                if self.killed.wait(duration):
+                    # stopped on the way, in proportion of the time elapsed
+                    done = (time.monotonic() - t0) / duration
+                    self.raw[motor] = start + round((self.raw[motor] - start) * min(done, 1))
+                    break
+            elif command.startswith("S"):
+                self.speed[int(command[1])] = int(command.split("M", 1)[1])
+            elif command.startswith("P"):
+                if self.killed.wait(int(command[1:]) / 10 * self.scale):
+                    break
+        self.runs += 1
+        self.busy = False
+        if not self.killed.is_set():
+            try:
+                os.write(fd, b"^")
+            except OSError:
+                pass
+
+    def handle(self, buf, fd):
+        # consume the commands at the head of buf, return the rest
+        while buf:
+            c = buf[0]
+            if c in "\r\n, ":
+                buf = buf[1:]
+                continue
+            m = COMMAND.match(buf)
+            if m:
+                self.commands.append(m.group(1))
+                self.program.append(m.group(1))
+                buf = buf[m.end():]
+                continue
+            if c in "sIASPB":
+                # command still incomplete
+                return buf
+            self.commands.append(c)
+            buf = buf[1:]
+            if c == "C":
+                self.program = []
+            elif c == "V":
+                os.write(fd, b"B" if self.busy else b"R")
+            elif c == "R" and not self.busy:
+                self.busy = True
+                self.killed.clear()
+                threading.Thread(target=self.execute, args=(fd,), daemon=True).start()
+            elif c == "K":
+                self.killed.set()
+            elif c in "XYZT":
+                motor = "XYZT".index(c) + 1
+                os.write(fd, f"{self.position(motor):+08d}\r".encode())
+            elif c == "N":
+                for motor in self.zero:
+                    self.zero[motor] = self.raw[motor]
+        return buf
+
+    def loop(self, fd):
+        buf = ""
+        while self.running:
+            try:
+                data = os.read(fd, 1024)
+            except OSError:
+                return
+            if not data:
+                return
+            buf += data.decode('ascii', 'ignore')
+            try:
+                buf = self.handle(buf, fd)
+            except OSError:
+                return
+
+
+if __name__ == "__main__":
+    sim = VXMSimulator(scale=float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
+    print(f"vxm: {sim.start()}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
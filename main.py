@@ -9,9 +9,13 @@ import time
 from datetime import datetime, timedelta
 from lib.Configuration import Configuration
 from lib.DeviceCollection import DeviceCollection
+from lib.FPGABroker import FPGABroker
+from lib.FPGADevice import PollPolicy
+from lib.FPGAMap import FPGAMap
 from lib.HouseKeeping import HouseKeeping
 from lib.RunManager import RunManager
 from lib.RunCalendar import RunEntry
+from lib.VXM import Program
 from lib.Logger import Logger
 from lib.Run import RunType
 
@@ -25,12 +29,20 @@ class App(cmd2.Cmd):
 
         self.identity = self.cfg.parameters['identity']
 
-        self.dc = DeviceCollection()
+        # runcontrol port is owned by the broker, shared by CLI, HK and runs;
+        # fpga_write_mode 'sleep' for firmware without the write echo
+        params = self.cfg.parameters.get(str.lower(self.identity), {})
+        self.broker = FPGABroker("/dev/runcontrol", mapfile=FPGAMap(self.cfg.fpga),
+            write_mode=params.get('fpga_write_mode', 'ack'), ack_timeout=params.get('fpga_ack_timeout', 0.5))
+        self.broker.start()
+
+        self.dc = DeviceCollection(fpga_broker=self.broker.address)
         self.dc.init(self.cfg)
+        self.dc.laser.telemetry.start()
 
         #Logger.init()
 
-        self.hk = HouseKeeping(self.cfg.parameters)
+        self.hk = HouseKeeping(self.cfg.parameters, laser=self.dc.laser.telemetry)
         self.thr_hk = threading.Thread(target=self.hk.run)
         self.thr_hk.start()
 
@@ -237,6 +249,8 @@ class App(cmd2.Cmd):
         self.hk.close()
         self.thr_hk.join()
         self.rm.close()
+        self.dc.laser.telemetry.stop()
+        self.broker.stop()
         print("Bye!")
         sys.exit(0)
 
@@ -287,13 +301,11 @@ class App(cmd2.Cmd):
         time.sleep(1)
         self.dc.get_outlet("RAMAN_cover").on()
         cover_timeout_s = 120
-        t = 0
-        while self.dc.fpga.read_dio('cover_raman_open') == self.dc.fpga.read_dio('cover_raman_closed'):
-            if t >= cover_timeout_s:
-                print(f"cover open timeout ({cover_timeout_s}) error")
-                #return -1
-            time.sleep(1)
-            t += 1
+        values = self.dc.fpga.wait_for(['cover_raman_open', 'cover_raman_closed'],
+            lambda v: v['cover_raman_open'] != v['cover_raman_closed'],
+            cover_timeout_s, PollPolicy(slow=0.2))
+        if values is None:
+            print(f"cover open timeout ({cover_timeout_s}) error")
     
     def RamanCover_close(self, args):
         if self.mode == 'auto':
@@ -303,20 +315,17 @@ class App(cmd2.Cmd):
         time.sleep(1)
         self.dc.get_outlet("RAMAN_inst").off()
         cover_timeout_s = 120
-        t = 0
-        while self.dc.fpga.read_dio('cover_raman_open') == True:
-            if t >= cover_timeout_s:
-                print(f"cover close timeout ({cover_timeout_s}) error")
-            time.sleep(1)
-            t += 1
+        if not self.dc.fpga.wait_for_dio('cover_raman_open', False, cover_timeout_s, PollPolicy(slow=0.2)):
+            print(f"cover close timeout ({cover_timeout_s}) error")
     
     
     def RamanCover_status(self, args):
         if self.mode == 'auto':
             print("E: set mode to manual")
             return
-        print(f"Raman cover open: {self.dc.fpga.read_dio('cover_raman_open')}")
-        print(f"Raman cover closed: {self.dc.fpga.read_dio('cover_raman_closed')}")
+        snap = self.dc.fpga.snapshot(['cover_raman_open', 'cover_raman_closed'])
+        print(f"Raman cover open: {snap['cover_raman_open']}")
+        print(f"Raman cover closed: {snap['cover_raman_closed']}")
 
     RamanCover_open_parser.set_defaults(func=RamanCover_open)
     RamanCover_close_parser.set_defaults(func=RamanCover_close)
@@ -494,25 +503,40 @@ class App(cmd2.Cmd):
             print("E: frequency must be between 1 and 100 Hz")
             return
         period = int(100_000_000 / frequency)
-        self.dc.fpga.write_register('pps_delay', 0)
+        self.dc.fpga.write_registers({
+            'pps_delay': 0,
+            'pulse_width': 10_000,      # 100 us
+            'pulse_energy': 17_400,     # 140 us = 174 us, maximum
+            'pulse_period': period,
+            'shots_num': n_shots,
+        })
         self.dc.fpga.write_bit('laser_en', 1)
         self.dc.fpga.write_bit('timestamp_en', 0)
-        self.dc.fpga.write_register('pulse_width', 10_000)  # 100 us
-        self.dc.fpga.write_register('pulse_energy', 17_400) # 140 us = 174 us, maximum
-        self.dc.fpga.write_register('pulse_period', period) # 10 ms
-        self.dc.fpga.write_register('shots_num', n_shots)
         print(f"Firing {n_shots} shots at {frequency} Hz ...")
         self.dc.fpga.write_dio('laser_start', 1)
         #print("Manual fire done.")
 
     ######### system_init
+    system_init_parser = cmd2.Cmd2ArgumentParser()
+    system_init_parser.add_argument('--force-home', action='store_true', help='home the motors even if their position is known')
+
     @cmd2.with_category('System Control')
-    def do_system_init(self, _):
+    @cmd2.with_argparser(system_init_parser)
+    def do_system_init(self, args):
         """system initialization"""
         if self.mode == 'auto':
             print("E: set mode to manual")
             return
         print("system initialization ...")
+
+        print("Motors homing ...")
+        # all four on the Motor_calib VXM: one program, travelling during
+        # the radiometer and laser setup
+        self.dc.get_motor("UpEastWest").init()
+        program = Program()
+        for name in ["UpEastWest", "UpNorthSouth", "LwNorthSouth", "LwPolarizer"]:
+            program.home(self.dc.get_motor(name), force=args.force_home)
+        program.start()
         
         print("Radiometer setup ...")
         self.dc.get_radiometer('Rad1').setup()
@@ -526,26 +550,8 @@ class App(cmd2.Cmd):
         self.dc.fpga.write_dio('flipper_steer', False)
         self.dc.fpga.write_dio('flipper_raman', False)
 
-        print("Motors homing ...")
-        self.dc.get_motor("UpEastWest").init()  
-        self.dc.get_motor("UpEastWest").move_Neg0()  
-        self.dc.get_motor("UpEastWest").move_Neg0()  
-        self.dc.get_motor("UpEastWest").set_ABSzero()
-
-        self.dc.get_motor("UpNorthSouth").init()  
-        self.dc.get_motor("UpNorthSouth").move_Neg0()  
-        self.dc.get_motor("UpNorthSouth").move_Neg0()  
-        self.dc.get_motor("UpNorthSouth").set_ABSzero()
-
-        self.dc.get_motor("LwNorthSouth").init() 
-        self.dc.get_motor("LwNorthSouth").move_Neg0()
-        self.dc.get_motor("LwNorthSouth").move_Neg0()
-        self.dc.get_motor("LwNorthSouth").set_ABSzero()
-
-        self.dc.get_motor("LwPolarizer").init() 
-        self.dc.get_motor("LwPolarizer").move_Neg0()
-        self.dc.get_motor("LwPolarizer").move_Neg0()
-        self.dc.get_motor("LwPolarizer").set_ABSzero()
+        print("Motors homing, wait ...")
+        program.wait()
         print("system initialization done.")
 
 
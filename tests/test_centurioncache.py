@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.CenturionSimulator import CenturionSimulator
+from lib.Centurion import Centurion
+from lib.DeviceState import DeviceState
+
+path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/test_device_state.json"
+if os.path.exists(path):
+    os.remove(path)
+
+sim = CenturionSimulator(0.02)
+c = Centurion(sim.start())
+c.store = DeviceState(path)
+c.store.outlet_state('laser', True)
+
+def set_mode(text, **kwargs):
+    sim.commands.clear()
+    t0 = time.monotonic()
+    ret = c.set_mode(**kwargs)
+    print(f"{text}: returned {ret} in {time.monotonic() - t0:.2f} s, commands {sim.commands}")
+
+set_mode("1. first set_mode (bulk readback)", qson=1, dpw=140)
+set_mode("2. same mode again", qson=1, dpw=140)
+set_mode("3. only DPW changes", qson=1, dpw=120)
+c.store.outlet_state('laser', False)
+c.store.outlet_state('laser', True)
+sim.params['$DPW'] = '100'          # the laser came back with its defaults
+set_mode("4. after a laser power cycle", qson=1, dpw=120)
+sim.params['$QSON'] = '0'           # changed behind the driver's back
+sim.state = 0x00
+set_mode("5. status not ready on the first pass", qson=1, dpw=120)
+sim.state = 0x7E
+set_mode("6. status ready", qson=1, dpw=120)
+print(f"   laser parameters {sim.params}")
+sim.stop()
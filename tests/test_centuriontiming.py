@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.CenturionSimulator import CenturionSimulator
+from lib.Centurion import Centurion
+
+delay = float(sys.argv[1]) if len(sys.argv) > 1 else 0.02
+
+sim = CenturionSimulator(delay)
+c = Centurion(sim.start())
+print(f"simulated Centurion on {sim.port}, reply delay {delay * 1000:.0f} ms")
+
+print("1. set_mode")
+t0 = time.monotonic()
+ret = c.set_mode(qson=1, dpw=140)
+print(f"   returned {ret} in {time.monotonic() - t0:.2f} s, {len(sim.commands)} commands, DPW {sim.params['$DPW']}")
+
+print("2. warmup, temperature, fire")
+t0 = time.monotonic()
+c.warmup()
+print(f"   warmup {time.monotonic() - t0:.2f} s, temperature {c.temperature()}, fire_auth {c.fire_auth()}")
+
+print("3. stale reply in the buffer")
+sim.delay = 0
+os.write(sim.fds[0], b"$DPW 140\r\n")
+time.sleep(0.05)
+print(f"   {c.send_command('$STATUS ?')!r} (expected $STATUS)")
+
+print("4. no reply in time")
+sim.delay = 1.0
+t0 = time.monotonic()
+response = c.send_command("$STATUS ?", timeout=0.3)
+print(f"   {response!r} after {time.monotonic() - t0:.2f} s")
+
+sim.stop()
+
+print("5. latency per command")
+for keyword, s in sorted(c.latency_stats().items()):
+    print(f"   {keyword}: {s}")
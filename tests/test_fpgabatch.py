@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGADevice import FPGADevice
+
+port = sys.argv[1] if len(sys.argv) > 1 else "/dev/runcontrol"
+nloops = 5
+
+fp = FPGADevice(port)
+
+# RAMAN run profile (see RunRaman.prepare)
+profile = {
+    'pps_delay': 0,
+    'pulse_width': 10_000,
+    'pulse_energy': 17_400,
+    'pulse_period': 1_000_000,
+    'shots_num': 75000,
+    'mux_bnc_0': 0b0010,
+    'mux_bnc_1': 0b0010,
+    'mux_bnc_2': 0b0010,
+    'mux_bnc_3': 0b0010,
+    'mux_bnc_4': 0b0010,
+}
+
+print("1. program run profile with single register writes")
+t0 = time.perf_counter()
+for _ in range(nloops):
+    for name, value in profile.items():
+        fp.write_register(name, value)
+single_s = (time.perf_counter() - t0) / nloops
+print(f"   {single_s * 1000:.1f} ms per profile")
+
+print("2. program run profile with batched register writes")
+t0 = time.perf_counter()
+for _ in range(nloops):
+    fp.write_registers(profile)
+batch_s = (time.perf_counter() - t0) / nloops
+print(f"   {batch_s * 1000:.1f} ms per profile")
+
+print(f"speedup: {single_s / batch_s:.1f}x")
+
+print("3. read back run profile in a single batch")
+batch = fp.batch()
+for name in profile:
+    batch.read_register(name)
+for name, value in zip(profile, batch.execute()):
+    print(f"   {name}: {value} (expected {profile[name]})")
+
+print("4. write latency")
+print(f"   {fp.stats()}")
+
+fp.close()
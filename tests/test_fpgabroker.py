@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import threading
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGABroker import FPGABroker
+from lib.FPGADevice import FPGADevice
+
+port = sys.argv[1] if len(sys.argv) > 1 else "/dev/runcontrol"
+
+broker = FPGABroker(port)
+broker.start()
+
+fp = FPGADevice(port, broker=broker.address)
+
+print("1. read register unixtime (32bit)")
+print(hex(fp.read_register("unixtime")))
+
+print("2. read DIO rain/norain")
+print(fp.read_dio("rain"), fp.read_dio("norain"))
+
+print("3. test concurrent access from processes and threads")
+
+def func():
+    for _ in range(100):
+        fp.read_register("unixtime")
+        fp.read_dio("rain")
+
+workers = [multiprocessing.Process(target=func) for _ in range(2)]
+workers += [threading.Thread(target=func) for _ in range(2)]
+for w in workers:
+    w.start()
+for w in workers:
+    w.join()
+print("done")
+
+fp.close()
+broker.stop()
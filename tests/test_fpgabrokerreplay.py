@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import queue
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGASimulator import FPGASimulator
+from lib.FPGADevice import FPGADevice
+from lib.FPGABroker import FPGABroker
+
+class FaultySimulator(FPGASimulator):
+
+    # writes to stuck_addr are echoed but not stored (verify fails), reads
+    # of bad_addr are answered with garbage; every write is kept in writes
+
+    stuck_addr = None
+    bad_addr = None
+
+    def command(self, line):
+        parts = line.split()
+        if len(parts) == 2:
+            addr = int(parts[0], 16)
+            self.writes.append((addr, int(parts[1], 16)))
+            if addr == self.stuck_addr:
+                return f"{parts[1]}\r"
+        if len(parts) == 1 and int(parts[0], 16) == self.bad_addr:
+            return "?\r"
+        return super().command(line)
+
+sim = FaultySimulator()
+sim.writes = []
+control, _ = sim.start()
+# the bus side of the broker, without its process and socket
+broker = FPGABroker(control)
+broker.fpga = FPGADevice(control, verify=True)
+strobe = broker.fpga.iomap['laser_start'].addr
+word = broker.fpga.regmap['pulse_width'].words[0]
+other = broker.fpga.regmap['pulse_energy'].words[0]
+
+def execute(requests):
+    group = [(('transfer', ops), queue.Queue(1)) for ops in requests]
+    broker.execute(group)
+    return [reply.get() for _, reply in group]
+
+print("1. verify failure after a merged burst with a strobe")
+sim.stuck_addr = word
+replies = execute([[('w', strobe, 1)], [('w', word, 5)]])
+print(f"   writes on the wire {[(hex(a), v) for a, v in sim.writes]}")
+print(f"   replies {[r[0] for r in replies]}")
+
+print("2. read failure before anything is written")
+sim.stuck_addr = None
+sim.writes.clear()
+sim.bad_addr = other
+broker.fpga.drop_shadow()
+replies = execute([[('m', other, 0xFF, 1)], [('w', word, 6)]])
+print(f"   writes on the wire {[(hex(a), v) for a, v in sim.writes]}")
+print(f"   replies {[r[0] for r in replies]}")
+
+broker.fpga.close()
+sim.stop()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGASimulator import FPGASimulator
+from lib.FPGAData import FPGAData, decode_packets
+
+nshots = 75000      # RAMAN run
+
+sim = FPGASimulator()
+_, data_port = sim.start()
+data = FPGAData(data_port)
+
+print(f"1. build {nshots} packets")
+t0 = int(time.time())
+packets = [sim.packet(t0 + i * 0.01, i + 1).encode() for i in range(nshots)]
+chunk = b"".join(packets)
+print(f"   {len(chunk)} bytes")
+
+print("2. per-packet parser (FPGAData._parse_packet)")
+t = time.perf_counter()
+single = [data._parse_packet(packet) for packet in packets]
+single_s = time.perf_counter() - t
+print(f"   {single_s * 1000:.1f} ms, {single_s / nshots * 1e6:.2f} us per event")
+
+print("3. batch decoder (decode_packets)")
+t = time.perf_counter()
+events, rest = decode_packets(chunk)
+batch_s = time.perf_counter() - t
+print(f"   {batch_s * 1000:.1f} ms, {batch_s / nshots * 1e6:.2f} us per event")
+print(f"speedup: {single_s / batch_s:.1f}x")
+
+print("4. compare")
+expected = np.array(single)
+same = np.array_equal(np.stack([events[name] for name in ('seconds', 'counter', 'pps_delta', 'counter_pulses')], axis=1), expected)
+print(f"   same results: {same}, flagged {np.count_nonzero(events['flags'])}, leftover {len(rest)} bytes")
+
+print("5. malformed packets are flagged")
+bad = packets[0][:10] + packets[1] + b"BAAB1\rZZ\r3\r4\r5\r6\rFEEF" + packets[2][:12]
+events, rest = decode_packets(bad)
+print(f"   flags {events['flags'].tolist()}, valid {(events['flags'] == 0).tolist()}, leftover {rest}")
+
+print("6. counter above 16 bits")
+packet = sim.packet(t0 + 0.5, 1).encode()
+events, _ = decode_packets(packet)
+print(f"   0.5 s after the PPS: {data._parse_packet(packet)[1]} ns, batch {events['counter'][0]} ns")
+
+sim.stop()
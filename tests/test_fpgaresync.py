@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGASimulator import FPGASimulator
+from lib.FPGADevice import FPGADevice
+
+ack_timeout = 0.1
+
+class LateSimulator(FPGASimulator):
+
+    # the echo of the first write to late_addr comes after ack_timeout,
+    # delaying the replies queued behind it as well
+
+    late_addr = None
+
+    def command(self, line):
+        parts = line.split()
+        if len(parts) == 2 and int(parts[0], 16) == self.late_addr:
+            self.late_addr = None
+            time.sleep(ack_timeout * 1.5)
+        return super().command(line)
+
+sim = LateSimulator()
+control, _ = sim.start()
+fp = FPGADevice(control, ack_timeout=ack_timeout)
+addrs = [fp.regmap[name].words[0] for name in ['pulse_width', 'pulse_energy', 'pps_delay']]
+print(f"simulator on {control}, ack_timeout {ack_timeout} s")
+
+print("1. burst of writes, first echo late")
+sim.late_addr = addrs[0]
+results = fp.transfer([('w', addr, 0x100 + i) for i, addr in enumerate(addrs)])
+print(f"   acknowledged {results}, retries {fp.write_stats.retries}")
+print(f"   words {[hex(sim.read_word(addr)) for addr in addrs]}")
+
+print("2. reads after the retries")
+print(f"   {[hex(value) for value in fp.transfer([('r', addr) for addr in addrs])]}")
+
+fp.close()
+sim.stop()
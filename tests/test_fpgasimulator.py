@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGASimulator import FPGASimulator
+from lib.FPGADevice import FPGADevice
+from lib.FPGAData import FPGAData
+
+time_scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+nshots = 5
+
+sim = FPGASimulator(time_scale=time_scale)
+control, data_port = sim.start()
+print(f"simulator on {control} (runcontrol) and {data_port} (data), time scale {time_scale}x")
+
+fp = FPGADevice(control)
+data = FPGAData(data_port)
+
+print("1. read FPGA unixtime and DIO")
+snap = fp.snapshot()
+print(f"   host {int(snap.host_time)}, FPGA {snap.fpga_time}, norain {snap['norain']}, pps_ok {snap['pps_ok']}")
+
+print("2. program 1 Hz profile (FD run) and fire")
+fp.apply_profile({
+    'pps_delay': 0,
+    'pulse_width': 10_000,
+    'pulse_period': 100_000_000,
+    'shots_num': nshots,
+    'laser_en': 1,
+})
+t0 = time.monotonic()
+fp.write_dio('laser_start', 1)
+
+print("3. read events")
+for i in range(nshots):
+    seconds, counter, pps, counter_cycles = data.read_event()
+    print(f"   {i}: seconds {seconds}, counter {counter}, pps distance {pps}ns, counter cycle {counter_cycles}")
+
+count = fp.wait_for_register('shots_cnt', lambda n: n >= nshots, timeout=10 + nshots / time_scale)
+print(f"4. shots_cnt {count} (expected {nshots}) in {time.monotonic() - t0:.2f} s")
+
+print("5. 100 Hz burst (RAMAN rate)")
+fp.apply_profile({'pulse_period': 1_000_000, 'shots_num': 100 * nshots})
+fp.write_dio('laser_start', 1)
+events = []
+while len(events) < 100 * nshots:
+    received = data.read_events(timeout=2 + 1 / time_scale)
+    if len(received) == 0:
+        break
+    events.extend(received)
+counts = [event[3] for event in events]
+print(f"   {len(events)} events (expected {100 * nshots}), in order: {counts == list(range(1, len(counts) + 1))}")
+print(f"   framer {data.stats()}")
+
+print("6. background reader with a slow consumer")
+data.start()
+data.drain()
+fp.write_dio('laser_start', 1)
+events = []
+for event in data:
+    events.append(event)
+    time.sleep(0.05)        # e.g. a blocking radiometer read
+    if len(events) == 100 * nshots:
+        break
+data.stop()
+counts = [event.counter_pulses for event in events]
+print(f"   {len(events)} events (expected {100 * nshots}), in order: {counts == list(range(1, len(counts) + 1))}")
+print(f"   last event received at {events[-1].host_time:.3f}, framer {data.stats()}")
+
+print("7. profile with an unknown name")
+try:
+    fp.apply_profile({'pulse_period': 100_000_000, 'no_such_register': 1})
+except NameError as e:
+    print(f"   NameError {e}")
+
+fp.close()
+sim.stop()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGADevice import FPGADevice
+from lib.FPGASimulator import FPGASimulator
+
+# runs on the simulator unless a port is given
+if len(sys.argv) > 1:
+    port = sys.argv[1]
+else:
+    sim = FPGASimulator()
+    port, _ = sim.start()
+
+fp = FPGADevice(port)
+
+print("1. trace housekeeping-like traffic")
+fp.trace()
+for _ in range(50):
+    fp.snapshot(['rain', 'norain', 'pps_ok', 'jc_lock', 'vcxo_lock'])
+    fp.write_registers({'pulse_period': 1_000_000, 'shots_num': 100})
+    fp.read_register('shots_cnt')
+
+print("2. JSON snapshot")
+print(fp.tracer.to_json())
+
+print("3. Prometheus text")
+print(fp.tracer.to_prometheus())
+
+fp.trace(False)
+fp.close()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.CenturionSimulator import CenturionSimulator
+from lib.Centurion import Centurion
+from lib.LaserTelemetry import LaserTelemetry, FIELDS
+from lib.DeviceState import DeviceState
+
+path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/test_device_state.json"
+if os.path.exists(path):
+    os.remove(path)
+
+sim = CenturionSimulator(0.02)
+laser = Centurion(sim.start())
+laser.store = DeviceState(path)
+laser.telemetry = LaserTelemetry(laser, period=0.2, size=50)
+
+def run(laser, results):
+    # a run child: command traffic on the same port while the parent polls
+    for i in range(20):
+        results.append(laser.set_parameter("$DPW", 100 + i))
+    t0 = time.monotonic()
+    results.append(laser.fire_auth())
+    results.append(time.monotonic() - t0)
+
+print("1. poll in the parent, commands from a run child")
+laser.telemetry.start()
+time.sleep(0.5)
+results = multiprocessing.Manager().list()
+job = multiprocessing.Process(target=run, args=(laser, results))
+job.start()
+job.join()
+print(f"   20 settings confirmed: {list(results[:20]) == [0] * 20}, DPW {sim.params['$DPW']}")
+print(f"   fire_auth {results[20]} in {results[21] * 1000:.1f} ms (from the cache)")
+
+print("2. samples")
+sim.temps = (410, 320, 330)
+time.sleep(0.6)
+latest = laser.telemetry.latest()
+print(f"   latest: state {latest['state']:.0f}, temps {latest['head_temp']:.0f} {latest['dump_temp']:.0f} {latest['plate_temp']:.0f}, shots {latest['shots']:.0f}")
+history = laser.telemetry.history()
+print(f"   {len(history)} samples of {len(FIELDS)} fields, period {(history[-1, 0] - history[0, 0]) / (len(history) - 1):.2f} s")
+
+print("3. cached temperature and fire")
+n = len(sim.commands)
+print(f"   temperature {laser.temperature()}, fire_auth {laser.fire_auth()}")
+laser.fire()
+print(f"   commands sent: {[c for c in sim.commands[n:] if not c.endswith('?')]}")
+
+print("4. stale telemetry")
+laser.telemetry.stop()
+time.sleep(0.5)
+n = len(sim.commands)
+print(f"   fire_auth(max_age=0.1) {laser.fire_auth(max_age=0.1)}, commands {sim.commands[n:]}")
+
+print("5. port held by a command")
+laser.telemetry.start()
+time.sleep(0.3)
+with laser.lock:
+    n, count = len(sim.commands), laser.telemetry.count.value
+    time.sleep(0.5)
+    print(f"   new samples {laser.telemetry.count.value - count}, skipped {laser.telemetry.skipped}, commands {sim.commands[n:]}")
+
+print("6. laser outlet off")
+laser.store.outlet_state('laser', False)
+time.sleep(0.3)
+n, count = len(sim.commands), laser.telemetry.count.value
+time.sleep(0.5)
+print(f"   new samples {laser.telemetry.count.value - count}, commands {sim.commands[n:]}")
+laser.store.outlet_state('laser', True)
+time.sleep(0.5)
+print(f"   outlet on again: new samples {laser.telemetry.count.value - count}")
+
+print("7. samples taken before the warmup")
+laser.telemetry.stop()
+laser.warmup()
+n = len(sim.commands)
+print(f"   fire_auth {laser.fire_auth()}, commands {sim.commands[n:]}")
+laser.telemetry.start()
+time.sleep(0.5)
+laser.telemetry.stop()
+n = len(sim.commands)
+print(f"   after a new sample: fire_auth {laser.fire_auth()}, commands {sim.commands[n:]}")
+sim.stop()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import pty
+import tty
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.Radiometer import Radiometer3700
+from lib.DeviceState import DeviceState
+
+path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/test_device_state.json"
+if os.path.exists(path):
+    os.remove(path)
+
+commands = []
+state = {}
+
+def fake_3700(fd):
+    # answers every command, keeps a log of them; AD reports the settings
+    buf = b""
+    while True:
+        try:
+            data = os.read(fd, 1024)
+        except OSError:
+            return
+        buf += data
+        while b"\r" in buf:
+            line, buf = buf.split(b"\r", 1)
+            commands.append(line.decode())
+            label, _, value = line.decode().partition(" ")
+            if label == "AD":
+                os.write(fd, " ".join(f"{k} {v}" for k, v in state.items()).encode() + b"\r")
+                continue
+            state[label] = value
+            os.write(fd, b"*ok\r")
+
+master, slave = pty.openpty()
+tty.setraw(slave)
+threading.Thread(target=fake_3700, args=(master,), daemon=True).start()
+
+radiometer = Radiometer3700(os.ttyname(slave))
+radiometer.store = DeviceState(path)
+radiometer.store.outlet_state('radiometer', True)
+
+def setup(text):
+    commands.clear()
+    radiometer.setup()
+    print(f"{text}: {commands}")
+
+setup("1. first setup")
+setup("2. again, same power cycle")
+radiometer.set_range(4)
+setup("3. after set_range(4)")
+radiometer.store.outlet_state('radiometer', False)
+radiometer.store.outlet_state('radiometer', True)
+setup(f"4. after a power cycle (epoch {radiometer.store.epoch('radiometer')})")
+setup("5. again")
+state["RA"] = "5"                           # changed on the front panel
+setup("6. after a change the cache does not know of")
+setup("7. again")
+os.close(master)
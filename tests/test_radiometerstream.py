@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import pty
+import tty
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.Radiometer import Radiometer3700, RadiometerOphir
+
+nshots = 500        # 100 Hz
+
+def feeder(fd, lines, period):
+    # radiometer in continuous mode: one line per shot
+    for line in lines:
+        os.write(fd, line.encode())
+        time.sleep(period)
+
+def open_pty():
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    return master, os.ttyname(slave)
+
+for cls, fmt in ((Radiometer3700, "{:.4f}\r"), (RadiometerOphir, "*{:.4E}\r")):
+    print(f"{cls.model}:")
+    master, port = open_pty()
+    radiometer = cls(port)
+    radiometer.ready = True
+    radiometer.start()
+    radiometer.drain()
+
+    # every 50th line is garbled
+    lines = [fmt.format(1 + i * 0.001) if i % 50 != 49 else "#!?\r" for i in range(nshots)]
+    threading.Thread(target=feeder, args=(master, lines, 0.01), daemon=True).start()
+
+    print("1. consumer slower than the radiometer, then catching up with drain()")
+    samples = [radiometer.get_sample(1) for i in range(10)]
+    time.sleep(1)
+    samples += radiometer.drain()
+    print(f"   {len(samples)} samples, first {samples[0]}")
+
+    print("2. read_power for the rest of the stream")
+    values = [sample.value for sample in samples]
+    while len(values) < nshots:
+        value = radiometer.read_power(0.5)
+        values.append(None if value == -1 else value)
+    radiometer.stop()
+    expected = [1 + i * 0.001 if i % 50 != 49 else None for i in range(nshots)]
+    ok = all((v is None and e is None) or (v is not None and e is not None and abs(v - e) < 1e-6) for v, e in zip(values, expected))
+    print(f"   {len(values)} values (expected {nshots}), match: {ok and len(values) == nshots}, overflows {radiometer.overflows}")
+
+    print("3. timeout without data")
+    t = time.monotonic()
+    radiometer.start()
+    value = radiometer.read_power(0.3)
+    radiometer.stop()
+    print(f"   read_power {value} after {time.monotonic() - t:.2f} s")
+    os.close(master)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import signal
+import multiprocessing
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.RunData import RunDataWriter, RunData
+
+path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/test_rundata.clfrun"
+nshots = 75000      # RAMAN run
+
+header = {'run_type': 'Raman', 'identity': 'clf', 'profile': {'pulse_period': 1_000_000, 'shots_num': nshots}}
+writer = RunDataWriter(path, nshots, header)
+
+print(f"1. write {nshots} shots")
+t0 = time.perf_counter()
+for i in range(nshots):
+    writer.append(host_time=time.time(), power=1.5, seconds=1700000000 + i // 100,
+        counter=(i % 100) * 1_000_000, pps_delta=10, counter_pulses=i + 1)
+    if i == nshots // 2:
+        # read back while the run is in progress
+        reader = RunData(path)
+        print(f"   at shot {i}: reader sees {len(reader)} published shots")
+write_s = time.perf_counter() - t0
+writer.close()
+print(f"   {write_s / nshots * 1e6:.2f} us per shot")
+
+print("2. read back")
+reader = RunData(path)
+print(f"   header {reader.header['run_type']} {reader.header['identity']} {reader.header['profile']}")
+print(f"   {len(reader)} shots, counter_pulses ok: {np.array_equal(reader['counter_pulses'], np.arange(1, nshots + 1))}")
+
+print("3. FD run (50 shots), read while in progress")
+writer = RunDataWriter(path, 50, header, interval=0.1)
+for i in range(10):
+    writer.append(host_time=time.time(), counter_pulses=i + 1)
+    time.sleep(0.05)
+print(f"   after 10 shots: reader sees {len(RunData(path))}")
+writer.close()
+
+def run(path):
+    # a run process, ended by SIGTERM as RunManager.stop does
+    def terminate(signum, frame):
+        raise SystemExit
+    signal.signal(signal.SIGTERM, terminate)
+    writer = RunDataWriter(path, 50, header)
+    try:
+        for i in range(50):
+            writer.append(host_time=time.time(), counter_pulses=i + 1)
+            time.sleep(0.02)
+    finally:
+        writer.close()
+
+print("4. run stopped after about 20 shots")
+job = multiprocessing.Process(target=run, args=(path,))
+job.start()
+time.sleep(0.45)
+job.terminate()
+job.join()
+reader = RunData(path)
+print(f"   {len(reader)} shots kept, counter_pulses ok: {np.array_equal(reader['counter_pulses'], np.arange(1, len(reader) + 1))}")
+
+os.unlink(path)
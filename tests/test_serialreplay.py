@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import serial
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGASimulator import FPGASimulator
+from lib.FPGADevice import FPGADevice
+from lib.FPGAData import FPGAData
+from lib.Radiometer import Radiometer3700
+from lib.SerialRecorder import SerialRecorder, SerialReplayer, read_records, channels, RX
+
+path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/test_serialreplay.clfser"
+nshots = 500        # 100 Hz
+if os.path.exists(path):
+    os.remove(path)
+
+sim = FPGASimulator()
+control, data_port = sim.start()
+fp = FPGADevice(control)
+data = FPGAData(data_port)
+recorder = SerialRecorder(path)
+recorder.attach(data, 'data')
+
+print(f"1. record {nshots} shots at 100 Hz from the simulator")
+fp.apply_profile({'pps_delay': 0, 'pulse_width': 10_000, 'pulse_period': 1_000_000, 'shots_num': nshots, 'laser_en': 1})
+data.start()
+data.drain()
+fp.write_dio('laser_start', 1)
+recorded = []
+for event in data:
+    recorded.append(event[:4])
+    if len(recorded) == nshots:
+        break
+data.stop()
+
+# radiometer readings written by hand on the same recording
+ch = recorder.channel('radiometer_3700', port='/dev/null', baudrate=9600)
+for i in range(nshots):
+    recorder.record(ch, RX, f"{1 + i * 0.001:.4f}\r".encode())
+recorder.close()
+sim.stop()
+fp.close()
+print(f"   {len(recorded)} events, {recorder.bytes} bytes in {os.path.getsize(path)} bytes file")
+print(f"   channels {list(channels(path))}, {sum(1 for r in read_records(path))} records")
+
+print("2. replay the event stream at max speed")
+replayer = SerialReplayer(path, 'data', speed=None)
+data.serial = serial.Serial(replayer.start(), 115200, timeout=0.5)
+data.buffer.clear()
+replayer.play()
+t0 = time.perf_counter()
+replayed = []
+while len(replayed) < nshots:
+    events = data.read_events(timeout=1)
+    if len(events) == 0:
+        break
+    replayed.extend(event[:4] for event in events)
+elapsed = time.perf_counter() - t0
+replayer.stop()
+print(f"   {len(replayed)} events in {elapsed:.3f} s ({len(replayed) / elapsed:.0f} events/s), identical: {replayed == recorded}")
+
+print("3. replay the event stream at 5x")
+replayer = SerialReplayer(path, 'data', speed=5)
+data.serial = serial.Serial(replayer.start(), 115200, timeout=0.5)
+data.buffer.clear()
+replayer.play()
+t0 = time.perf_counter()
+replayed = []
+while len(replayed) < nshots:
+    events = data.read_events(timeout=1)
+    if len(events) == 0:
+        break
+    replayed.extend(event[:4] for event in events)
+elapsed = time.perf_counter() - t0
+replayer.stop()
+print(f"   {len(replayed)} events in {elapsed:.2f} s (expected ~{nshots / 100 / 5:.2f} s), identical: {replayed == recorded}")
+
+print("4. replay the radiometer readings into Radiometer3700.read_power")
+replayer = SerialReplayer(path, 'radiometer_3700', speed=None)
+radiometer = Radiometer3700(replayer.start())
+radiometer.open()
+radiometer.ready = True
+replayer.play()
+t0 = time.perf_counter()
+values = [radiometer.read_power() for i in range(nshots)]
+elapsed = time.perf_counter() - t0
+replayer.stop()
+expected = [round(1 + i * 0.001, 4) for i in range(nshots)]
+print(f"   {len(values)} readings in {elapsed:.3f} s, identical: {values == expected}")
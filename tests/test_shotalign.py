@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.ShotAlign import align_shots, fpga_time, report
+
+rng = np.random.default_rng(1)
+nshots = 75000
+period = 0.01       # 100 Hz
+lag = 0.004         # radiometer reading after the shot
+
+print(f"1. synthetic run: {nshots} shots at {1 / period:.0f} Hz")
+shot = 1_700_000_000 + np.arange(nshots) * period
+seconds = shot.astype(np.int64)
+counter = np.round((shot - seconds) * 1e9).astype(np.int64)
+offset = 0.250
+event_host = shot + offset + rng.uniform(0, 0.003, nshots)         # serial latency jitter
+reading_host = shot + offset + lag + rng.normal(0, 0.0005, nshots)
+
+# radiometer misses 30 readings and duplicates 5, FPGA data loses 20 events
+truth = np.arange(nshots)
+keep_r = np.sort(np.concatenate((np.delete(truth, rng.choice(nshots, 30, replace=False)), rng.choice(nshots, 5))))
+keep_e = np.delete(truth, rng.choice(nshots, 20, replace=False))
+print(f"   {len(keep_e)} events, {len(keep_r)} readings")
+
+print("2. align")
+t0 = time.perf_counter()
+a = align_shots(event_host[keep_e], fpga_time(seconds[keep_e], counter[keep_e]), reading_host[keep_r])
+print(f"   {(time.perf_counter() - t0) * 1000:.1f} ms: {report(a)}")
+
+print("3. check")
+wrong = np.count_nonzero(keep_e[a.pairs[:, 0]] != keep_r[a.pairs[:, 1]])
+print(f"   {wrong} wrong pairs, estimated offset {a.offset:.4f} s (true {offset:.4f} + latency), lag {a.lag * 1000:.2f} ms")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import random
+import multiprocessing
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.ShotStats import ShotStats
+
+nshots = 200        # per polarization angle, 100 Hz
+
+def run(stats, values):
+    # the run child: shots of each section in turn
+    for section, energies in enumerate(values):
+        for value in energies:
+            stats.add(value, section)
+            time.sleep(0.01)
+
+random.seed(1)
+values = [[random.gauss(1.5 + s, 0.05) if random.random() > 0.02 else float('nan') for i in range(nshots)] for s in range(4)]
+
+stats = ShotStats(['energy', 'pol_0', 'pol_90', 'pol_180'])
+stats.reset(4 * nshots)
+job = multiprocessing.Process(target=run, args=(stats, values))
+job.start()
+
+print("1. read from the parent while the run goes on")
+while job.is_alive():
+    time.sleep(1)
+    print(f"   {stats.summary()}")
+job.join()
+
+print("2. compare with the full data")
+for i, name in enumerate(stats.streams):
+    s = stats.stream(i)
+    v = np.array(values[i])
+    good = v[np.isfinite(v)]
+    ok = s['count'] == len(good) and s['dropouts'] == len(v) - len(good) and \
+        abs(s['mean'] - good.mean()) < 1e-9 and abs(s['std'] - good.std(ddof=1)) < 1e-9 and \
+        s['min'] == good.min() and s['max'] == good.max()
+    print(f"   {name}: {s['count']} shots, {s['dropouts']} dropouts, mean {s['mean']:.5f} std {s['std']:.5f}, rate {s['rate']:.1f} Hz, match: {ok}")
+
+print("3. cost per shot")
+t0 = time.perf_counter()
+for i in range(100000):
+    stats.add(1.5, 0)
+print(f"   {(time.perf_counter() - t0) / 100000 * 1e6:.2f} us")
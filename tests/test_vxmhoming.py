@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.VXMSimulator import VXMSimulator
+from lib.VXM import VXM, Program
+from lib.DeviceState import DeviceState
+
+path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/test_device_state.json"
+if os.path.exists(path):
+    os.remove(path)
+
+names = ["UpEastWest", "UpNorthSouth", "LwNorthSouth", "LwPolarizer"]
+ecal = {"UpNorthSouth": 33250, "UpEastWest": 4470}
+
+sim = VXMSimulator(scale=0.01)
+vxm = VXM(sim.start(), timeout=0.2)
+motors = {name: vxm.add_motor(i + 1, name, ecal.get(name, 0), 0) for i, name in enumerate(names)}
+store = DeviceState(path)
+store.outlet_state('VXM', True)
+for motor in motors.values():
+    motor.store = store
+
+def prepare(text, **kwargs):
+    # homing and move to the energy calibration position, as RunCalib.prepare
+    sim.moves.clear()
+    t0 = time.monotonic()
+    program = Program()
+    for name in names:
+        program.home(motors[name], **kwargs)
+    for name in ["UpNorthSouth", "UpEastWest"]:
+        program.move_ABS(motors[name], motors[name].ecal_position)
+    program.run()
+    homings = sum(1 for command, _, _ in sim.moves if command.endswith("M-0")) // 2
+    tracked = [(motors[name].load_position() or {}).get('position') for name in names]
+    print(f"{text}: {time.monotonic() - t0:.2f} s, {homings} motors homed, tracked positions {tracked}")
+
+motors["UpEastWest"].init()
+prepare("1. first homing")
+prepare("2. same power cycle")
+sim.raw[3] += 500                           # controller disagrees
+prepare("3. LwNorthSouth elsewhere")
+prepare("4. forced", force=True)
+prepare("5. homing older than max_age", max_age=0)
+store.outlet_state('VXM', False)
+store.outlet_state('VXM', True)
+prepare("6. after a VXM power cycle")
+motors["LwPolarizer"].move_ABS(7200)
+print(f"   LwPolarizer after move_ABS(7200): tracked {motors['LwPolarizer'].load_position()['position']}, "
+    f"controller {motors['LwPolarizer'].query_position()}")
+prepare("7. same power cycle")
+sim.stop()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.VXMSimulator import VXMSimulator
+from lib.VXM import VXM, Program
+from lib.DeviceState import DeviceState
+
+path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/test_device_state.json"
+if os.path.exists(path):
+    os.remove(path)
+
+scale = 0.05
+sim = VXMSimulator(speed=2000, accel=4000, scale=scale)
+vxm = VXM(sim.start(), timeout=0.2)
+store = DeviceState(path)
+store.outlet_state('VXM', True)
+names = ["UpEastWest", "UpNorthSouth", "LwNorthSouth", "LwPolarizer"]
+motors = {}
+for i, name in enumerate(names):
+    # speed, accel and deadline factor as they would come from motors.yml
+    motors[name] = vxm.add_motor(i + 1, name, 0, 0, speed=2000, accel=4000, deadline_factor=2.0)
+    motors[name].store = store
+print(f"simulated VXM on {sim.port}, motion time scale {scale}")
+
+print("1. model: predicted move times")
+motor = motors["LwPolarizer"]
+for steps in [0, 100, 1000, 4000, 14400]:
+    print(f"   {steps:5d} steps: {motor.travel_time(steps):.3f} s")
+
+print("2. homing and moves, predicted against measured")
+motor.init()
+program = Program()
+for name in names:
+    program.home(motors[name])
+program.run()
+print(f"   homing: predicted {program.bound:.2f} s (positions unknown), "
+    f"took {program.elapsed / scale:.2f} s scaled back")
+for pos in [90 * 80, 180 * 80, 100, 0]:
+    motor.move_ABS(pos)
+    command, predicted, elapsed = motor.last_motion
+    print(f"   {command}: predicted {predicted:.2f} s, took {elapsed / scale:.2f} s scaled back")
+
+print("3. work overlapped with the motion")
+def work():
+    time.sleep(0.3)             # radiometer and laser setup
+
+def moves():
+    program = Program()
+    for name, pos in zip(names, [4470, 33250, 18900, 7200]):
+        program.move_ABS(motors[name], pos)
+    for name in names:
+        program.move_ABS(motors[name], 0)
+    return program
+
+t0 = time.monotonic()
+moves().run()
+work()
+print(f"   one after the other: {time.monotonic() - t0:.2f} s")
+t0 = time.monotonic()
+program = moves()
+program.start()
+work()
+program.wait()
+print(f"   overlapped: {time.monotonic() - t0:.2f} s, predicted motion {program.bound * scale:.2f} s")
+
+print("4. work outlasting the completion deadline")
+program = Program().move_ABS(motor, 100)
+program.start()
+time.sleep(program.bound * motor.deadline_factor + 2.5)
+print(f"   wait returned {program.wait()}, finished early {motor.finished_early}")
+
+print("5. completion deadline")
+program = Program().move_ABS(motor, 14400)
+program.start()
+print(f"   predicted {program.bound:.2f} s, deadline after {motor.deadline - motor.t0:.2f} s "
+    f"(factor {motor.deadline_factor})")
+program.wait()
+sim.stop()
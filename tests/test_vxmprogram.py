@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.VXMSimulator import VXMSimulator
+from lib.VXM import VXM, Program
+
+scale = float(sys.argv[1]) if len(sys.argv) > 1 else 0.01
+
+names = ["UpEastWest", "UpNorthSouth", "LwNorthSouth", "LwPolarizer"]
+ecal = {"UpNorthSouth": 33250, "UpEastWest": 4470}
+
+def setup():
+    sim = VXMSimulator(scale=scale)
+    vxm = VXM(sim.start(), timeout=0.2)
+    motors = {name: vxm.add_motor(i + 1, name, ecal.get(name, 0), 0) for i, name in enumerate(names)}
+    return sim, motors
+
+def report(text, sim, t0):
+    motion = sum(d for _, _, d in sim.moves) * scale
+    positions = [sim.position(i + 1) for i in range(len(names))]
+    print(f"{text}: {time.monotonic() - t0:.2f} s ({motion:.2f} s of motion), "
+        f"{sim.runs} runs, {len(sim.commands)} commands, positions {positions}")
+    sim.stop()
+
+# motor by motor, as RunCalib.prepare did
+sim, motors = setup()
+t0 = time.monotonic()
+for name in names:
+    motors[name].init()
+    motors[name].move_Neg0()
+    motors[name].move_Neg0()
+    motors[name].set_ABSzero()
+for name in ["UpNorthSouth", "UpEastWest"]:
+    motors[name].move_ABS(motors[name].ecal_position)
+report("1. motor by motor", sim, t0)
+
+# one program
+sim, motors = setup()
+t0 = time.monotonic()
+motors["UpEastWest"].init()
+program = Program()
+for name in names:
+    program.home(motors[name])
+for name in ["UpNorthSouth", "UpEastWest"]:
+    program.move_ABS(motors[name], motors[name].ecal_position)
+program.run()
+report("2. one program", sim, t0)
+print(f"   measured {program.elapsed:.2f} s, bound {program.bound:.1f} s")
+
+print("3. motors on another VXM")
+sim = VXMSimulator()
+other = VXM(sim.start(), timeout=0.2).add_motor(1, "Cover", 0, 0)
+try:
+    program.home(other)
+except ValueError as e:
+    print(f"   refused: {e}")
+sim.stop()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.VXMSimulator import VXMSimulator
+from lib.VXM import VXM
+
+scale = float(sys.argv[1]) if len(sys.argv) > 1 else 0.01
+
+sim = VXMSimulator(scale=scale)
+vxm = VXM(sim.start(), timeout=0.2)
+names = ["LwNorthSouth", "LwPolarizer", "UpNorthSouth", "UpEastWest"]
+motors = [vxm.add_motor(i + 1, name, 0, 0) for i, name in enumerate(names)]
+print(f"simulated VXM on {sim.port}, motion time scale {scale}")
+
+print("1. homing, as in RunCalib.prepare")
+t0 = time.monotonic()
+for motor in motors:
+    motor.init()
+    motor.move_Neg0()
+    motor.move_Neg0()
+    motor.set_ABSzero()
+motion = sum(d for _, _, d in sim.moves) * scale
+print(f"   {time.monotonic() - t0:.2f} s for {len(sim.moves)} moves taking {motion:.2f} s")
+print(f"   positions {[sim.position(i + 1) for i in range(len(motors))]}")
+
+print("2. absolute moves")
+for motor, pos in zip(motors, [18900, 7200, 33250, 4470]):
+    motor.move_ABS(pos)
+    command, bound, elapsed = motor.last_motion
+    print(f"   {command}: {elapsed:.3f} s (predicted {bound:.2f} s), position {sim.position(motor.id)}")
+
+print("3. no completion in time")
+sim.scale = 100
+t0 = time.monotonic()
+ret = motors[0].send_command("I1M100")
+print(f"   returned {ret} after {time.monotonic() - t0:.2f} s, killed {sim.killed.is_set()}, "
+    f"position {sim.position(1)}, tracked {motors[0].load_position()}")
+sim.scale = scale
+ret = motors[0].send_command("I1M-100")
+command, bound, elapsed = motors[0].last_motion
+print(f"   next move returned {ret}: {command} {elapsed:.3f} s (predicted {bound:.2f} s), position {sim.position(1)}")
+sim.stop()